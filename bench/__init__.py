@@ -0,0 +1,4 @@
+"""
+Headless benchmarks for level loading/saving and timing imports. Run with `python -m bench --help`.
+Nothing here opens a window or an audio device.
+"""
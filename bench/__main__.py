@@ -0,0 +1,201 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+import src.level as level
+from bench import synth
+from src.diskcache import PCMDiskCache
+from src.level import RawDataLevel, SSPMLevel, VulnusLevel
+from src.timings import import_timings
+
+SIZES = (1_000, 10_000, 100_000, 1_000_000)
+METADATA = (120, 0, (4, 4), 0.5)  # bpm, offset, time signature, swing
+# extension, level class, variants. Vulnus levels can't exist without audio, so they always have media.
+FORMATS = {
+    "sspm": (".sspm", SSPMLevel, ("bare", "markers", "media", "markers+media")),
+    "txt": (".txt", RawDataLevel, ("bare",)),
+    "vulnus": (".json", VulnusLevel, ("media",)),
+}
+IMPORTS = {"adofai": (0, ".adofai", synth.write_adofai), "osu": (1, ".osu", synth.write_osu),
+           "chart": (2, ".chart", synth.write_chart)}
+
+
+def measure(fn, repeat, after=None):
+    """
+    Run fn `repeat` times for timing, then once more under tracemalloc for the peak memory.
+    after(result) runs outside the timed part, for waiting on anything fn left running in the background.
+    """
+    runs = []
+    result = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = fn()
+        runs.append(time.perf_counter() - start)
+        if after is not None:
+            after(result)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    if after is not None:
+        after(result)
+    return result, {"runs_s": runs, "best_s": min(runs), "median_s": statistics.median(runs), "peak_bytes": peak}
+
+
+def settle(loaded):
+    """Wait for the media a load() kicked off to finish decoding, so it doesn't eat into the next run."""
+    for attr in ("audio", "cover"):
+        source = loaded[0].media_source(attr)
+        if source is not None:
+            try:
+                source.get()
+            except Exception:  # No ffmpeg, the decode itself isn't what's being measured
+                pass
+
+
+def same_notes(a, b):
+    return (len(a) == len(b) and np.array_equal(a.times, b.times)
+            and np.allclose(a.x, b.x, atol=1e-5) and np.allclose(a.y, b.y, atol=1e-5))
+
+
+def bench_level(name, count, variant, repeat, media):
+    extension, cls, _ = FORMATS[name]
+    audio, ogg, cover = media
+    with_media = "media" in variant
+    if with_media and name == "sspm" and ogg is None:
+        return []
+    level_ = synth.synthetic_level(cls, count, markers="markers" in variant,
+                                   audio=(ogg if name == "sspm" else audio) if with_media else None,
+                                   cover=cover if with_media else None)
+    path, copy = f"bench{extension}", f"copy{extension}"
+    results = []
+    base = {"suite": "level", "format": name, "variant": variant, "notes": count}
+
+    _, stats = measure(lambda: level_.save(path, *METADATA), repeat)
+    results.append(base | {"op": "save", "file_bytes": os.path.getsize(path)} | stats)
+
+    loaded, stats = measure(lambda: cls.load(path), repeat, settle)
+    results.append(base | {"op": "load", "ok": same_notes(level_.notes, loaded[0].notes)} | stats)
+
+    def round_trip():
+        first, metadata = cls.load(path)
+        first.save(copy, *(metadata or METADATA))
+        return cls.load(copy)
+
+    loaded, stats = measure(round_trip, repeat, settle)
+    ok = same_notes(level_.notes, loaded[0].notes)
+    if "markers" in variant:
+        ok = ok and loaded[0].markers == level_.markers
+    results.append(base | {"op": "round_trip", "ok": ok} | stats)
+    return results
+
+
+def bench_import(name, count, repeat):
+    game, extension, write = IMPORTS[name]
+    path = f"timings{extension}"
+    write(path, count)
+    try:
+        timings, stats = measure(lambda: import_timings(path, game), repeat)
+    except ImportError as e:  # chparse is optional until someone imports a chart
+        print(f"/!\\ Skipping {name} imports: {e}", file=sys.stderr)
+        return []
+    return [{"suite": "import", "format": name, "variant": "bare", "notes": count, "op": "import",
+             "timings": len(timings), "file_bytes": os.path.getsize(path)} | stats]
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=Path(__file__).parent).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(),
+            "machine": platform.machine(), "commit": commit, "time": time.strftime("%Y-%m-%dT%H:%M:%S%z")}
+
+
+def key(result):
+    return result["suite"], result["format"], result["variant"], result["notes"], result["op"]
+
+
+def compare(baseline, results):
+    """A table of how each result changed against the same one in `baseline`."""
+    old = {key(result): result for result in baseline["results"]}
+    lines = [f"{'case':<48}{'time':>10}{'memory':>10}"]
+    for result in results:
+        before = old.get(key(result))
+        if before is None:
+            continue
+        case = " ".join(str(part) for part in key(result)[1:])
+        lines.append(f"{case:<48}{result['best_s'] / max(before['best_s'], 1e-9):>9.2f}x"
+                     f"{result['peak_bytes'] / max(before['peak_bytes'], 1):>9.2f}x")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench",
+                                     description="Headless benchmarks for level load/save and timing imports.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="note counts to generate")
+    parser.add_argument("--formats", nargs="+", default=[*FORMATS, *IMPORTS], choices=[*FORMATS, *IMPORTS])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-media", action="store_true", help="skip the variants with audio and a cover")
+    parser.add_argument("--output", help="write the results here as JSON instead of to stdout")
+    parser.add_argument("--compare", help="a previous results file to print ratios against")
+    args = parser.parse_args(argv)
+
+    output_path = Path(args.output).resolve() if args.output else None
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+    results = []
+    with tempfile.TemporaryDirectory(prefix="sspy-bench-") as temp:
+        # Decoded audio goes into a throwaway cache instead of the real one
+        level.PCM_CACHE = PCMDiskCache(Path(temp) / "pcm")
+        media = (None, None, None) if args.no_media else (synth.wav_bytes(), synth.ogg_bytes(), synth.png_bytes())
+        cwd = os.getcwd()
+        try:
+            for count in args.sizes:
+                for name in args.formats:
+                    variants = FORMATS[name][2] if name in FORMATS else ("bare",)
+                    for variant in variants:
+                        if "media" in variant and args.no_media:
+                            continue
+                        # Vulnus keeps its metadata next to the level, so every case gets its own directory
+                        case = Path(temp) / f"{name}-{variant}-{count}"
+                        case.mkdir()
+                        os.chdir(case)
+                        print(f"{name} {variant} {count} notes...", file=sys.stderr)
+                        if name in FORMATS:
+                            results += bench_level(name, count, variant, args.repeat, media)
+                        else:
+                            results += bench_import(name, count, args.repeat)
+        finally:
+            os.chdir(cwd)
+    output = {"environment": environment(), "repeat": args.repeat, "results": results}
+    if output_path is not None:
+        output_path.write_text(json.dumps(output, indent=1))
+    else:
+        json.dump(output, sys.stdout, indent=1)
+        print()
+    if baseline is not None:
+        print(compare(baseline, results), file=sys.stderr)
+    failed = [key(result) for result in results if result.get("ok") is False]
+    for case in failed:
+        print(f"/!\\ Notes didn't survive: {' '.join(map(str, case[1:]))}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""Synthetic maps and timing files for the benchmarks. Everything's seeded, so runs are comparable."""
+import json
+import sys
+import wave
+from io import BytesIO
+
+import numpy as np
+
+from src.level import LazyMedia, decode_audio, decode_image
+from src.notes import NoteStore
+
+BENCH_MARKER = "bench_marker"
+MARKER_TYPES = {"ssp_note": [0x7], BENCH_MARKER: [0x3, 0x9]}  # A uint32 and a string, like most custom markers
+
+
+def synthetic_notes(count, seed=0):
+    """`count` notes about 100ms apart on average, half on the grid and half anywhere (quantum)."""
+    rng = np.random.default_rng(seed)
+    times = np.sort(rng.integers(0, max(count, 1) * 100, count))
+    on_grid = rng.random(count) < 0.5
+    xs = np.where(on_grid, rng.integers(0, 3, count), rng.random(count) * 2).astype(np.float32)
+    ys = np.where(on_grid, rng.integers(0, 3, count), rng.random(count) * 2).astype(np.float32)
+    return NoteStore(times, xs, ys)
+
+
+def synthetic_markers(notes, every=10):
+    """A custom marker on every `every`th note time."""
+    return [{"time": int(time), "m_type": 1, "fields": [i, f"marker {i}"]}
+            for i, time in enumerate(notes.times[::every].tolist())]
+
+
+def wav_bytes(seconds=10, frame_rate=44100):
+    """A quiet sine wave as a .wav, made without ffmpeg."""
+    t = np.arange(int(seconds * frame_rate)) / frame_rate
+    samples = (np.sin(2 * np.pi * 440 * t) * 3000).astype("<i2")
+    with BytesIO() as buf:
+        with wave.open(buf, "wb") as f:
+            f.setnchannels(2)
+            f.setsampwidth(2)
+            f.setframerate(frame_rate)
+            f.writeframes(np.repeat(samples, 2).tobytes())
+        return buf.getvalue()
+
+
+def ogg_bytes(seconds=10):
+    """The same sine wave as an .ogg, or None if ffmpeg isn't around to encode it."""
+    from pydub import AudioSegment
+    try:
+        with BytesIO() as buf:
+            AudioSegment.from_wav(BytesIO(wav_bytes(seconds))).export(buf, "ogg")
+            return buf.getvalue()
+    except Exception as e:
+        print(f"/!\\ Couldn't encode synthetic audio, skipping .sspm media runs: {e}", file=sys.stderr)
+        return None
+
+
+def png_bytes(size=192):
+    from PIL import Image
+    with BytesIO() as buf:
+        Image.new("RGB", (size, size), (40, 40, 40)).save(buf, "png")
+        return buf.getvalue()
+
+
+def synthetic_level(cls, count, markers=False, audio=None, cover=None, seed=0):
+    """A level of type `cls` with `count` notes. audio and cover are encoded bytes, wrapped like load() would."""
+    notes = synthetic_notes(count, seed)
+    kwargs = {}
+    if markers:
+        kwargs = {"marker_types": MARKER_TYPES, "markers": synthetic_markers(notes)}
+    return cls("Benchmark - Synthetic", ["bench"], notes,
+               LazyMedia(cover, decode_image) if cover is not None else None,
+               LazyMedia(audio, decode_audio) if audio is not None else None,
+               1, **kwargs)
+
+
+def write_osu(path, count, seed=0):
+    times = synthetic_notes(count, seed).times.tolist()
+    lines = ["osu file format v14", "", "[General]", "AudioFilename: audio.mp3", "", "[HitObjects]"]
+    lines += [f"256,192,{time},1,0,0:0:0:0:" for time in times]
+    with open(path, "w") as f:
+        f.write("\n".join(lines))
+
+
+def write_adofai(path, count, seed=0):
+    """`count` tiles of random angles, with a twirl and a speed change every so often."""
+    rng = np.random.default_rng(seed)
+    angles = (rng.integers(0, 8, count) * 45).tolist()
+    actions = []
+    for floor in range(0, count, 16):
+        actions.append({"floor": floor, "eventType": "Twirl"})
+    for floor in range(8, count, 64):
+        actions.append({"floor": floor, "eventType": "SetSpeed", "speedType": "Multiplier", "bpmMultiplier": 1.0})
+    with open(path, "w") as f:
+        json.dump({"angleData": angles, "settings": {"bpm": 150, "offset": 0}, "actions": actions}, f, indent=1)
+
+
+def write_chart(path, count, seed=0, resolution=192):
+    rng = np.random.default_rng(seed)
+    ticks = np.sort(rng.integers(0, max(count, 1) * resolution // 2, count)).tolist()
+    frets = rng.integers(0, 5, count).tolist()
+    lines = ["[Song]", "{", f"  Resolution = {resolution}", "  Offset = 0", "}",
+             "[SyncTrack]", "{", "  0 = TS 4", "  0 = B 120000", "}",
+             "[Events]", "{", "}",
+             "[ExpertSingle]", "{"]
+    lines += [f"  {tick} = N {fret} 0" for tick, fret in zip(ticks, frets)]
+    lines.append("}")
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
@@ -1,4 +1,8 @@
 #!/usr/bin/env python
+import time
+
+START = time.perf_counter()  # Before everything else, so the imports get timed too
+
 import ctypes
 import sys
 import traceback
@@ -10,22 +14,29 @@ import OpenGL.GL as gl
 import src.loop as loop
 from pathlib import Path
 import os
-from tkinter import Tk  # this is only for the file dialog
 
 
 import src.style as imgui_style
+from src.profiling import StartupProfile
 
 
 def main():
+    # Prints how long each part of startup took, then quits after the first frame
+    profile = StartupProfile(START, enabled="--startup-profile" in sys.argv)
+    if profile.enabled:
+        sys.argv.remove("--startup-profile")  # So it doesn't get opened as a level
+    profile.mark("imports")
     window, gl_ctx = init()
+    profile.mark("SDL/GL init")
     imgui.create_context()
     style = imgui.get_style()
     default_font, font = imgui_style.set(style)
     impl = SDL2Renderer(window)
     impl.refresh_font_texture()
+    profile.mark("font atlas")
     editor = loop.Editor()
-    root = Tk()
-    root.withdraw()
+    profile.mark("assets")
+    editor.profile = profile
     try:
         editor.start(window, impl, font, default_font, gl_ctx)
     except Exception as e:  # Don't catch KeyboardInterrupt
@@ -49,7 +60,8 @@ def main():
 def init():
     width, height = 1366, 768
     window_name = "SSPy"
-    if sdl2.SDL_Init(sdl2.SDL_INIT_EVERYTHING) < 0:
+    # Only video (which brings events along). Audio gets started by the mixer's output, and nothing uses the rest
+    if sdl2.SDL_Init(sdl2.SDL_INIT_VIDEO) < 0:
         print("Error: SDL could not initialize! SDL Error: " + sdl2.SDL_GetError().decode("utf-8"))
         exit(1)
 
@@ -0,0 +1,68 @@
+import os
+import wave
+from pathlib import Path
+
+import numpy as np
+
+ASSET_DIR = Path(__file__).resolve().parent.parent / "assets"
+CACHE_DIR = Path(__file__).resolve().parent.parent / "cache" / "assets"
+
+
+def read_wav(path):
+    """
+    A PCM .wav as an (n, channels) int16 array and its frame rate, straight from the file with no ffmpeg.
+    """
+    with wave.open(str(path), "rb") as f:
+        channels, width, frame_rate = f.getnchannels(), f.getsampwidth(), f.getframerate()
+        data = f.readframes(f.getnframes())
+    if width == 1:  # 8-bit wavs are unsigned
+        samples = (np.frombuffer(data, dtype=np.uint8).astype(np.int16) - 128) << 8
+    elif width == 2:
+        samples = np.frombuffer(data, dtype="<i2")
+    elif width == 3:
+        raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3)
+        samples = (raw[:, 1].astype(np.int16) | (raw[:, 2].astype(np.int16) << 8))  # Drop the lowest byte
+    elif width == 4:
+        samples = (np.frombuffer(data, dtype="<i4") >> 16).astype(np.int16)
+    else:
+        raise ValueError(f"Unsupported sample width in {path}: {width} bytes")
+    return samples.reshape(-1, channels), frame_rate
+
+
+def resample(frames, frame_rate, target_rate):
+    """Linear resampling, good enough for short sound effects."""
+    if frame_rate == target_rate or not frames.shape[0]:
+        return frames
+    length = int(round(frames.shape[0] * target_rate / frame_rate))
+    positions = np.arange(length) * (frame_rate / target_rate)
+    source = np.arange(frames.shape[0])
+    return np.column_stack([np.interp(positions, source, frames[:, c]) for c in range(frames.shape[1])]).astype(
+        frames.dtype)
+
+
+def load_rgba(name):
+    """
+    A built-in image as an (h, w, 4) uint8 array. Decoded once, then kept as a raw .npy next to the other caches.
+    The cache file is named after the source's size and modification time, so editing the asset invalidates it.
+    """
+    source = ASSET_DIR / name
+    stat = source.stat()
+    cached = CACHE_DIR / f"{source.stem}-{stat.st_size}-{stat.st_mtime_ns}.npy"
+    try:
+        return np.load(cached)
+    except (OSError, ValueError):
+        pass
+    from PIL import Image
+    with Image.open(source) as im:
+        pixels = np.asarray(im.convert("RGBA"))
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        for old in CACHE_DIR.glob(f"{source.stem}-*.npy"):
+            old.unlink()
+        temp = cached.with_suffix(".tmp")
+        with open(temp, "wb") as f:
+            np.save(f, pixels)
+        os.replace(temp, cached)
+    except OSError:  # Can't write next to the install, decoding every time still works
+        pass
+    return pixels
@@ -0,0 +1,59 @@
+import math
+
+import numpy as np
+
+SUBDIVISION, BEAT, MEASURE = 0, 1, 2
+
+
+def adjust_swing(beat, swing):
+    """Editor.adjust_swing, for arrays of beats."""
+    beat = np.asarray(beat, dtype=np.float64)
+    b = beat % 2
+    s = swing
+    return np.where(b < (2 * s),
+                    (beat - b) + (((2 - 2 * s) / (2 * s)) * b),
+                    (beat - b) + (((2 * s) / (2 - 2 * s)) * (b - 2 * s) + 2 - 2 * s))
+
+
+class BeatGrid:
+    """
+    Every measure, beat and subdivision time from `start` to `end` (inclusive), as sorted arrays.
+    Only the range that's needed should be built, there's no limit on how many ticks this makes.
+    `finest` leaves out the levels below it, for when only beats or measures get drawn anyway.
+    """
+
+    def __init__(self, bpm, offset, swing, time_signature, beat_divisor, start, end, finest=SUBDIVISION):
+        self.key = (bpm, offset, swing, tuple(time_signature), beat_divisor, start, end, finest)
+        self.start, self.end = start, end
+        self.ms_per_beat = (60000 / bpm) * (4 / time_signature[1])
+        beats_per_measure = max(int(time_signature[0]), 1)
+        step = (1, beat_divisor, beat_divisor * beats_per_measure)[finest]  # In subdivisions
+        # Swing only moves a tick around inside its pair of beats, so 2 beats either side is enough margin
+        first = max(math.floor(((start - offset) / self.ms_per_beat - 2) * beat_divisor / step), 1)
+        last = math.ceil(((end - offset) / self.ms_per_beat + 2) * beat_divisor / step)
+        subdivisions = np.arange(first, last + 1, dtype=np.int64) * step
+        # The grid swings the other way from adjust_swing, or it draws in the wrong place
+        times = adjust_swing(subdivisions / beat_divisor, 1 - swing) * self.ms_per_beat + offset
+        lo, hi = np.searchsorted(times, start, "left"), np.searchsorted(times, end, "right")
+        subdivisions, self.times = subdivisions[lo:hi], times[lo:hi]
+        self.kinds = np.full(subdivisions.shape, SUBDIVISION, dtype=np.uint8)
+        self.kinds[subdivisions % beat_divisor == 0] = BEAT
+        self.kinds[subdivisions % (beat_divisor * beats_per_measure) == 0] = MEASURE
+
+    def __len__(self):
+        return self.times.shape[0]
+
+    def between(self, start, end):
+        """(times, kinds) of every tick with start <= time < end."""
+        lo, hi = np.searchsorted(self.times, (start, end), "left")
+        return self.times[lo:hi], self.kinds[lo:hi]
+
+
+def timeline_grid(bpm, offset, swing, time_signature, beat_divisor, end):
+    """
+    The grid from 0 to `end`, thinned out the same way the timeline always has so long maps don't turn into
+    a solid bar. The levels that get thinned out are never built in the first place.
+    """
+    end_beat = end / ((60000 / bpm) * (4 / time_signature[1]))
+    finest = SUBDIVISION if end_beat < 250 else BEAT if end_beat < 500 else MEASURE
+    return BeatGrid(bpm, offset, swing, time_signature, beat_divisor, 0, end, finest)
@@ -0,0 +1,49 @@
+import numpy as np
+
+TRAIL_MS = 75  # How far back the cursor's trail goes
+
+
+def hermite(times, node_times, nodes):
+    """
+    A cubic Hermite curve through `nodes` (n, 2) at `node_times`, evaluated at every one of `times` in one go.
+    The tangents are Catmull-Rom style (from the neighbouring nodes), so each segment only depends on
+    the two nodes it joins and one more on either side. Before the first node and after the last it stays put.
+    """
+    if nodes.shape[0] == 1:
+        return np.repeat(nodes, times.shape[0], axis=0)
+    tangents = np.gradient(nodes, node_times, axis=0, edge_order=1)
+    t = np.clip(times, node_times[0], node_times[-1])
+    i = np.clip(np.searchsorted(node_times, t, "right") - 1, 0, node_times.shape[0] - 2)
+    h = (node_times[i + 1] - node_times[i])[:, None]
+    s = (t[:, None] - node_times[i][:, None]) / h
+    s2, s3 = s * s, s * s * s
+    return ((2 * s3 - 3 * s2 + 1) * nodes[i] + (s3 - 2 * s2 + s) * h * tangents[i]
+            + (3 * s2 - 2 * s3) * nodes[i + 1] + (s3 - s2) * h * tangents[i + 1])
+
+
+def _after(unique, time):
+    """How many of the (int32) note times are <= time."""
+    # NOTE: Searching with a float would convert the whole array to floats first. The floor lands in the same spot
+    return int(np.searchsorted(unique, np.int32(np.clip(np.floor(time), -2 ** 31, 2 ** 31 - 1)), "right"))
+
+
+def cursor_path(notes, times):
+    """
+    Where the cursor is at each of `times`, going through the average position of the notes at each time.
+    Only the few nodes around `times` get looked at, so nothing has to be rebuilt when the notes change,
+    and placing a note on a huge map costs the same as on a tiny one.
+    """
+    times = np.asarray(times, dtype=np.float64).reshape(-1)
+    unique = notes.unique_times()
+    if not unique.shape[0] or not times.shape[0]:
+        return np.ones((times.shape[0], 2))  # The middle of the grid
+    # The segments `times` land in, plus a node on each side for their tangents
+    lo = max(_after(unique, times.min()) - 2, 0)
+    hi = min(_after(unique, times.max()) + 2, unique.shape[0])
+    node_times, node_x, node_y = notes.mean_positions(*notes.span(unique[lo], unique[hi - 1] + 1))
+    return hermite(times, node_times.astype(np.float64), np.column_stack((node_x, node_y)))
+
+
+def cursor_trail(notes, time, length=TRAIL_MS):
+    """The cursor's position every ms from `time` back `length` ms, newest first."""
+    return cursor_path(notes, time - np.arange(length))
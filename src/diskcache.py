@@ -0,0 +1,79 @@
+import os
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from pydub import AudioSegment
+
+CACHE_DIR = Path(__file__).resolve().parent.parent / "cache" / "pcm"
+
+
+class PCMDiskCache:
+    """
+    Decoded audio on disk as .npy files, named by the hash of the encoded bytes it came from.
+    Loading one is a single read straight into the samples, so reopening a map doesn't need ffmpeg at all.
+    Least recently used files get deleted once the directory is over `budget` bytes.
+    """
+
+    def __init__(self, directory=CACHE_DIR, budget=2 * 1024 ** 3):
+        self.directory = Path(directory)
+        self.budget = budget
+
+    def _find(self, digest):
+        if not self.directory.is_dir():
+            return None
+        return next(self.directory.glob(f"{digest}-*.npy"), None)
+
+    def load(self, digest):
+        """The cached AudioSegment for this hash, None if it's not cached."""
+        path = self._find(digest)
+        if path is None:
+            return None
+        try:
+            frames = np.load(path, mmap_mode="r")
+            frame_rate = int(path.stem.rsplit("-", 1)[1])
+            # NOTE: This has to be real bytes. pydub keeps whatever buffer it's given, but a memoryview breaks
+            # get_array_of_samples (one sample per byte) and anything that concatenates (+, overlay, fades)
+            data = frames.tobytes()
+            os.utime(path)  # Mark it as recently used
+        except (OSError, ValueError):  # Half-written or corrupted somehow, decode it again
+            return None
+        return AudioSegment(data=data, sample_width=2, frame_rate=frame_rate, channels=frames.shape[1])
+
+    def store(self, digest, segment):
+        """Save a decoded AudioSegment, then evict old entries if it went over budget."""
+        segment = segment.set_sample_width(2)
+        frames = np.frombuffer(segment.raw_data, dtype="<i2").reshape(-1, segment.channels)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{digest}-{segment.frame_rate}.npy"
+        fd, temp = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, frames)
+            os.replace(temp, path)
+        except BaseException:
+            if os.path.exists(temp):
+                os.remove(temp)
+            raise
+        self.evict(keep=path)
+
+    def evict(self, keep=None):
+        entries = []
+        for path in self.directory.glob("*.npy"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort(key=lambda entry: entry[0])
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.budget:
+                break
+            if path == keep:
+                continue
+            try:
+                path.unlink()
+                total -= size
+            except OSError:  # Still mapped somewhere (Windows won't delete it), get it next time
+                pass
@@ -0,0 +1,133 @@
+import time
+
+COALESCE_SECONDS = 0.5  # Edits of the same kind closer together than this undo as one
+DEFAULT_LIMIT = 64 << 20
+
+
+def edit_size(edit):
+    return sum(column.nbytes for column in edit[1:]) if edit[0] != "shift" else 8
+
+
+class Step:
+    """One undoable action: the NoteStore edits it made, in order."""
+
+    def __init__(self, edits, when):
+        self.edits = list(edits)
+        self.kinds = {edit[0] for edit in edits}
+        self.when = when
+        self.size = sum(map(edit_size, edits))
+
+    def merge(self, edits, when):
+        self.edits += edits
+        self.when = when
+        self.size += sum(map(edit_size, edits))
+
+
+def undo_edit(notes, edit):
+    if edit[0] == "add":
+        rows = notes.rows_of(edit[4], edit[1])
+        notes.remove_rows(rows[rows >= 0])
+    elif edit[0] == "remove":
+        notes.extend(*edit[1:])
+    else:
+        notes.shift(-edit[1])
+
+
+def redo_edit(notes, edit):
+    if edit[0] == "add":
+        notes.extend(*edit[1:])
+    elif edit[0] == "remove":
+        rows = notes.rows_of(edit[4], edit[1])
+        notes.remove_rows(rows[rows >= 0])
+    else:
+        notes.shift(edit[1])
+
+
+class History:
+    """
+    Undo/redo for a NoteStore, kept as the edits it recorded instead of copies of the notes.
+    An add is undone by removing its ids, a remove by merging the removed columns back in (ids and all),
+    so undoing a huge bulk delete is one extend(). Once the steps add up to more than `limit` bytes,
+    the oldest ones get dropped.
+    """
+
+    def __init__(self, limit=DEFAULT_LIMIT, clock=time.monotonic):
+        self.limit = limit
+        self.clock = clock
+        self.notes = None
+        self.undo_steps = []
+        self.redo_steps = []
+        self.size = 0
+        self.sealed = True
+
+    def clear(self):
+        self.undo_steps = []
+        self.redo_steps = []
+        self.size = 0
+        self.sealed = True
+
+    def watch(self, notes):
+        """Steps only make sense for the notes they were made on, so a different store starts over."""
+        if notes is not self.notes:
+            self.clear()
+            self.notes = notes
+
+    def seal(self):
+        """Keep the next edit from being merged into the last step."""
+        self.sealed = True
+
+    @property
+    def can_undo(self):
+        return bool(self.undo_steps)
+
+    @property
+    def can_redo(self):
+        return bool(self.redo_steps)
+
+    def record(self, notes, edits):
+        """Add the edits `notes` made since the last call as a step, or onto the last one if they came quick enough."""
+        self.watch(notes)
+        if not edits:
+            return
+        self.size -= sum(step.size for step in self.redo_steps)
+        self.redo_steps = []
+        now = self.clock()
+        last = self.undo_steps[-1] if self.undo_steps else None
+        if (last is not None and not self.sealed and now - last.when < COALESCE_SECONDS
+                and last.kinds == {edit[0] for edit in edits}):
+            self.size -= last.size
+            last.merge(edits, now)
+            self.size += last.size
+        else:
+            self.undo_steps.append(Step(edits, now))
+            self.size += self.undo_steps[-1].size
+        self.sealed = False
+        self.trim()
+
+    def trim(self):
+        dropped = 0
+        while self.size > self.limit and dropped < len(self.undo_steps):
+            self.size -= self.undo_steps[dropped].size
+            dropped += 1
+        del self.undo_steps[:dropped]
+
+    def undo(self):
+        """Undo the last step, returning whether there was one. The edits this makes shouldn't be record()ed."""
+        if not self.undo_steps:
+            return False
+        step = self.undo_steps.pop()
+        for edit in reversed(step.edits):
+            undo_edit(self.notes, edit)
+        self.redo_steps.append(step)
+        self.sealed = True
+        return True
+
+    def redo(self):
+        if not self.redo_steps:
+            return False
+        step = self.redo_steps.pop()
+        for edit in step.edits:
+            redo_edit(self.notes, edit)
+        self.undo_steps.append(step)
+        self.sealed = True
+        return True
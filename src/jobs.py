@@ -0,0 +1,39 @@
+import threading
+
+
+class Job:
+    """
+    A function running on a background thread, with progress the UI can poll every frame.
+    The target gets called with an extra `progress` keyword, a callback taking (fraction, status).
+    """
+
+    def __init__(self, description, target, *args, **kwargs):
+        self.description = description
+        self.progress = 0.0
+        self.status = ""
+        self.result = None
+        self.error = None
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(target, args, kwargs), daemon=True)
+        self._thread.start()
+
+    def _run(self, target, args, kwargs):
+        try:
+            self.result = target(*args, progress=self.report, **kwargs)
+        except Exception as e:  # Handed to whoever polls the job
+            self.error = e
+        finally:
+            self.progress = 1.0
+            self._done.set()
+
+    def report(self, progress, status=None):
+        self.progress = min(max(progress, 0.0), 1.0)
+        if status is not None:
+            self.status = status
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
@@ -0,0 +1,311 @@
+import base64
+import json
+import os
+import struct
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from src.level import LazyMedia, decode_audio, decode_image
+from src.notes import NoteStore
+
+MAGIC = b"SSPyJRNL"
+VERSION = 1
+HEADER = struct.Struct("<8sHqq")  # Magic, version, then the mtime (ns) and size of the map it's on top of
+RECORD = struct.Struct("<BI")  # Kind, payload length
+JOURNAL_NOTE = np.dtype([("time", "<i4"), ("x", "<f4"), ("y", "<f4")])
+ADD, REMOVE, SHIFT, NOTES, STATE, MEDIA = range(1, 7)
+MEDIA_ATTRS = ("audio", "cover")
+COMPACT_SLACK = 1 << 20  # Fold the journal once it's this much bigger than a snapshot would be
+EDITOR_FIELDS = ("bpm", "offset", "time_signature", "swing")
+LEVEL_FIELDS = ("id", "name", "authors", "difficulty", "song_name", "rating", "modchart", "custom_fields",
+                "marker_types", "markers")
+# Too big to encode every frame just to see if they changed. These only get encoded again when they're
+# replaced with a new object or touch()ed
+LARGE_FIELDS = ("custom_fields", "marker_types", "markers")
+
+
+def journal_path(filename):
+    path = Path(filename)
+    return path.with_name(path.name + ".journal")
+
+
+def _default(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):  # Custom fields can hold raw data
+        return {"__bytes__": base64.b64encode(bytes(value)).decode("ascii")}
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Can't journal a {type(value).__name__}")
+
+
+def _object_hook(obj):
+    if obj.keys() == {"__bytes__"}:
+        return base64.b64decode(obj["__bytes__"])
+    return obj
+
+
+def level_fields(level, editor):
+    """Everything about a level that gets saved besides its notes and media."""
+    fields = {field: getattr(editor, field) for field in EDITOR_FIELDS}
+    return fields | {field: getattr(level, field) for field in LEVEL_FIELDS if hasattr(level, field)}
+
+
+def pack_notes(times, x, y):
+    records = np.empty(len(times), dtype=JOURNAL_NOTE)
+    records["time"], records["x"], records["y"] = times, x, y
+    return records.tobytes()
+
+
+def parse(data, offset=HEADER.size):
+    """The (kind, payload) records in journal bytes from `offset`, and where the last complete one ends."""
+    records = []
+    while offset + RECORD.size <= len(data):
+        kind, length = RECORD.unpack_from(data, offset)
+        if offset + RECORD.size + length > len(data):  # Cut off by a crash halfway through writing it
+            break
+        records.append((kind, data[offset + RECORD.size:offset + RECORD.size + length]))
+        offset += RECORD.size + length
+    return records, offset
+
+
+class Journal:
+    """
+    Every edit made to a map since it was last saved, appended to `<map>.journal` as it happens.
+    Notes go in as compact binary deltas (12 bytes a note), everything else as the JSON of the fields that changed,
+    and new audio/covers as their encoded bytes. If the editor dies before saving, opening the map again replays it.
+    The header remembers which version of the map file it's on top of, so a journal for an older save gets ignored.
+    Once it's grown well past what the edits add up to, it gets folded into one snapshot of the notes and fields.
+    The file only gets made on the first edit, and goes away once everything in it has been saved.
+    """
+
+    def __init__(self, filename):
+        self.filename = Path(filename).resolve()
+        self.path = journal_path(self.filename)
+        self.file = None
+        self.level = None
+        self.notes = None
+        self.state = {}  # field -> its JSON
+        self.encoded = {}  # field -> the object self.state has the JSON of, for LARGE_FIELDS
+        self.touched = set()
+        self.media = {}
+        self.media_records = {}  # attr -> encoded bytes, for media changed since the map was saved
+        self.marked = False  # A save is running with a mark() into the file, so it can't get compacted
+        self.rewritten = 0  # How big the file was right after the last compact()/rebase()
+        self.written = 0  # Records written so far
+
+    def _base(self):
+        stat = self.filename.stat()
+        return stat.st_mtime_ns, stat.st_size
+
+    def read(self):
+        """
+        The records in the journal and where they end, or None if there's nothing to recover.
+        A journal for a different version of the map gets deleted.
+        """
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        if len(data) >= HEADER.size:
+            magic, version, *base = HEADER.unpack_from(data)
+            if magic == MAGIC and version == VERSION and tuple(base) == self._base():
+                return parse(data)
+        print(f"/!\\ Edit journal {self.path.name} doesn't match the map anymore, deleting it")
+        self._remove()
+        return None
+
+    def replay(self, records, level):
+        """Apply recovered records to `level`, returning the editor settings (bpm and such) to restore."""
+        state = {}
+        for kind, payload in records:
+            if kind in (ADD, REMOVE, NOTES):
+                notes = np.frombuffer(payload, dtype=JOURNAL_NOTE)
+                if kind == ADD:
+                    level.notes.extend(notes["time"], notes["x"], notes["y"])
+                elif kind == REMOVE:
+                    rows = level.notes.find(notes["time"], notes["x"], notes["y"])
+                    level.notes.remove_rows(rows[rows >= 0])
+                else:
+                    level.notes = NoteStore(notes["time"], notes["x"], notes["y"])
+            elif kind == SHIFT:
+                level.notes.shift(struct.unpack("<i", payload)[0])
+            elif kind == STATE:
+                state |= json.loads(payload, object_hook=_object_hook)
+            elif kind == MEDIA:
+                attr, data = MEDIA_ATTRS[payload[0]], bytes(payload[1:])
+                self.media_records[attr] = data
+                decode = decode_audio if attr == "audio" else decode_image
+                setattr(level, attr, LazyMedia(data, decode) if data else None)
+        for field in LEVEL_FIELDS:
+            if field in state and hasattr(level, field):
+                setattr(level, field, state[field])
+        settings = {field: state[field] for field in EDITOR_FIELDS if field in state}
+        if "time_signature" in settings:  # JSON doesn't do tuples
+            settings["time_signature"] = tuple(settings["time_signature"])
+        return settings
+
+    def start(self, level, editor, resume_at=None):
+        """Start journaling edits to `level`. resume_at is where read() left off, to keep adding to a recovered journal."""
+        if resume_at is not None:
+            self.file = open(self.path, "r+b")
+            self.file.truncate(resume_at)  # Anything past it was half-written
+            self.file.seek(resume_at)
+        self._watch(level)
+        self.encoded = {}
+        self.state = self._encode(level, editor)
+        self.media = {attr: self._media(level, attr) for attr in MEDIA_ATTRS}
+
+    def _watch(self, level):
+        self.level = level
+        self.notes = level.notes
+
+    @staticmethod
+    def _media(level, attr):
+        return level.media_source(attr), getattr(level, f"_{attr}") is None
+
+    def _write(self, kind, payload):
+        if self.file is None:
+            self.file = open(self.path, "wb")
+            self.file.write(HEADER.pack(MAGIC, VERSION, *self._base()))
+        self.file.write(RECORD.pack(kind, len(payload)))
+        self.file.write(payload)
+        self.written += 1
+
+    def update(self, level, editor, edits):
+        """
+        Write down whatever changed since the last call. Meant to be called every frame,
+        with the edits level.notes recorded since the last one. Returns whether anything did change.
+        """
+        written = self.written
+        if level.notes is not self.notes:  # A whole new set of notes, the snapshot has the edits too
+            self._watch(level)
+            self._write(NOTES, pack_notes(level.notes.times, level.notes.x, level.notes.y))
+            edits = ()
+        self.level = level
+        for edit in edits:
+            if edit[0] == "shift":
+                self._write(SHIFT, struct.pack("<i", edit[1]))
+            else:
+                self._write(ADD if edit[0] == "add" else REMOVE, pack_notes(*edit[1:4]))
+        state = self._encode(level, editor)
+        changed = [field for field, value in state.items() if self.state.get(field) != value]
+        if changed:
+            self._write(STATE, ("{" + ",".join(f"{json.dumps(field)}:{state[field]}" for field in changed) + "}").encode())
+        self.state = state
+        for attr in MEDIA_ATTRS:
+            media = self._media(level, attr)
+            if media == self.media[attr]:
+                continue
+            self.media[attr] = media
+            source, removed = media
+            if removed or source is not None:
+                self.media_records[attr] = b"" if removed else bytes(source.data)
+                self._write(MEDIA, bytes((MEDIA_ATTRS.index(attr),)) + self.media_records[attr])
+            # NOTE: Otherwise it's only been decoded, so there's nothing compact to write. Saving still gets it
+        if self.file is not None:
+            self.file.flush()
+            # NOTE: The last rewrite is the real size of a snapshot, markers and all. The estimate is for before there was one
+            snapshot = max(self.rewritten, len(level.notes) * JOURNAL_NOTE.itemsize
+                           + sum(map(len, self.media_records.values())))
+            if not self.marked and self.file.tell() > snapshot + COMPACT_SLACK:
+                self.compact()
+        return self.written != written
+
+    def touch(self, field):
+        """A large field got edited in place, so it needs encoding again."""
+        self.touched.add(field)
+
+    def _encode(self, level, editor):
+        state = {}
+        for field, value in level_fields(level, editor).items():
+            if field in LARGE_FIELDS:
+                if field in self.state and field not in self.touched and self.encoded.get(field) is value:
+                    state[field] = self.state[field]
+                    continue
+                self.encoded[field] = value
+            state[field] = json.dumps(value, default=_default)
+        self.touched.clear()
+        return state
+
+    def _rewrite(self, base, payload):
+        """Atomically replace the journal with `payload` on top of the map version `base`, or delete it if empty."""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.rewritten = 0
+        if not payload:
+            self._remove()
+            return
+        fd, temp = tempfile.mkstemp(prefix=f".{self.path.name}.", suffix=".tmp", dir=self.path.parent)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(HEADER.pack(MAGIC, VERSION, *base))
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp, self.path)
+        except BaseException:
+            if os.path.exists(temp):
+                os.remove(temp)
+            raise
+        self.file = open(self.path, "ab")
+        self.rewritten = self.file.tell()
+
+    def compact(self):
+        """Fold everything into one snapshot: all the notes, all the fields, and any new media."""
+        with open(self.path, "rb") as f:
+            base = HEADER.unpack_from(f.read(HEADER.size))[2:]
+        notes = self.level.notes
+        payload = [RECORD.pack(NOTES, len(notes) * JOURNAL_NOTE.itemsize), pack_notes(notes.times, notes.x, notes.y)]
+        state = ("{" + ",".join(f"{json.dumps(field)}:{value}" for field, value in self.state.items()) + "}").encode()
+        payload += [RECORD.pack(STATE, len(state)), state]
+        for attr, data in self.media_records.items():
+            payload += [RECORD.pack(MEDIA, len(data) + 1), bytes((MEDIA_ATTRS.index(attr),)), data]
+        self._rewrite(base, b"".join(payload))
+
+    def mark(self):
+        """
+        Where the journal is up to. Pass it to rebase() once a save started now is on disk, or call release()
+        if the save failed. Compacting waits until then, since it would move everything the mark points at.
+        """
+        self.marked = True
+        return self.file.tell() if self.file is not None else HEADER.size
+
+    def release(self):
+        self.marked = False
+
+    def rebase(self, mark):
+        """The map got saved with everything before `mark`, so only keep what came after, on top of the new file."""
+        self.marked = False
+        data = b""
+        if self.file is not None:
+            self.file.flush()
+        if self.path.exists():
+            with open(self.path, "rb") as f:
+                data = f.read()[mark:]
+        self.media_records = {}
+        for kind, payload in parse(data, 0)[0]:
+            if kind == MEDIA:
+                self.media_records[MEDIA_ATTRS[payload[0]]] = bytes(payload[1:])
+        self._rewrite(self._base(), data)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def _remove(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def discard(self):
+        """Throw the journal away, for when the edits in it aren't wanted."""
+        self.close()
+        self._remove()
@@ -1,9 +1,15 @@
+import copy
 import glob
 import json
+import mmap
 import os
 import struct
+import subprocess
+import tempfile
+import threading
 import uuid
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
 from io import BytesIO
 from itertools import chain
 from pathlib import Path
@@ -12,6 +18,11 @@ from hashlib import sha1
 import numpy as np
 from PIL import Image
 from pydub import AudioSegment
+from pydub.exceptions import CouldntDecodeError
+from pydub.utils import mediainfo_json
+
+from src.diskcache import PCMDiskCache
+from src.notes import NoteStore
 
 
 def read_line(file):
@@ -21,11 +32,186 @@ def read_line(file):
     return out.decode("utf-8")
 
 
+def no_progress(*_):
+    pass
+
+
+@contextmanager
+def atomic_open(filename, mode="wb"):
+    """
+    Open a temp file next to `filename` that only replaces it once it's been written completely.
+    If anything goes wrong before then, the original file is left alone.
+    """
+    path = Path(filename).resolve()
+    fd, temp = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, path)
+    except BaseException:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+
+
+def sniff_format(data):
+    """Guess what an encoded blob is from its magic bytes, or None if it's not something we know."""
+    head = bytes(data[:12])
+    if head.startswith(b"OggS"):
+        return "ogg"
+    if head.startswith(b"ID3") or head[:2] in (b"\xff\xfb", b"\xff\xf3", b"\xff\xf2"):
+        return "mp3"
+    if head.startswith(b"RIFF") and head[8:12] == b"WAVE":
+        return "wav"
+    if head.startswith(b"fLaC"):
+        return "flac"
+    if head.startswith(b"\x89PNG"):
+        return "png"
+    if head.startswith(b"\xff\xd8"):
+        return "jpg"
+    return None
+
+
+DECODE_CHUNK = 1 << 20
+PCM_CACHE = PCMDiskCache()
+
+
+def decode_audio(data, progress=no_progress):
+    """
+    Decode to 16-bit PCM, from the disk cache if this exact file has been decoded before.
+    Otherwise it gets decoded and cached, and what comes back is the cached 16-bit copy either way.
+    """
+    digest = sha1(data).hexdigest()
+    cached = PCM_CACHE.load(digest)
+    if cached is not None:
+        progress(1.0, "Loaded audio from cache")
+        return cached
+    audio = ffmpeg_decode(data, progress)
+    try:
+        PCM_CACHE.store(digest, audio)
+        return PCM_CACHE.load(digest) or audio
+    except OSError as e:  # Read-only install or a full disk, still works without the cache
+        print(f"/!\\ Couldn't cache decoded audio: {e}")
+        return audio
+
+
+def ffmpeg_decode(data, progress=no_progress):
+    """
+    Decode to 16-bit PCM by streaming it out of ffmpeg into a buffer sized from ffprobe's duration,
+    reporting how far along it is. Falls back to pydub if probing doesn't work out.
+    """
+    try:
+        with BytesIO(data) as buf:
+            info = mediainfo_json(buf)
+        stream = next(s for s in info["streams"] if s.get("codec_type") == "audio")
+        frame_rate, channels = int(stream["sample_rate"]), int(stream["channels"])
+        duration = float(stream.get("duration") or info.get("format", {}).get("duration") or 0)
+    except Exception:  # No ffprobe, or it didn't understand the file
+        with BytesIO(data) as buf:
+            return AudioSegment.from_file(buf).set_sample_width(
+                2)  # HACK: if i don't do this, it plays horribly clipped and way too loud. it's a simpleaudio bug :/
+    frame_size = 2 * channels
+    expected = int(duration * frame_rate) * frame_size
+    pcm = bytearray(max(expected + frame_size * frame_rate, DECODE_CHUNK))  # A second of slack, durations are rounded
+    with tempfile.TemporaryFile() as errors:
+        ffmpeg = subprocess.Popen([AudioSegment.converter, "-v", "error", "-i", "pipe:0", "-f", "s16le",
+                                   "-acodec", "pcm_s16le", "-ar", str(frame_rate), "-ac", str(channels), "pipe:1"],
+                                  stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=errors)
+
+        def feed():
+            try:
+                ffmpeg.stdin.write(data)
+            except OSError:  # ffmpeg quit early, its exit code says why
+                pass
+            finally:
+                ffmpeg.stdin.close()
+
+        feeder = threading.Thread(target=feed, daemon=True)
+        feeder.start()
+        length = 0
+        while True:
+            if len(pcm) - length < DECODE_CHUNK:
+                pcm.extend(bytes(len(pcm)))
+            with memoryview(pcm) as view:
+                read = ffmpeg.stdout.readinto(view[length:length + DECODE_CHUNK])
+            if not read:
+                break
+            length += read
+            if expected:
+                progress(length / expected, "Decoding audio")
+        feeder.join()
+        if ffmpeg.wait():
+            errors.seek(0)
+            raise CouldntDecodeError(f"Decoding failed. ffmpeg returned error code: {ffmpeg.returncode}\n\n"
+                                     f"{errors.read().decode('utf-8', 'replace')}")
+    length -= length % frame_size
+    return AudioSegment(data=bytes(pcm[:length]), sample_width=2, frame_rate=frame_rate, channels=channels)
+
+
+def decode_image(data, progress=no_progress):
+    with BytesIO(data) as buf:
+        with Image.open(buf) as im:
+            return im.copy()
+
+
+class LazyMedia:
+    """
+    Encoded media that gets decoded on a background thread.
+    Asking for the value before it's done blocks until it is.
+    The encoded bytes stick around, so saving can copy them through instead of re-encoding.
+    `decode` gets called with the data and a progress callback, which fills in `progress`.
+    """
+
+    def __init__(self, data, decode):
+        self.data = data
+        self.format = sniff_format(data)
+        self.progress = 0.0
+        self._digest = None
+        self._decode = decode
+        self._value = None
+        self._error = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        with self._lock:
+            if self._done.is_set():
+                return
+            try:
+                self._value = self._decode(self.data, progress=self._report)
+            except Exception as e:  # Re-raised wherever the value is asked for
+                self._error = e
+            self.progress = 1.0
+            self._done.set()
+
+    def _report(self, progress, *_):
+        self.progress = min(max(progress, 0.0), 1.0)
+
+    @property
+    def ready(self):
+        return self._done.is_set()
+
+    @property
+    def digest(self):
+        if self._digest is None:
+            self._digest = sha1(self.data).hexdigest()
+        return self._digest
+
+    def get(self):
+        self._run()
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+
 class Level(ABC):
     def __init__(self,
                  name: str = "Unnamed",
                  authors: list[str] = [],
-                 notes: dict[int, list[tuple[int, int]]] = None,
+                 notes: NoteStore | dict[int, list[tuple[float, float]]] = None,
                  cover: Image.Image = None,
                  audio: AudioSegment = None,
                  difficulty: int | str = -1,
@@ -33,20 +219,90 @@ class Level(ABC):
         self.id = id if id is not None else str(uuid.uuid1())
         self.name = name
         self.authors = authors
-        self.notes = notes if notes is not None else {}
+        if notes is None:
+            notes = NoteStore()
+        elif isinstance(notes, dict):
+            notes = NoteStore.from_dict(notes)
+        self.notes = notes
         self.cover = cover
         self.audio = audio
         self.difficulty = difficulty
 
+    @property
+    def audio(self) -> AudioSegment | None:
+        if isinstance(self._audio, LazyMedia):
+            self._audio = self._audio.get()
+        return self._audio
+
+    @audio.setter
+    def audio(self, value):
+        self._audio = value
+        self._audio_source = value if isinstance(value, LazyMedia) else None
+
+    @property
+    def cover(self) -> Image.Image | None:
+        if isinstance(self._cover, LazyMedia):
+            self._cover = self._cover.get()
+        return self._cover
+
+    @cover.setter
+    def cover(self, value):
+        self._cover = value
+        self._cover_source = value if isinstance(value, LazyMedia) else None
+
+    def media_source(self, attr):
+        """
+        The encoded bytes the audio/cover was loaded from, as a LazyMedia.
+        None if it's been replaced by something that was never encoded (or there is none).
+        """
+        return getattr(self, f"_{attr}_source")
+
+    def pending(self, attr):
+        """Whether the audio/cover is still being decoded. Accessing it now would block."""
+        value = getattr(self, f"_{attr}")
+        return isinstance(value, LazyMedia) and not value.ready
+
+    def loaded(self, attr):
+        """The audio/cover if it's been decoded, or None while it's still pending. Never blocks."""
+        return None if self.pending(attr) else getattr(self, attr)
+
+    def decode_progress(self, attr):
+        value = getattr(self, f"_{attr}")
+        return value.progress if isinstance(value, LazyMedia) else 1.0
+
+    def snapshot(self):
+        """A copy that's safe to save on another thread while this one keeps getting edited."""
+        level = copy.copy(self)
+        level.notes = self.notes.copy()
+        level.authors = list(self.authors)
+        return level
+
     def __str__(self):
         return f"{self.__class__.__name__}(author: {self.authors}, cover: {self.cover}, difficulty: {self.difficulty}, id: {self.id}, name: {self.name}, notes: ({len(self.notes)} notes), level_name: {self.level_name})"
 
     def get_end(self):
-        times_to_display = self.get_notes()
-        return (np.max(times_to_display) if times_to_display.shape[0] > 0 else 1000)
+        end = self.notes.end()
+        return end if end is not None else 1000
 
     def get_notes(self):
-        return np.sort(np.array(tuple(self.notes.keys()), dtype=np.int32))
+        return self.notes.unique_times()
+
+    def window(self, start, end):
+        """
+        Notes with start <= time < end, as a row range (lo, hi) into self.notes,
+        along with the index of each one's time in get_notes(), which is what note colors go by.
+        """
+        lo, hi = self.notes.span(start, end)
+        times = self.notes.times[lo:hi]
+        if not times.shape[0]:
+            return lo, hi, np.zeros(0, dtype=np.int64)
+        first = np.searchsorted(self.get_notes(), times[0], "left")
+        return lo, hi, first + np.concatenate(((0,), np.cumsum(times[1:] != times[:-1])))
+
+    def times_between(self, start, end):
+        """Distinct note times with start <= time < end."""
+        times = self.get_notes()
+        return times[np.searchsorted(times, start, "left"):np.searchsorted(times, end, "left")]
 
     @classmethod
     @abstractmethod
@@ -54,7 +310,7 @@ class Level(ABC):
         raise NotImplementedError
 
     @abstractmethod
-    def save(self, *_):
+    def save(self, *_, progress=no_progress):
         raise NotImplementedError
 
 
@@ -151,6 +407,90 @@ def wstr(output, string, length=2):
     output.write(string.encode("utf-8"))
 
 
+# An ssp_note marker with a quantum (float) position, which is what nearly every marker in a map is
+NOTE_MARKER = np.dtype([("time", "<u4"), ("m_type", "u1"), ("quantum", "u1"), ("x", "<f4"), ("y", "<f4")])
+
+
+def read_sspmv2_markers(data, count, marker_types):
+    """
+    Read the marker block of an SSPMv2 file.
+    Runs of float-positioned notes are read straight out of the buffer,
+    everything else (custom markers, integer positions) goes through read_sspmv2_variable.
+    Returns the notes as (times, xs, ys) arrays and the custom markers as a list.
+    """
+    type_fields = tuple(marker_types.values())
+    times, xs, ys = [], [], []
+    markers = []
+    offset = 0
+    read = 0
+    window = 1024
+    with BytesIO(data) as f:
+        while read < count:
+            # Look ahead for a run of fixed-size note records. The window grows while runs are long,
+            # so a map of only notes is a handful of frombuffer calls, and a marker every few notes stays linear.
+            length = min(window, count - read, (len(data) - offset) // NOTE_MARKER.itemsize)
+            run = np.frombuffer(data, dtype=NOTE_MARKER, count=length, offset=offset)
+            bad = (run["m_type"] != 0) | (run["quantum"] != 1)
+            good = int(np.argmax(bad)) if bad.any() else length
+            if good:
+                run = run[:good]
+                times.append(run["time"].astype(np.int32))
+                xs.append(run["x"])
+                ys.append(run["y"])
+                offset += good * NOTE_MARKER.itemsize
+                read += good
+            if good and good == length:
+                window *= 2
+                continue
+            window = 1024
+            # The next record isn't a quantum note (or is too short to be one), read it the slow way
+            f.seek(offset)
+            time = int.from_bytes(f.read(4), "little")
+            m_type = ord(f.read(1))
+            if m_type == 0:
+                x, y = read_sspmv2_variable(f, 7)[0]
+                times.append(np.array((time,), dtype=np.int32))
+                xs.append(np.array((x,), dtype=np.float32))
+                ys.append(np.array((y,), dtype=np.float32))
+            else:
+                assert m_type < len(type_fields), f"Error while loading SSPMv2: Marker type {m_type} isn't defined!"
+                marker = {"time": time, "m_type": m_type, "fields": []}
+                for v_type in type_fields[m_type]:
+                    marker["fields"].append(read_sspmv2_variable(f, v_type)[0])
+                markers.append(marker)
+            offset = f.tell()
+            read += 1
+    if not times:
+        return np.zeros(0, np.int32), np.zeros(0, np.float32), np.zeros(0, np.float32), markers
+    return np.concatenate(times), np.concatenate(xs), np.concatenate(ys), markers
+
+
+def write_sspmv2_markers(output, notes, markers, marker_types):
+    """
+    Write notes and custom markers as one time-sorted marker block.
+    Notes are packed as NOTE_MARKER records in bulk between the custom markers.
+    At equal times, custom markers go before notes.
+    """
+    type_fields = tuple(marker_types.values())
+    records = np.empty(len(notes), dtype=NOTE_MARKER)
+    records["time"] = notes.times
+    records["m_type"] = 0
+    records["quantum"] = 1
+    records["x"] = notes.x
+    records["y"] = notes.y
+    markers = sorted(markers, key=lambda marker: marker["time"])
+    splits = np.searchsorted(notes.times, [int(marker["time"]) for marker in markers], "left")
+    written = 0
+    for marker, split in zip(markers, splits.tolist()):
+        output.write(records[written:split].tobytes())
+        written = split
+        output.write(int(marker["time"]).to_bytes(4, "little"))
+        output.write(marker["m_type"].to_bytes(1, "little"))
+        for i, var in enumerate(marker["fields"]):
+            write_sspm2_variable(output, var, type_fields[marker["m_type"]][i])
+    output.write(records[written:].tobytes())
+
+
 class SSPMLevel(Level):
     def __init__(self, *args,
                  custom_fields={
@@ -169,9 +509,16 @@ class SSPMLevel(Level):
         self.rating = rating
         super().__init__(*args, **kwargs)
 
+    def snapshot(self):
+        level = super().snapshot()
+        level.custom_fields = copy.deepcopy(self.custom_fields)
+        level.marker_types = copy.deepcopy(self.marker_types)
+        level.markers = copy.deepcopy(self.markers)
+        return level
+
     @classmethod
     def load(cls, file):
-        with open(file, "rb") as f:
+        with open(file, "rb") as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as f:
             assert f.read(
                 4) == b"SS+m", "Invalid f signature! Your level might be corrupted, or in the wrong format."
             version = int.from_bytes(f.read(2), "little")
@@ -187,29 +534,22 @@ class SSPMLevel(Level):
                 cover = None
                 if f.read(1) == b"\x02":
                     data_length = int.from_bytes(f.read(8), "little")
-                    image_data = f.read(data_length)
-                    with BytesIO(image_data) as io:
-                        with Image.open(io) as im:
-                            cover = im.copy()
+                    cover = LazyMedia(f.read(data_length), decode_image)
                 audio = None
                 if f.read(1) == b"\x01":
                     data_length = int.from_bytes(f.read(8), "little")
-                    audio_data = f.read(data_length)
-                    with BytesIO(audio_data) as io:
-                        audio = AudioSegment.from_file(io).set_sample_width(
-                            2)  # HACK: if i don't do this, it plays horribly clipped and way too loud. it's a simpleaudio bug :/
-                notes = {}
+                    audio = LazyMedia(f.read(data_length), decode_audio)
+                times, xs, ys = [], [], []
                 for _ in range(note_count):
-                    timing = int.from_bytes(f.read(4), "little")
+                    times.append(int.from_bytes(f.read(4), "little"))
                     if f.read(1) == b"\x00":
                         x = int.from_bytes(f.read(1), "little")
                         y = int.from_bytes(f.read(1), "little")
                     else:
                         x, y = struct.unpack("ff", f.read(8))  # nice
-                    if timing in notes:
-                        notes[timing].append((x, y))
-                    else:
-                        notes[timing] = [(x, y)]
+                    xs.append(x)
+                    ys.append(y)
+                notes = NoteStore(times, xs, ys)
                 metadata = True
                 try:
                     assert f.read(4) == b"SSPy"
@@ -232,11 +572,8 @@ class SSPMLevel(Level):
                 has_audio = bool(ord(f.read(1)))
                 has_cover = bool(ord(f.read(1)))
                 modchart = bool(ord(f.read(1)))  # is modchart?
-                f.read(24)  # custom data offset/len and audio offset, dont need
-                audio_bitlen = int.from_bytes(f.read(8), "little")
-                f.read(8)  # cover offset, again don't need
-                cover_bitlen = int.from_bytes(f.read(8), "little")
-                f.read(32)
+                (cdata_ptr, cdata_len, audio_ptr, audio_len, cover_ptr, cover_len,
+                 mkdef_ptr, mkdef_len, markr_ptr, markr_len) = struct.unpack("<10Q", f.read(80))
                 song_id = f.read(int.from_bytes(f.read(2), "little")).decode("utf-8")
                 name = f.read(int.from_bytes(f.read(2), "little")).decode("utf-8")
                 song_name = f.read(int.from_bytes(f.read(2), "little")).decode("utf-8")
@@ -255,15 +592,11 @@ class SSPMLevel(Level):
                     offset = fields["offset"][0]
                     time_signature = [fields["time_signature_num"][0], fields["time_signature_den"][0]]
                     swing = fields["swing"][0]
-                audio = None
-                if has_audio:
-                    with BytesIO(f.read(audio_bitlen)) as buf:
-                        audio = AudioSegment.from_file(buf).set_sample_width(2)
-                cover = None
-                if has_cover:
-                    with BytesIO(f.read(cover_bitlen)) as buf:
-                        with Image.open(buf) as im:
-                            cover = im.copy()
+                # NOTE: Slicing copies the blobs out of the map. They're tiny next to decoding them,
+                #  and it means the map can be closed, so saving over this file later is safe.
+                audio = LazyMedia(f[audio_ptr:audio_ptr + audio_len], decode_audio) if has_audio else None
+                cover = LazyMedia(f[cover_ptr:cover_ptr + cover_len], decode_image) if has_cover else None
+                f.seek(mkdef_ptr)
                 marker_types = {}
                 for i in range(ord(f.read(1))):
                     # Each marker is a pseudo-struct
@@ -273,20 +606,9 @@ class SSPMLevel(Level):
                     for _ in range(ord(f.read(1))):
                         marker_types[marker_id].append(ord(f.read(1)))
                     f.read(1)
-                notes = {}
-                markers = []
-                for i in range(marker_amt):
-                    time = int.from_bytes(f.read(4), "little")
-                    m_type = ord(f.read(1))
-                    if m_type == 0:
-                        if time in notes:
-                            notes[time].append(read_sspmv2_variable(f, 7)[0])
-                        else:
-                            notes[time] = [read_sspmv2_variable(f, 7)[0]]
-                    else:
-                        marker = {"time": time, "m_type": m_type, "fields": []}
-                        for v_type in marker_types[tuple(marker_types.keys())[m_type]]["fields"]:
-                            marker["fields"].append(read_sspmv2_variable(f, v_type))
+                times, xs, ys, markers = read_sspmv2_markers(f[markr_ptr:markr_ptr + markr_len], marker_amt,
+                                                             marker_types)
+                notes = NoteStore(times, xs, ys)
                 return cls(name, authors, notes, cover, audio, difficulty, song_id, song_name=song_name,
                            custom_fields=fields, marker_types=marker_types, markers=markers,
                            modchart=modchart, rating=rating), \
@@ -294,8 +616,9 @@ class SSPMLevel(Level):
             else:
                 raise Exception(f"Unknown version: {version}")
 
-    def save(self, filename, bpm, offset, time_signature, swing):
-        with open(filename, "wb+") as output:
+    def save(self, filename, bpm, offset, time_signature, swing, progress=no_progress):
+        progress(0.0, "Writing metadata")
+        with atomic_open(filename, "wb+") as output:
             self.custom_fields["bpm"] = bpm, 6
             self.custom_fields["swing"] = swing, 6
             self.custom_fields["time_signature_num"] = time_signature[0], 2
@@ -308,8 +631,9 @@ class SSPMLevel(Level):
             output.write((len(self.notes) + len(self.markers)).to_bytes(4, "little"))
             output.write((self.difficulty + 1).to_bytes(1, "little"))
             output.write(self.rating.to_bytes(2, "little"))
-            output.write((self.audio is not None).to_bytes(1, "little"))  # bool is a subclass of int
-            output.write((self.cover is not None).to_bytes(1, "little"))
+            # NOTE: _audio/_cover so this doesn't wait on decoding just to check if there is any
+            output.write((self._audio is not None).to_bytes(1, "little"))  # bool is a subclass of int
+            output.write((self._cover is not None).to_bytes(1, "little"))
             output.write(self.modchart.to_bytes(1, "little"))
             cdata_loc = output.tell()
             output.write(b"\x00" * 8)  # Reserve space for custom data len
@@ -345,26 +669,37 @@ class SSPMLevel(Level):
             output.write(cdata_ptr.to_bytes(8, "little"))
             output.write((cdata_end - cdata_ptr).to_bytes(8, "little"))
             output.seek(cdata_end)
-            if self.audio is not None:
+            if self._audio is not None:
                 audio_ptr = output.tell()
-                with BytesIO() as audio_buf:
-                    self.audio.export(audio_buf, "ogg")
-                    output.write(audio_buf.getvalue())
+                source = self.media_source("audio")
+                if source is not None and source.format in ("ogg", "mp3"):
+                    output.write(source.data)  # Unchanged since loading, no need to re-encode it
+                else:
+                    progress(0.1, "Encoding audio")
+                    with BytesIO() as audio_buf:
+                        self.audio.export(audio_buf, "ogg")
+                        output.write(audio_buf.getvalue())
                 audio_end = output.tell()
                 output.seek(audio_loc)
                 output.write(audio_ptr.to_bytes(8, "little"))
                 output.write((audio_end - audio_ptr).to_bytes(8, "little"))
                 output.seek(audio_end)
-            if self.cover is not None:
+            if self._cover is not None:
                 cover_ptr = output.tell()
-                with BytesIO() as cover_buf:
-                    self.cover.save(cover_buf, "png")
-                    output.write(cover_buf.getvalue())
+                source = self.media_source("cover")
+                if source is not None and source.format == "png":
+                    output.write(source.data)
+                else:
+                    progress(0.7, "Encoding cover")
+                    with BytesIO() as cover_buf:
+                        self.cover.save(cover_buf, "png")
+                        output.write(cover_buf.getvalue())
                 cover_end = output.tell()
                 output.seek(cover_loc)
                 output.write(cover_ptr.to_bytes(8, "little"))
                 output.write((cover_end - cover_ptr).to_bytes(8, "little"))
                 output.seek(cover_end)
+            progress(0.8, "Writing notes")
             mkdef_ptr = output.tell()
             output.write(len(self.marker_types).to_bytes(1, "little"))
             for m_type in self.marker_types:
@@ -380,16 +715,7 @@ class SSPMLevel(Level):
             output.write((mkdef_end - mkdef_ptr).to_bytes(8, "little"))
             output.seek(mkdef_end)
             markr_ptr = output.tell()
-            markers = self.markers.copy()
-            for note in self.notes:
-                for pos in self.notes[note]:
-                    markers.append({"time": note, "m_type": 0, "fields": [pos]})
-            for marker in sorted(markers, key=lambda x: x["time"]):
-                output.write(int(marker["time"]).to_bytes(4, "little"))
-                output.write(marker["m_type"].to_bytes(1, "little"))
-                for i, var in enumerate(marker["fields"]):
-                    var_type = tuple(self.marker_types.values())[marker["m_type"]][i]
-                    write_sspm2_variable(output, var, var_type)
+            write_sspmv2_markers(output, self.notes, self.markers, self.marker_types)
             markr_end = output.tell()
             output.seek(markr_loc)
             output.write(markr_ptr.to_bytes(8, "little"))
@@ -403,30 +729,28 @@ class RawDataLevel(Level):
     @classmethod
     def load(cls, file):
         with open(file) as f:
-            notes = {}
+            times, xs, ys = [], [], []
             data_string = f.read()
             for note in data_string.split(",")[1:]:
                 try:
                     x, y, timing = note.split("|")
-                    x, y = float(x), float(y)
-                    try:
-                        notes[int(timing)].append((x, y))
-                    except KeyError:
-                        notes[int(timing)] = [(x, y)]
+                    x, y, timing = float(x), float(y), int(timing)
+                    times.append(timing)
+                    xs.append(x)
+                    ys.append(y)
                 except ValueError:
                     print(f"/!\\ Invalid note! {note}")
-            return cls(notes=notes), None
+            return cls(notes=NoteStore(times, xs, ys)), None
 
-    def save(self, filename, *_):
-        with open(filename, "w+") as f:
+    def save(self, filename, *_, progress=no_progress):
+        progress(0.0, "Writing notes")
+        with atomic_open(filename, "w") as f:
             output = []
-            for timing, notes in dict(sorted(self.notes.items())).items():
-                for note in notes:
-                    x = 2 - note[0]
-                    y = 2 - note[1]
-                    x = int(x) if int(x) == x else x
-                    y = int(y) if int(y) == y else y
-                    output.append(f"{2 - x}|{2 - y}|{timing}")
+            # NOTE: str() of a float32 is its shortest repr, so 0.3 comes back out as 0.3 (formatting it directly doesn't)
+            for timing, x, y in zip(self.notes.times.tolist(), self.notes.x, self.notes.y):
+                x = int(x) if int(x) == x else x
+                y = int(y) if int(y) == y else y
+                output.append(f"{x!s}|{y!s}|{timing}")
             f.write(self.id + "," + ",".join(output))
 
 
@@ -442,26 +766,21 @@ class VulnusLevel(Level):
         try:
             assert m_data["_version"] == 1, "Unsupported version!"
             song_name = f'{m_data["_artist"]} - {m_data["_title"]}'
-            audio = AudioSegment.from_file(m_data["_music"])
+            with open(m_data["_music"], "rb") as music:
+                audio = LazyMedia(music.read(), decode_audio)
             cover = [Path(name).name for name in glob.glob("./cover*")]
             if len(cover):
                 assert len(cover) < 2, "Multiple covers found! (?????)"
                 with open(cover[0], "rb") as im:
-                    with Image.open(im) as i:
-                        cover = i.copy()
+                    cover = LazyMedia(im.read(), decode_image)
             else:
                 cover = None
             with open(file, "r") as m:
                 level = json.load(m)
             difficulty = level["_name"]
-            notes = {}
-            for note in level["_notes"]:
-                timing = int(note["_time"] * 1000)
-                position = (1 - note["_x"], note["_y"] + 1)
-                if timing in notes:
-                    notes[timing].append(position)
-                else:
-                    notes[timing] = [position]
+            notes = NoteStore([int(note["_time"] * 1000) for note in level["_notes"]],
+                              [1 - note["_x"] for note in level["_notes"]],
+                              [note["_y"] + 1 for note in level["_notes"]])
             metadata = "_sspy" in m_data
             if metadata:
                 bpm = m_data["_sspy"]["bpm"]
@@ -473,12 +792,22 @@ class VulnusLevel(Level):
         return cls(song_name, m_data["_mappers"], notes, cover, audio, difficulty), (
             bpm, offset, time_signature, swing) if metadata else None
 
-    def save(self, filename, bpm, offset, time_signature, swing):
-        if self.audio is not None:
+    def save(self, filename, bpm, offset, time_signature, swing, progress=no_progress):
+        music = "audio.wav"
+        if self._audio is not None:
             print("Exporting audio...")
-            with open("audio.wav", "wb+") as f:
-                self.audio.export(f, format="wav")
+            progress(0.0, "Exporting audio")
+            source = self.media_source("audio")
+            if source is not None and source.format is not None:
+                # Keep whatever format it came in, rather than re-encoding
+                music = f"audio.{source.format}"
+                with atomic_open(music) as f:
+                    f.write(source.data)
+            else:
+                with atomic_open(music, "wb+") as f:
+                    self.audio.export(f, format="wav")
         print("Exporting metadata...")
+        progress(0.6, "Exporting metadata")
         try:  # Load an existing metadata file
             with open("meta.json", "r") as f:
                 metadata = json.load(f)
@@ -486,24 +815,31 @@ class VulnusLevel(Level):
         except FileNotFoundError:
             metadata = {"_difficulties": [f"{filename}.json"]}
         metadata_temp = {"_artist": (self.name.split(" - "))[0], "_title": (self.name.split(" - "))[1],
-                         "_mappers": self.authors, "_music": "audio.wav", "_version": 1, "_sspy": {
+                         "_mappers": self.authors, "_music": music, "_version": 1, "_sspy": {
             "bpm": bpm,
             "time_signature": time_signature,
             "offset": offset,
             "swing": swing
         }}
         metadata |= metadata_temp
-        with open("meta.json", "w+") as m:
+        with atomic_open("meta.json", "w") as m:
             json.dump(metadata, m)
-        if self.cover is not None:
+        if self._cover is not None:
             print("Exporting cover...")
+            progress(0.7, "Exporting cover")
             for path in glob.glob("./cover*"):
-                os.remove(path)
-            self.cover.save("cover.png")
+                if Path(path).name != "cover.png":
+                    os.remove(path)
+            source = self.media_source("cover")
+            with atomic_open("cover.png") as f:
+                if source is not None and source.format == "png":
+                    f.write(source.data)
+                else:
+                    self.cover.save(f, "png")
         print("Exporting notes...")
+        progress(0.8, "Exporting notes")
         level = {"_notes": [], "_name": self.difficulty}
-        for time in self.notes:
-            for note in self.notes[time]:
-                level["_notes"].append({"_time": time / 1000, "_x": 1 - note[0], "_y": note[1] - 1})
-        with open(f"{filename}", "w+") as level_file:
+        for time, x, y in zip(self.notes.times.tolist(), self.notes.x.tolist(), self.notes.y.tolist()):
+            level["_notes"].append({"_time": time / 1000, "_x": 1 - x, "_y": y - 1})
+        with atomic_open(filename, "w") as level_file:
             json.dump(level, level_file)
@@ -3,29 +3,35 @@ import binascii
 import colorsys
 import ctypes
 import hashlib
-import http.client
 import math
 import sys
 import time
 import traceback
 import webbrowser
-from more_itertools import locate
 from zipfile import ZipFile
-from tkinter import filedialog
 from ctypes import POINTER, c_int
 
 import OpenGL.GL as GL
 import imgui
 import pydub.exceptions
 import sdl2
-from pydub.exceptions import TooManyMissingFrames
-from pydub.playback import _play_with_simpleaudio
-from pypresence import Presence
-from scipy.interpolate import \
-    CubicSpline  # NOTE:  god i wish scipy had partial downloads like "scipy[interpolate]" like i don't need all of math to make. a spline
 
 from src.level import *  # this is fine, i know what's there
+from src.assets import ASSET_DIR, load_rgba
+from src.beatgrid import BEAT, MEASURE, BeatGrid, timeline_grid
+from src.cursor import cursor_trail
+from src.history import History
+from src.jobs import Job
+from src.journal import Journal
+from src.mixer import Mixer, NullOutput, SDLOutput
+from src.pacing import FramePacer
+from src.pcmcache import PCMCache
+from src.presence import PresenceWorker
+from src.profiling import FrameProfile, StartupProfile
+from src.render import NOTE_INSTANCE, CachedLayer, NoteRenderer
 from src.timings import import_timings
+from src.transforms import COLLISION_NAMES, KEEP_BOTH, BulkEdit, NoteTransform, grid_ticks
+from src.waveform import WaveformPeaks
 
 # Initialize constants
 
@@ -40,10 +46,6 @@ TIMING_GAMES = (
 )
 FORMAT_EXTS: tuple = ("*.sspm", "*.txt", "*.json")
 DIFFICULTIES: tuple = ("Unspecified", "Easy", "Medium", "Hard", "LOGIC?", "Tasukete")
-HITSOUND = AudioSegment.from_file(f"{SCRIPT_DIR + os.sep}assets{os.sep}hit.wav").set_sample_width(2)
-MISSSOUND = AudioSegment.from_file(f"{SCRIPT_DIR + os.sep}assets{os.sep}miss.wav").set_sample_width(2)
-METRONOME_M = AudioSegment.from_file(f"{SCRIPT_DIR + os.sep}assets{os.sep}metronome_measure.wav").set_sample_width(2)
-METRONOME_B = AudioSegment.from_file(f"{SCRIPT_DIR + os.sep}assets{os.sep}metronome_beat.wav").set_sample_width(2)
 VAR_TYPES = ["8-bit Unsigned Integer",
              "16-bit Unsigned Integer",
              "32-bit Unsigned Integer",
@@ -57,21 +59,9 @@ VAR_TYPES = ["8-bit Unsigned Integer",
              "Long String",
              "Array"]
 VAR_DEFAULTS = [0, 0, 0, 0, 0.0, 0.0, (0.0, 0.0), b"", "", b"", "", [[0, 1, 1]]]
-
-
-class DummyRPC:
-    """
-    For when the user doesn't have internet.
-    """
-
-    def __init__(self):
-        pass
-
-    def connect(self):
-        pass
-
-    def update(self, *args, **kwargs):
-        pass
+TIMELINE_STEP = 30000  # How far the timeline grows at a time once the view goes past the end of the level
+GRID_CHUNK = 30000  # The playfield beat grid gets built this many ms at a time
+HITSOUND_WINDOW = 10000  # Hitsounds get scheduled this many ms either side of the playhead
 
 
 class DelayedRect:
@@ -88,26 +78,60 @@ class DelayedRect:
             draw_list.add_rect(*self.box, self.color, self.thickness)
 
 
+class DelayedRects:
+    """
+    A batch of same-colored filled rects, with the boxes as an (n, 4) array.
+    """
+
+    def __init__(self, boxes, color: int):
+        self.boxes = boxes
+        self.color = color
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def draw(self, draw_list, offset=(0, 0)):
+        for box in (self.boxes + (*offset, *offset)).tolist():
+            draw_list.add_rect_filled(*box, self.color)
+
+
+TK_ROOT = None
+
+
+def load_sound(name):
+    # Built-in sounds are plain PCM wavs, the mixer reads them itself on first use instead of going through ffmpeg
+    return ASSET_DIR / name
+
+
+def cubic_spline(x, y):
+    # NOTE: god i wish scipy had partial downloads like "scipy[interpolate]" like i don't need all of math to make. a spline
+    # It's slow to import, so it only gets imported once there's a spline to make
+    from scipy.interpolate import CubicSpline
+    return CubicSpline(x, y)
+
+
+def file_dialogs():
+    """tkinter's filedialog. Tk is slow to start, so its hidden root window only gets made the first time."""
+    global TK_ROOT
+    from tkinter import Tk, filedialog
+    if TK_ROOT is None:
+        TK_ROOT = Tk()
+        TK_ROOT.withdraw()
+    return filedialog
+
+
 def spline(nodes, count):
     nodes = [(key, *value) for key, value in sorted(nodes.items())]
     nodes = np.array(nodes, dtype=np.float64)
     notes = {}
     start = min(nodes[:, 0])
     end = max(nodes[:, 0])
-    cs = CubicSpline(nodes[:, 0], nodes[:, 1:])
+    cs = cubic_spline(nodes[:, 0], nodes[:, 1:])
     for time in np.linspace(start, end, count):
         notes[time] = cs(time)
     return notes
 
 
-def play_at_position(audio, position):
-    try:
-        cut_audio = audio[int(position * 1000):]
-    except TooManyMissingFrames:
-        return None
-    return _play_with_simpleaudio(cut_audio)
-
-
 def adjust(x, s): return (((round(((x) / 2) * (s - 1)) / (s - 1)) * 2)) if s != 0 else x
 
 
@@ -130,12 +154,14 @@ def get_time_color():
 
 class Editor:
     def __init__(self):
+        self.profile = StartupProfile()
         self.displayed_markers = []
         self.adding_marker_type = ""
         self.adding_field = ""
         self.background_size = (0, 0)
         self.times_to_display = None
         self.notes_changed = False
+        self.cover_pending = False
         self.starting_position = None
         self.starting_time = None
         self.GITHUB_ICON_ID = None
@@ -162,7 +188,16 @@ class Editor:
         self.time = 0
         self.playing = False
         self.changed_since_save = False
-        self.playback = None
+        self.new_song = None  # From "Change song", swapped in once it's decoded
+        self.mixer = Mixer()
+        self.pcm_cache = PCMCache(self.mixer.frame_rate, self.mixer.channels)
+        self.audio_output = None
+        self.mixer_keys = {}
+        self.hitsound_window = None
+        self.HIT_SOUND = self.mixer.add_sound(load_sound("hit.wav"))
+        self.MISS_SOUND = self.mixer.add_sound(load_sound("miss.wav"))
+        self.METRONOME_M = self.mixer.add_sound(load_sound("metronome_measure.wav"))
+        self.METRONOME_B = self.mixer.add_sound(load_sound("metronome_beat.wav"))
         self.time_signature = (4, 4)
         self.beat_divisor = 4
         self.note_snapping = 3, 3
@@ -170,7 +205,10 @@ class Editor:
         self.draw_audio = False
         self.fps_cap = 100
         self.vsync = False
-        self.rects_drawn = 0
+        self.frame_profile = FrameProfile()
+        # Waits without taking the event, so the poll loop still gets it
+        self.frame_pacer = FramePacer(lambda timeout: sdl2.SDL_WaitEventTimeout(None, int(timeout * 1000)) == 1)
+        self.show_frame_timings = False
         self.rounding = 0
         self.volume = 0
         self.waveform_res = 4
@@ -206,24 +244,88 @@ class Editor:
         self.playtesting = False
         self.sensitivity = 2.0
         self.unique_label_counter = 0
-        self.RPC = Presence(1032430090505703486)
+        self.presence = None
         self.displayed_markers = []
+        self.save_job = None
+        self.queued_save = None
+        self.journal = None  # Edits since the last save, for when the editor dies before the next one
+        self.save_mark = None  # (journal, where it was up to) when the running save started
+        self.recovered_edits = 0
+        self.history = History()
+        self.gpu_notes = True
+        self.note_renderer = None
+        self.timeline_layer = None
+        self.timeline_key = None
+        self.timeline_batches = []
+        self.cached_beat_grid = None
+        self.cached_bulk_edit = None
 
-    def speed_change(self, sound, speed=1.0):
-        if speed < 0:
-            sound = sound.reverse()
-        try:
-            assert sound.duration_seconds / speed < 3600, "The audio that was going to be played is too large.\nIf you want to circumvent this check, go to line 133 in src/loop.py and remove lines 211 through 220."
-            assert abs(
-                speed) * sound.frame_rate < 2147483647, "The audio that was going to be played is too fast, and the speed in samples can't be converted to a C integer."
-        except AssertionError as e:
-            self.error = e
-            self.playing = False
-            return AudioSegment.silent(duration=1)
-        sound_with_altered_frame_rate = sound._spawn(sound.raw_data, overrides={
-            "frame_rate": int(sound.frame_rate * abs(speed))
-        })
-        return sound_with_altered_frame_rate.set_frame_rate(sound.frame_rate)
+    def start_playback(self, seek=False):
+        """
+        Start the mixer from the current time, with the song if there is one.
+        With seek, the song that's already playing jumps there instead.
+        """
+        song, position = None, 0
+        audio = self.level.loaded("audio")  # Plays without the song until it's decoded
+        if audio is not None:
+            try:
+                song = self.pcm_cache.get(audio, self.audio_speed, self.volume)
+            except AssertionError as e:
+                self.error = e
+                self.playing = False
+                return
+            position = ((self.time) / 1000) / self.audio_speed
+            if position < 0:  # Reversed, so count back from the end
+                position += song.shape[0] / self.mixer.frame_rate
+        self.update_mixer()  # The schedule has to cover where it's starting from before any of it gets mixed
+        if seek:
+            self.mixer.seek(position, self.time)
+        else:
+            self.mixer.play(song, position, self.time, self.audio_speed)
+
+    def prefetch_audio(self):
+        """Get the song ready for the current speed and volume in the background, before play gets pressed."""
+        if self.level is not None and self.level.loaded("audio") is not None:
+            self.pcm_cache.prefetch(self.level.audio, self.audio_speed, self.volume)
+
+    def update_mixer(self):
+        """
+        Hand the mixer new hitsound and metronome schedules, but only when something they depend on changed.
+        Hitsounds only get scheduled in a window around the playhead, so an edit costs the notes in there
+        instead of all of them. It moves along once the playhead gets halfway to either edge.
+        """
+        if self.level is None:
+            return
+        notes = self.level.notes
+        window = self.hitsound_window
+        if window is None or not window[0] + HITSOUND_WINDOW / 2 <= self.time <= window[1] - HITSOUND_WINDOW / 2:
+            window = self.hitsound_window = (self.time - HITSOUND_WINDOW, self.time + HITSOUND_WINDOW)
+        key = (id(notes), notes.version, window, self.hitsounds, self.playtesting, self.hitsound_offset,
+               self.audio_speed, self.hitsound_panning, self.vis_map_size)
+        if self.mixer_keys.get("hitsounds") != key:
+            self.mixer_keys["hitsounds"] = key
+            if self.hitsounds and not self.playtesting:  # Playtesting needs the cursor, so those get triggered live
+                offset = self.hitsound_offset / self.audio_speed
+                lo, hi = notes.span(window[0] + offset, window[1] + offset)  # Never splits up notes sharing a time
+                times, x = notes.times[lo:hi], notes.x[lo:hi]
+                keep = (np.arange(times.shape[0]) - np.searchsorted(times, times, "left")) < 8  # Max 8 per time
+                pans = ((x[keep] - 1) / (self.vis_map_size / 2)) * self.hitsound_panning
+                self.mixer.schedule("hitsounds", times[keep] - offset, self.HIT_SOUND, pans)
+            else:
+                self.mixer.schedule("hitsounds")
+        audio = self.level.loaded("audio")
+        end = max(self.level.get_end() + 1000, audio.duration_seconds * 1000 if audio is not None else 0)
+        key = (self.metronome, self.bpm, self.offset, tuple(self.time_signature), int(end))
+        if self.mixer_keys.get("metronome") != key:
+            self.mixer_keys["metronome"] = key
+            if self.metronome and self.bpm:
+                ms_per_beat = (60000 / self.bpm) * (4 / self.time_signature[1])
+                beats = np.arange(math.ceil(-self.offset / ms_per_beat), end / ms_per_beat + 1, dtype=np.int64)
+                on_measure = beats % max(self.time_signature[0], 1) == 0
+                self.mixer.schedule("metronome", beats * ms_per_beat + self.offset,
+                                    np.where(on_measure, self.METRONOME_M, self.METRONOME_B))
+            else:
+                self.mixer.schedule("metronome")
 
     def adjust_swing(self, beat):
         b = (beat % 2)
@@ -233,6 +335,99 @@ class Editor:
         else:
             return (beat - b) + (((2 * s) / (2 - 2 * s)) * (b - 2 * s) + 2 - 2 * s)
 
+    def beat_grid(self, start, end):
+        """
+        A beat grid covering start to end ms. It's built a GRID_CHUNK at a time, so it only gets rebuilt when
+        the timing settings change or the view moves out of it.
+        """
+        timing = (self.bpm, self.offset, self.swing, tuple(self.time_signature), self.beat_divisor)
+        grid = self.cached_beat_grid
+        if grid is None or grid.key[:5] != timing or start < grid.start or end > grid.end:
+            self.cached_beat_grid = BeatGrid(*timing, math.floor(start / GRID_CHUNK) * GRID_CHUNK,
+                                             (math.floor(end / GRID_CHUNK) + 1) * GRID_CHUNK)
+        return self.cached_beat_grid
+
+    def plan_transform(self, start, end, transform, collisions):
+        """The BulkEdit for the Transform Notes window, only worked out again when something it depends on changes."""
+        notes = self.level.notes
+        timing = (self.bpm, self.offset, self.swing, tuple(self.time_signature), self.beat_divisor)
+        key = (notes, notes.version, start, end, transform.key(), collisions, timing if transform.quantize else None)
+        if self.cached_bulk_edit is None or self.cached_bulk_edit[0] != key:
+            grid = None
+            if transform.quantize and self.bpm > 0:
+                # Only as much grid as the moved notes can reach, plus a measure either side so they all have
+                # a tick before and after them
+                lo, hi = notes.span(start, end + 1)
+                ends = notes.times[[lo, hi - 1]] if hi > lo else np.array((start, start))
+                reach = (ends - start) * transform.scale + start + transform.shift
+                measure = (60000 / self.bpm) * 4 * self.time_signature[0]
+                grid = grid_ticks(*timing, reach.min() - measure, reach.max() + measure)
+            self.cached_bulk_edit = key, BulkEdit(notes, start, end, transform, collisions, grid)
+        return self.cached_bulk_edit[1]
+
+    def timeline_width(self):
+        """
+        How many ms the timeline spans. Past the end of the level it grows in TIMELINE_STEP chunks instead of
+        following the view, or the cached timeline would get rebuilt every frame while playing off the end.
+        """
+        end = max(self.level.get_end() + 1000, 1)
+        view_end = self.time + self.approach_rate
+        if view_end <= end:
+            return end
+        return end + math.ceil((view_end - end) / TIMELINE_STEP) * TIMELINE_STEP
+
+    def timeline_cache_key(self, timeline_width, w, waveform, waveform_width):
+        """Everything the static part of the timeline depends on. It only gets redrawn when this changes."""
+        markers = None
+        if self.bpm and isinstance(self.level, SSPMLevel):
+            markers = tuple(marker["time"] for marker in self.level.markers)
+        return (int(w), self.timeline_height, int(timeline_width), id(self.level.notes), self.level.notes.version,
+                self.draw_notes, self.draw_audio, self.waveform_res, waveform_width, id(waveform),
+                waveform is not None and waveform.ready, self.bpm, self.offset, self.swing, tuple(self.time_signature),
+                self.beat_divisor, self.bpm_markers, markers)
+
+    def build_timeline(self, timeline_width, w, waveform, waveform_width):
+        """
+        The parts of the timeline that don't move with the playhead, as DelayedRects batches.
+        Boxes are relative to the timeline's top left corner.
+        """
+        height = self.timeline_height
+        batches = [DelayedRects(np.array(((0, 0, w, height),), dtype=np.float64), 0x80404040)]
+        if (self.level.loaded("audio") is not None and waveform is not None and waveform.ready and waveform.extent
+                and self.draw_audio and height > 20):
+            center = height / 2
+            length = waveform.frame_rate * timeline_width / 1000
+            columns = np.arange(0, waveform_width, self.waveform_res)
+            mins, maxs, valid = waveform.peaks(
+                0, length * (columns.shape[0] * self.waveform_res) / waveform_width, columns.shape[0])
+            scale = (height // 2) / (waveform.extent / 0.8)
+            left = ((w / waveform_width) * columns).astype(np.int64)
+            boxes = np.column_stack((left, center + (maxs * scale).astype(np.int64),
+                                     left + self.waveform_res, center + (mins * scale).astype(np.int64)))[valid]
+            batches.append(DelayedRects(boxes, 0x20ffffff))
+        if self.draw_notes:
+            times = self.level.get_notes()
+            left = (w * (times / timeline_width)).astype(np.int64)
+            boxes = np.column_stack((left, np.zeros_like(left), left + 1, np.full_like(left, int(height * 0.2))))
+            for i, color in enumerate(self.colors):
+                batches.append(DelayedRects(boxes[i::len(self.colors)], (color & 0xFFFFFF) | 0x40000000))
+        if self.bpm:
+            if isinstance(self.level, SSPMLevel):
+                times = np.array([marker["time"] for marker in self.level.markers], dtype=np.float64)
+                left = (w * (times / timeline_width)).astype(np.int64)
+                batches.append(DelayedRects(np.column_stack((left, np.full_like(left, int(height * 0.6)), left + 1,
+                                                             np.full_like(left, int(height * 0.8)))), 0x00ff00ff))
+            if self.bpm_markers:
+                grid = timeline_grid(self.bpm, self.offset, self.swing, self.time_signature, self.beat_divisor,
+                                     timeline_width)
+                times, kinds = grid.times, grid.kinds
+                left = (w * (times / timeline_width)).astype(np.int64)
+                top = height * np.array((0.9, 0.8, 0.7))[kinds]
+                boxes = np.column_stack((left, top, left + 1, np.full(left.shape, height)))
+                batches.append(DelayedRects(boxes[kinds != MEASURE], 0x800000ff))
+                batches.append(DelayedRects(boxes[kinds == MEASURE], 0xff0000ff))
+        return batches
+
     def display_marker_type(self, index, name, types, readonly=False):
         any_changed = False
         if not isinstance(types, list):
@@ -376,9 +571,9 @@ class Editor:
             changed, value = self.open_file_dialog(
                 {"Image": "*.png *.jpg *.bmp *.gif *.webp"})
             if changed:
-                with Image.open(value) as im:
-                    self.level.cover = im.copy()
-                    self.create_image(self.level.cover, self.COVER_ID)
+                with open(value, "rb") as f:  # Keep the file's bytes around so saving doesn't re-encode it
+                    self.level.cover = LazyMedia(f.read(), decode_image)
+                self.create_image(self.level.cover, self.COVER_ID)
                 self.changed_since_save = True
                 self.time_since_last_change = time.time()
         if imgui.is_item_hovered():
@@ -477,9 +672,9 @@ class Editor:
             changed, value = self.open_file_dialog(
                 {"Image": "*.png *.jpg *.bmp *.gif *.webp"})
             if changed:
-                with Image.open(value) as im:
-                    self.level.cover = im.copy()
-                    self.create_image(self.level.cover, self.COVER_ID)
+                with open(value, "rb") as f:  # Keep the file's bytes around so saving doesn't re-encode it
+                    self.level.cover = LazyMedia(f.read(), decode_image)
+                self.create_image(self.level.cover, self.COVER_ID)
                 self.changed_since_save = True
                 self.time_since_last_change = time.time()
         if imgui.is_item_hovered():
@@ -491,20 +686,53 @@ class Editor:
             self.changed_since_save = True
 
     def open_file_dialog(self, extensions: dict[str, str]):
-        v = filedialog.askopenfilename(title="Open a file",
-                                       initialdir=self.current_folder,
-                                       filetypes=tuple(extensions.items()))
+        v = file_dialogs().askopenfilename(title="Open a file",
+                                           initialdir=self.current_folder,
+                                           filetypes=tuple(extensions.items()))
         return bool(len(v)), v
 
     def save_file_dialog(self, suffix):
-        v = filedialog.asksaveasfilename(title="Save a file",
-                                         initialdir=self.current_folder,
-                                         filetypes=tuple(suffix.items()))
+        v = file_dialogs().asksaveasfilename(title="Save a file",
+                                             initialdir=self.current_folder,
+                                             filetypes=tuple(suffix.items()))
         return bool(len(v)), v
 
     def keys(self):
         return tuple(self.io.keys_down)
 
+    def frame_timings_window(self):
+        """Per-section frame timings and a graph of recent frame times. Returns whether it's still open."""
+        imgui.set_next_window_size(0, 0)
+        expanded, opened = imgui.begin("Frame Timings", True)
+        if expanded:
+            frame_times = self.frame_profile.frame_times()
+            if frame_times.size:
+                imgui.plot_lines("##frame_times", frame_times, overlay_text=f"{frame_times[-1]:.2f} ms",
+                                 scale_min=0, scale_max=max(float(frame_times.max()), 1000 / self.fps_cap),
+                                 graph_size=(320, 60))
+            imgui.columns(4, border=False)
+            for label in ("Section", "Mean", "p95", "Max"):
+                imgui.text(label)
+                imgui.next_column()
+            imgui.separator()
+            for name, mean, p95, peak in self.frame_profile.stats():
+                imgui.text(name)
+                imgui.next_column()
+                for ms in (mean, p95, peak):
+                    imgui.text(f"{ms:.2f}")
+                    imgui.next_column()
+            imgui.columns(1)
+            imgui.text(f"ms, over the last {min(self.frame_profile.frames, self.frame_profile.capacity)} frames")
+            if imgui.button("Export CSV"):
+                changed, value = self.save_file_dialog({"CSV": "*.csv"})
+                if changed:
+                    try:
+                        self.frame_profile.export_csv(value)
+                    except OSError as e:
+                        self.error = e
+        imgui.end()
+        return opened
+
     def time_scroll(self, y, keys, ms_per_beat):
         if self.level is not None:
             # Check modifier keys
@@ -529,14 +757,17 @@ class Editor:
                 self.time = max(self.time + increment * y, 0)
 
     def create_image(self, im, tex_id) -> int:
-        texture_data = im.convert("RGBA").tobytes()  # Get the image's raw data for GL
+        if isinstance(im, np.ndarray):  # Already decoded RGBA, from load_rgba
+            texture_data, size = np.ascontiguousarray(im).tobytes(), (im.shape[1], im.shape[0])
+        else:
+            texture_data, size = im.convert("RGBA").tobytes(), im.size  # Get the image's raw data for GL
         # Bind and set the texture at the id
         GL.glBindTexture(GL.GL_TEXTURE_2D, tex_id)
         GL.glClearColor(0, 0, 0, 0)
         GL.glClear(GL.GL_COLOR_BUFFER_BIT)
         GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAG_FILTER, GL.GL_LINEAR)
         GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER, GL.GL_LINEAR)
-        GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, GL.GL_RGBA, im.size[0], im.size[1], 0, GL.GL_RGBA,
+        GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, GL.GL_RGBA, size[0], size[1], 0, GL.GL_RGBA,
                         GL.GL_UNSIGNED_BYTE, texture_data)
         return tex_id  # NOTE: returning it makes things easier
 
@@ -568,43 +799,111 @@ class Editor:
             self.error = e
             return False
         if self.error is None:
+            self.open_journal(filename)
             self.notes_changed = True
             self.times_to_display = None
             # Initialize song variables
-            self.create_image(
-                self.NO_COVER if self.level.cover is None else self.level.cover.resize((192, 192), Image.LINEAR),
-                self.COVER_ID)
+            # The cover might still be decoding (or have failed to), so it always gets swapped in by the frame loop,
+            # which knows what to do when decoding went wrong
+            self.cover_pending = True
+            self.create_image(self.NO_COVER, self.COVER_ID)
             self.time = 0
             self.playing = False
             self.filename = filename
+            self.sync_edits()  # Start recording the new notes straight away
+            self.new_song = None  # Was meant for the old level
             self.timings = np.array((), dtype=np.int64)
             return True
 
+    def open_journal(self, filename):
+        """Start journaling edits to the level that was just loaded, replaying whatever a crash left behind first."""
+        if self.journal is not None:
+            self.journal.close()
+        self.journal = None
+        try:
+            journal = Journal(filename)
+            recovered = journal.read()
+            if recovered is not None:
+                records, end = recovered
+                for field, value in journal.replay(records, self.level).items():
+                    setattr(self, field, value)
+                self.changed_since_save = True
+                self.recovered_edits = len(records)
+            journal.start(self.level, self, resume_at=None if recovered is None else end)
+        except Exception as e:  # Read-only folder or a mangled journal, the level itself still loaded fine
+            self.error = e
+            return
+        self.journal = journal
+
+    def touch_markers(self):
+        """Markers get edited in place, so the journal has to be told to look at them again."""
+        if self.journal is not None:
+            self.journal.touch("markers")
+
+    def take_edits(self):
+        """The note edits made since the last call. A level's notes start recording the first time they're seen."""
+        if self.level is None:
+            return []
+        notes = self.level.notes
+        if notes.edits is None:
+            notes.edits = []
+        edits, notes.edits = notes.edits, []
+        return edits
+
+    def sync_edits(self, record=True):
+        """
+        Hand this frame's note edits to undo (unless they're from undoing) and the journal.
+        Levels that haven't been saved anywhere yet don't get a journal.
+        """
+        edits = self.take_edits()
+        if record and self.level is not None:
+            self.history.record(self.level.notes, edits)
+        if self.journal is None:
+            return
+        if self.filename is None or Path(self.filename).resolve() != self.journal.filename:
+            self.journal.close()
+            self.journal = None
+            return
+        try:
+            # Not every metadata field marks the level as changed when it's edited, but anything journaled is unsaved
+            if self.journal.update(self.level, self, edits):
+                self.changed_since_save = True
+        except OSError as e:
+            self.error = e
+            self.journal.close()
+            self.journal = None
+
+    def undo(self, redo=False):
+        if self.level is None:
+            return
+        self.sync_edits()  # So whatever was done this frame is its own step
+        if self.history.redo() if redo else self.history.undo():
+            self.sync_edits(record=False)
+            self.notes_changed = True
+            self.times_to_display = None
+            self.changed_since_save = True
+            self.time_since_last_change = time.time()
+
     def start(self, window, impl, font, default_font, *_):
         self.io = imgui.get_io()
 
         event = sdl2.SDL_Event()
 
         # Initialize variables
-        # Only connect if connected to the internet
-        conn = http.client.HTTPSConnection("1.1.1.1", timeout=5)
-        try:
-            conn.request("HEAD", "/")
-            self.RPC.connect()
-        except:
-            self.RPC = DummyRPC()
+        # Connecting happens on the worker, so being offline doesn't hold up the first frame
+        self.presence = PresenceWorker(1032430090505703486)
         start_time = time.time()
         running = True
         old_audio = None
         cursor = "arrow"
         sdl2_cursor = None
-        audio_data = None
+        waveform = None
         space_last = False
         was_playing = False
+        played_time = None
         was_resizing_timeline = False
         last_hitsound_times = np.zeros((0), dtype=np.int64)
         old_mouse = (0, 0, 0, 0, 0)
-        old_beat = 0
         tex_ids = GL.glGenTextures(3)  # NOTE: Update this when you add more images
         note_offset = None
         old_keys = self.keys()
@@ -612,7 +911,6 @@ class Editor:
         keys_pressed = []
         cursor_positions = [[0, 0]]
         level_was_active = False
-        extent = 0
         spline_nodes = {}
         spline_display_notes = {}
         spline_amount = 5
@@ -621,47 +919,101 @@ class Editor:
         tap_timings_window_open = False
         bulk_delete_start_time = 0
         bulk_delete_end_time = 0
-        cursor_spline = None
-        name_id = -1
+        transform_window_open = False
+        transform_start_time = 0
+        transform_end_time = 0
+        note_transform = NoteTransform()
+        transform_collisions = KEEP_BOTH
+        transform_preview = None
+        name_id = None
+        window_title = None
+        presence_level = None
         timeline_width = 0
         dragging_timeline = False
         ms_per_beat = 0
+        recovered_edits = 0
         edit_markers_window_open = False
         marker_add_index = 0
         timings_quantize = True
         easter_egg_activated = False
 
         # Load constant textures
-        with Image.open(f"{SCRIPT_DIR + os.sep}assets{os.sep}nocover.png") as im:
-            self.NO_COVER = im.copy()
-            self.COVER_ID = self.create_image(self.NO_COVER, int(tex_ids[0]))
-        with Image.open(f"{SCRIPT_DIR + os.sep}assets{os.sep}github.png") as im:
-            self.GITHUB_ICON_ID = self.create_image(im, int(tex_ids[1]))
+        self.NO_COVER = load_rgba("nocover.png")
+        self.COVER_ID = self.create_image(self.NO_COVER, int(tex_ids[0]))
+        self.GITHUB_ICON_ID = self.create_image(load_rgba("github.png"), int(tex_ids[1]))
         background_glob = glob.glob(f"{SCRIPT_DIR + os.sep}background.*")
         if len(background_glob):
             with Image.open(background_glob[0]) as im:
                 self.BACKGROUND = self.create_image(im, int(tex_ids[2]))
                 self.background_size = im.size
+        self.profile.mark("textures")
+        try:
+            self.note_renderer = NoteRenderer()
+        except Exception as e:  # Old GPU or driver, the draw list path still works
+            print(f"/!\\ GPU note rendering isn't available, falling back to the draw list: {e}")
+            self.note_renderer = None
+        else:
+            self.timeline_layer = CachedLayer()
+        self.profile.mark("shaders")
+        try:
+            self.audio_output = SDLOutput(self.mixer)
+        except Exception as e:  # No sound card, keep going without sound
+            print(f"/!\\ Couldn't open the audio device, playing without sound: {e}")
+            self.audio_output = NullOutput(self.mixer)
+        self.profile.mark("audio device")
         # Handle opening a file with the program
         if len(sys.argv) > 1:
             self.load_file(sys.argv[1])
+            self.profile.mark("open level")
         while running:
-            self.rects_drawn = 0
+            self.frame_profile.start_frame()
             dt = time.perf_counter_ns()
-            # Check if the audio data needs to be updated
+            # Check if the waveform needs to be rebuilt
+            # NOTE: AudioSegment's == compares the raw data, don't use it here
             if self.level is not None:
-                if self.level.audio is not None:
-                    if self.level.audio != old_audio:
-                        audio_data = np.array(self.level.audio.get_array_of_samples())
-                        extent = np.max(np.abs(audio_data))
-                        old_audio = self.level.audio
+                if self.cover_pending and not self.level.pending("cover"):
+                    self.cover_pending = False
+                    try:
+                        if self.level.cover is not None:
+                            self.create_image(self.level.cover.resize((192, 192), Image.LINEAR), self.COVER_ID)
+                    except Exception as e:  # Decoding failed in the background
+                        self.error = e
+                        self.level.cover = None
+                if self.new_song is not None and self.new_song.ready:
+                    # Only replace the old song once the new one is known to work
+                    new_song, self.new_song = self.new_song, None
+                    try:
+                        new_song.get()
+                        self.level.audio = new_song
+                        self.changed_since_save = True
+                        self.time_since_last_change = time.time()
+                    except pydub.exceptions.CouldntDecodeError:
+                        self.error = Exception("Audio file couldn't be read! It might be corrupted.")
+                    except Exception as e:
+                        self.error = e
+                if not self.level.pending("audio"):
+                    try:
+                        audio = self.level.audio
+                    except Exception as e:
+                        self.error = e
+                        audio = self.level.audio = None
+                    if audio is not old_audio:
+                        # Everything built from the old song is stale now
+                        waveform = WaveformPeaks(audio) if audio is not None else None
+                        old_audio = audio
+                        self.prefetch_audio()
+                        if self.playing and was_playing:
+                            self.start_playback()
+                            self.starting_time = time.perf_counter_ns()
+                            self.starting_position = self.time
+            self.poll_save()
+            self.frame_profile.lap("media")
             impl.process_inputs()
             imgui.new_frame()
             keys = self.keys()
             keys_changed = []
             if old_keys != keys:
-                keys_changed = locate([a and not b for a, b in zip(keys, old_keys)])
-                keys_changed = [*keys_changed]
+                keys_changed = [i for i, (a, b) in enumerate(zip(keys, old_keys)) if a and not b]
                 keys_pressed.extend(keys_changed)
                 if tuplehash(keys_pressed) == 3693585790315968031:  # it's more fun if you find out how to do it legit but i won't be mad if you just remove this check
                     easter_egg_active = not easter_egg_active
@@ -679,72 +1031,64 @@ class Editor:
                 space_last = True
             elif space_last:
                 space_last = False
+            if keys[sdl2.SDL_SCANCODE_F3] and not old_keys[sdl2.SDL_SCANCODE_F3]:
+                self.show_frame_timings = not self.show_frame_timings
+            self.frame_profile.lap("input")
+            self.update_mixer()
+            if self.audio_output is not None and self.audio_output.error is not None:
+                self.error, self.audio_output.error = self.audio_output.error, None
             if self.playing and not was_playing:
-                if self.level.audio is not None:
-                    self.playback = play_at_position(
-                        self.speed_change(self.level.audio + self.volume, self.audio_speed),
-                        ((self.time) / 1000) / self.audio_speed)
+                self.start_playback()
                 self.starting_time = time.perf_counter_ns()
                 self.starting_position = self.time
             elif not self.playing and was_playing:
-                if self.playback is not None:
-                    del self.starting_time  # NOTE: Deleting these variables when they're not needed makes it easier to figure out that
-                    del self.starting_position  # these are being accessed when they shouldn't be.
-                    self.playback.stop()
-                    self.playback = None
+                del self.starting_time  # NOTE: Deleting these variables when they're not needed makes it easier to figure out that
+                del self.starting_position  # these are being accessed when they shouldn't be.
+                self.mixer.stop()
                 if self.bpm:
                     # Snap the current time to the nearest quarter of a beat, for easier scrolling through
                     # TODO: make this snap with swing
                     self.snap_time()
-            # Fix playback not working when playing in reverse (speed < 0)
-            # This keeps going until it's being played
-            if (self.playing
-                    and self.playback is None
-                    and self.level.audio is not None
-                    and self.time / 1000 <= self.level.audio.duration_seconds):
-                self.playback = play_at_position(self.speed_change(self.level.audio + self.volume, self.audio_speed),
-                                                 ((self.time) / 1000) / self.audio_speed)
-            # Set the window name
-            # FIXME: The self.RPC code is kind of spaghetti.
+            self.frame_profile.lap("hitsounds")
+            # Set the window name and rich presence
+            # Presence only gets sent when something in it changed, and the worker rate limits it from there
+            idle = (time.time() - self.time_since_last_change) > 600
             if sys.gettrace() is not None:
-                if name_id != -1 or (time.time() % 15 < 0.1):
-                    name_id = -1
-                self.RPC.update(state="Developing", small_image="icon", start=start_time,
-                                buttons=[{"label": "GitHub", "url": "https://github.com/balt-dev/SSpy/"}])
-            elif self.level is None or (time.time() - self.time_since_last_change) > 600:  # Is a level open?
-                if name_id != 0:
-                    name_id = 0
-                    if (time.time() - self.time_since_last_change) <= 600:  # Did they leave the app open?
-                        sdl2.SDL_SetWindowTitle(window, "SSPy".encode("utf-8"))
-                    self.RPC.update(state="Idling", small_image="icon", start=start_time,
-                                    buttons=[{"label": "GitHub", "url": "https://github.com/balt-dev/SSpy/"}])
-            elif self.filename is None:
-                if name_id != 1 or (time.time() % 15 < 0.1):  # Does the level exist as a file?
-                    name_id = 1
-                    sdl2.SDL_SetWindowTitle(window, "*Unnamed - SSPy".encode("utf-8"))
-                    self.RPC.update(details="Editing an unnamed level", small_image="icon",
-                                    state=f"{self.level.get_end() / 1000:.1f} seconds long, {len(self.level.get_notes())} notes",
-                                    start=start_time,
-                                    buttons=[{"label": "GitHub", "url": "https://github.com/balt-dev/SSpy/"}])
+                new_name_id = -1
+            elif self.level is None or idle:  # Is a level open? Did they leave the app open?
+                new_name_id = 0
+            elif self.filename is None:  # Does the level exist as a file?
+                new_name_id = 1
             else:
-                level_path = Path(self.filename).name
-                if self.changed_since_save:
-                    if name_id != 2 or (time.time() % 15 < 0.1):  # Has the level been saved?
-                        name_id = 2
-                        sdl2.SDL_SetWindowTitle(window, f"*{level_path} - SSPy".encode("utf-8"))
-                        self.RPC.update(details=f"Editing {level_path}", small_image="icon",
-                                        state=f"{self.level.get_end() / 1000:.1f} seconds long, {len(self.level.get_notes())} notes",
-                                        start=start_time,
-                                        buttons=[{"label": "GitHub", "url": "https://github.com/balt-dev/SSpy/"}])
-                elif name_id != 3 or (time.time() % 15 < 0.1):
-                    name_id = 3
-                    sdl2.SDL_SetWindowTitle(window, f"{level_path} - SSPy".encode("utf-8"))
-                    self.RPC.update(details=f"Editing {level_path}", small_image="icon",
-                                    state=f"{self.level.get_end() / 1000:.1f} seconds long, {len(self.level.get_notes())} notes",
-                                    start=start_time,
-                                    buttons=[{"label": "GitHub", "url": "https://github.com/balt-dev/SSpy/"}])
+                new_name_id = 2 if self.changed_since_save else 3  # Has the level been saved?
+            level_state = None
+            new_title = None  # Leave it alone
+            if new_name_id == 0 and not idle:
+                new_title = "SSPy"
+            elif new_name_id > 0:
+                level_state = (self.filename, id(self.level.notes), self.level.notes.version)
+                level_path = "Unnamed" if self.filename is None else Path(self.filename).name
+                new_title = f"{'*' if new_name_id != 3 else ''}{level_path} - SSPy"
+            # The title has to follow the level itself, not just whether it's saved
+            if new_title is not None and new_title != window_title:
+                sdl2.SDL_SetWindowTitle(window, new_title.encode("utf-8"))
+                window_title = new_title
+            if new_name_id != name_id or level_state != presence_level:
+                buttons = [{"label": "GitHub", "url": "https://github.com/balt-dev/SSpy/"}]
+                if new_name_id == -1:
+                    self.presence.update(state="Developing", small_image="icon", start=start_time, buttons=buttons)
+                elif new_name_id == 0:
+                    self.presence.update(state="Idling", small_image="icon", start=start_time, buttons=buttons)
+                else:
+                    self.presence.update(
+                        details="Editing an unnamed level" if self.filename is None else f"Editing {level_path}",
+                        state=f"{self.level.get_end() / 1000:.1f} seconds long, {len(self.level.get_notes())} notes",
+                        small_image="icon", start=start_time, buttons=buttons)
+                name_id = new_name_id
+                presence_level = level_state
             with imgui.font(font):
                 while sdl2.SDL_PollEvent(ctypes.byref(event)) != 0:
+                    self.frame_pacer.poke()
                     # Handle quitting the app
                     if event.type == sdl2.SDL_QUIT:
                         self.playing = False
@@ -763,10 +1107,9 @@ class Editor:
                         self.notes_changed = True
                         self.times_to_display = None
                         self.level = SSPMLevel()
-                        if self.playback is not None:
-                            self.playback.stop()
-                        self.playback = None
+                        self.mixer.stop()
                         self.filename = None
+                        self.sync_edits()
                         self.playing = False
                         self.changed_since_save = True
                         self.time_since_last_change = time.time()
@@ -784,13 +1127,15 @@ class Editor:
                     if keys[sdl2.SDLK_s] and not old_keys[sdl2.SDLK_s]:
                         # CTRL + S : Save / CTRL + SHIFT + S : Save As...
                         if self.filename is not None and not keys[sdl2.SDL_SCANCODE_LSHIFT]:
-                            try:
-                                self.level.save(self.filename, self.bpm, self.offset, self.time_signature, self.swing)
-                                self.changed_since_save = False
-                            except Exception as e:
-                                self.error = e
+                            self.save(self.filename)
                         else:
                             self.saveas()
+                    if keys[sdl2.SDLK_z] and not old_keys[sdl2.SDLK_z]:
+                        # CTRL + Z : Undo / CTRL + SHIFT + Z : Redo
+                        self.undo(redo=keys[sdl2.SDL_SCANCODE_LSHIFT])
+                    if keys[sdl2.SDLK_y] and not old_keys[sdl2.SDLK_y]:
+                        # CTRL + Y : Redo
+                        self.undo(redo=True)
                     if keys[sdl2.SDLK_p] and not old_keys[sdl2.SDLK_p]:
                         # CTRL + P : Preview
                         self.preview_mode = not self.preview_mode
@@ -807,9 +1152,9 @@ class Editor:
                             self.notes_changed = True
                             self.times_to_display = None
                             self.level = SSPMLevel()
-                            if self.playback is not None:
-                                self.playback.stop()
+                            self.mixer.stop()
                             self.filename = None
+                            self.sync_edits()
                             self.playing = False
                             self.changed_since_save = True
                             self.time_since_last_change = time.time()
@@ -825,12 +1170,7 @@ class Editor:
                         if imgui.menu_item("Save", "ctrl + s",
                                            enabled=(self.level is not None and self.filename is not None))[0]:
                             if self.filename is not None:
-                                try:
-                                    self.level.save(self.filename, self.bpm, self.offset, self.time_signature,
-                                                    self.swing)
-                                    self.changed_since_save = False
-                                except Exception as e:
-                                    self.error = e
+                                self.save(self.filename)
                             else:
                                 self.saveas()
                         if imgui.menu_item("Save As...", "ctrl + shift + s", enabled=self.level is not None)[0]:
@@ -846,14 +1186,19 @@ class Editor:
                                 self.menu_choice = "quit.ensure"  # NOTE: The quit menu won't open if I don't do this from here
                         imgui.end_menu()
                     if imgui.begin_menu("Edit", self.level is not None):
+                        if imgui.menu_item("Undo", "ctrl + z", enabled=self.history.can_undo)[0]:
+                            self.undo()
+                        if imgui.menu_item("Redo", "ctrl + y", enabled=self.history.can_redo)[0]:
+                            self.undo(redo=True)
+                        imgui.separator()
                         changed, value = imgui.combo("Format", FORMATS.index(self.level.__class__),
                                                      list(FORMAT_NAMES))
                         if changed:
                             self.level = FORMATS[value](self.level.name,
                                                         self.level.authors,
                                                         self.level.notes,
-                                                        self.level.cover,
-                                                        self.level.audio,
+                                                        self.level.media_source("cover") or self.level.cover,
+                                                        self.level.media_source("audio") or self.level.audio,
                                                         self.level.difficulty)
                             self.changed_since_save = True
                             self.time_since_last_change = time.time()
@@ -870,20 +1215,21 @@ class Editor:
                         elif isinstance(self.level, VulnusLevel):
                             self.display_vuln()
                         imgui.separator()
-                        if self.level.audio is None:
+                        if self.new_song is not None or self.level.pending("audio"):
+                            imgui.text("Decoding audio...")
+                        elif self.level.audio is None:
                             imgui.text("/!\\ Map has no audio")
                         clicked = imgui.button("Change song")
                         if clicked:
-                            # Load the selected audio
+                            # Load the selected audio, it gets swapped in at the start of a frame once it's decoded
                             changed, value = self.open_file_dialog(
                                 {"Audio": "*.mp3 *.ogg *.wav *.flac *.opus"})
                             if changed:
                                 try:
-                                    self.level.audio = AudioSegment.from_file(value).set_sample_width(2)
-                                    self.changed_since_save = True
-                                    self.time_since_last_change = time.time()
-                                except pydub.exceptions.CouldntDecodeError:
-                                    self.error = Exception("Audio file couldn't be read! It might be corrupted.")
+                                    with open(value, "rb") as f:
+                                        self.new_song = LazyMedia(f.read(), decode_audio)
+                                except OSError as e:
+                                    self.error = e
                         imgui.pop_item_width()
                         imgui.separator()
                         changed, value = imgui.input_float("BPM", self.bpm, 0)
@@ -935,6 +1281,18 @@ class Editor:
                             if changed:
                                 self.fps_cap = min(max(value, 15), 360)
                             imgui.unindent()
+                        changed, value = imgui.checkbox("Save power when idle?", self.frame_pacer.enabled)
+                        if changed:
+                            self.frame_pacer.enabled = value
+                        if imgui.is_item_hovered():
+                            imgui.set_tooltip("Stops redrawing while nothing's happening, and slows down in the background.")
+                        changed, value = imgui.input_int("Undo Memory (MB)", self.history.limit >> 20, 0)
+                        if changed:
+                            self.history.limit = min(max(value, 1), 4096) << 20
+                            self.history.trim()
+                        if imgui.is_item_hovered():
+                            imgui.set_tooltip(f"Undo is using {self.history.size / 1048576:.1f} MB. "
+                                              "The oldest steps get dropped past this.")
                         changed, value = imgui.checkbox("Draw notes on timeline?", self.draw_notes)
                         if changed:
                             self.draw_notes = value
@@ -975,16 +1333,18 @@ class Editor:
                             changed, value = imgui.input_int("Position (ms)", self.time, 0)
                             if changed:
                                 self.time = abs(value)
-                            if self.level.audio is not None:
+                            if self.level.loaded("audio") is not None:
                                 changed, value = imgui.slider_float("Volume (db)", self.volume, -100, 10, "%.1f", 1.2)
                                 if changed:
                                     self.volume = value
+                                    self.prefetch_audio()
                             changed, value = imgui.input_float("Playback Speed", self.audio_speed, 0, format="%.2f")
                             if changed:
                                 self.audio_speed = (max(min(value, 3.4e38), -3.4e38) if abs(value) > 0.05 else (
                                     value / abs(
                                         value)) * max(
                                     abs(value), 0.05)) if value != 0 else 0.05
+                                self.prefetch_audio()
                         changed, value = imgui.checkbox("Play hitsounds?", self.hitsounds)
                         if changed:
                             self.hitsounds = value
@@ -1014,6 +1374,17 @@ class Editor:
                         changed, value = imgui.slider_int("Note Rounding", int(self.rounding * 100), 0, 100)
                         if changed:
                             self.rounding = value / 100
+                        if self.note_renderer is not None:
+                            changed, value = imgui.checkbox("GPU note rendering?", self.gpu_notes)
+                            if changed:
+                                self.gpu_notes = value
+                            if imgui.is_item_hovered():
+                                imgui.set_tooltip("Draws all notes in one go on the GPU. Turn off if notes look wrong.")
+                        changed, value = imgui.checkbox("Show frame timings?", self.show_frame_timings)
+                        if changed:
+                            self.show_frame_timings = value
+                        if imgui.is_item_hovered():
+                            imgui.set_tooltip("Where each frame's time goes. F3 toggles this too.")
                         imgui.pop_item_width()
                         imgui.end_menu()
                     if imgui.begin_menu("Tools", self.level is not None):
@@ -1021,6 +1392,8 @@ class Editor:
                             self.menu_choice = "tools.offset_notes"
                         if imgui.button("Bulk Delete"):
                             bulk_delete_window_open = True
+                        if imgui.button("Transform Notes"):
+                            transform_window_open = True
                         imgui.separator()
                         if imgui.button("Spline"):
                             spline_window_open = True
@@ -1062,6 +1435,7 @@ class Editor:
                         imgui.text("Mouse wheel or left/right arrows to move your place on the timeline")
                         imgui.text("Space to play/pause the level")
                         imgui.text("Left click to place a note, right click to delete")
+                        imgui.text("Ctrl+Z to undo, Ctrl+Y or Ctrl+Shift+Z to redo")
                         imgui.separator()
                         imgui.text(
                             "Place colors.txt in the script directory with a list of colors to customize note colors")
@@ -1079,6 +1453,11 @@ class Editor:
                     imgui.text("You have unsaved changes!")
                     imgui.text("Are you sure you want to exit?")
                     if imgui.button("Quit"):
+                        self.finish_saving()
+                        if self.journal is not None:  # They don't want the changes
+                            self.journal.discard()
+                        self.audio_output.close()
+                        self.presence.close()
                         return False
                     imgui.same_line(spacing=10)
                     if imgui.button("Cancel"):
@@ -1098,16 +1477,22 @@ class Editor:
                     if imgui.button("Confirm"):
                         self.notes_changed = True
                         self.times_to_display = None
-                        # FIXME: this code kinda sucks
-                        new_notes = {}
-                        for timing, pos in self.level.notes.items():
-                            new_notes[timing - note_offset] = pos
-                        self.level.notes = new_notes
+                        self.level.notes.shift(-note_offset)
                         note_offset = None
                         self.changed_since_save = True
                         self.time_since_last_change = time.time()
                         imgui.close_current_popup()
                     imgui.end_popup()
+                if self.recovered_edits:
+                    imgui.open_popup("journal.recovered")
+                    recovered_edits, self.recovered_edits = self.recovered_edits, 0
+                if imgui.begin_popup("journal.recovered"):
+                    imgui.text(f"Recovered {recovered_edits} unsaved change{'s' * (recovered_edits != 1)} "
+                               f"to {Path(self.filename).name}.")
+                    imgui.text("Save to keep them.")
+                    if imgui.button("OK"):
+                        imgui.close_current_popup()
+                    imgui.end_popup()
                 if imgui.begin_popup("preview.alert"):
                     imgui.text("You have just entered preview mode.")
                     imgui.text("This hides the timeline and menu bar.")
@@ -1137,10 +1522,81 @@ class Editor:
                     if imgui.button("Confirm"):
                         self.notes_changed = True
                         self.times_to_display = None
-                        times = np.array(tuple(self.level.notes.keys()))
-                        times = times[np.logical_and(bulk_delete_start_time <= times, times <= bulk_delete_end_time)]
-                        for note_time in times:
-                            del self.level.notes[note_time]
+                        self.level.notes.remove_range(bulk_delete_start_time, bulk_delete_end_time)
+                        self.changed_since_save = True
+                        self.time_since_last_change = time.time()
+                    imgui.end()
+                transform_preview = None
+                if transform_window_open and imgui.begin("Transform Notes"):
+                    imgui.text("Move, stretch, flip or snap all notes within a specified time slice.")
+                    imgui.columns(2, border=False)
+                    changed, value = imgui.input_int("Start Time", transform_start_time, 0)
+                    if changed:
+                        transform_start_time = value
+                    imgui.core.set_column_width(-1, 260)
+                    imgui.next_column()
+                    if imgui.button("Set Here##start"):
+                        transform_start_time = int(self.time)
+                    imgui.next_column()
+                    changed, value = imgui.input_int("End Time", transform_end_time, 0)
+                    if changed:
+                        transform_end_time = value
+                    imgui.next_column()
+                    if imgui.button("Set Here##end"):
+                        transform_end_time = int(self.time)
+                    imgui.columns(1)
+                    imgui.separator()
+                    imgui.push_item_width(120)
+                    changed, value = imgui.input_int("Shift (ms)", note_transform.shift, 0)
+                    if changed:
+                        note_transform.shift = value
+                    changed, value = imgui.input_float("Time Scale", note_transform.scale, 0, format="%.3f")
+                    if changed:
+                        note_transform.scale = min(max(value, 0.01), 100)
+                    if imgui.is_item_hovered():
+                        imgui.set_tooltip("Stretches the notes away from the start time. 2 is twice as slow.")
+                    changed, value = imgui.checkbox("Mirror horizontally?", note_transform.mirror_x)
+                    if changed:
+                        note_transform.mirror_x = value
+                    changed, value = imgui.checkbox("Mirror vertically?", note_transform.mirror_y)
+                    if changed:
+                        note_transform.mirror_y = value
+                    changed, value = imgui.slider_float("Rotate (degrees)", note_transform.rotation, -180, 180,
+                                                        "%.1f")
+                    if changed:
+                        note_transform.rotation = value
+                    if self.bpm != 0:
+                        changed, value = imgui.checkbox("Quantize to beat grid?", note_transform.quantize)
+                        if changed:
+                            note_transform.quantize = value
+                        if imgui.is_item_hovered():
+                            imgui.set_tooltip(f"Snaps every note to the nearest 1/{self.beat_divisor} of a beat.")
+                    else:
+                        note_transform.quantize = False
+                    changed, value = imgui.combo("Collisions", transform_collisions, list(COLLISION_NAMES))
+                    if changed:
+                        transform_collisions = value
+                    if imgui.is_item_hovered():
+                        imgui.set_tooltip("What happens when a note lands on the time of a note outside the slice.")
+                    imgui.pop_item_width()
+                    transform_preview = self.plan_transform(transform_start_time, transform_end_time, note_transform,
+                                                            transform_collisions)
+                    imgui.text(f"{transform_preview.count} notes, {transform_preview.collisions} landing on "
+                               "existing notes")
+                    if transform_preview.dropped:
+                        imgui.text(f"{transform_preview.dropped} exact duplicates will be dropped")
+                    if imgui.button("Cancel"):
+                        transform_window_open = False
+                    imgui.same_line(spacing=10)
+                    if imgui.button("Reset"):
+                        note_transform = NoteTransform()
+                    imgui.same_line(spacing=10)
+                    if imgui.button("Apply"):
+                        self.notes_changed = True
+                        self.times_to_display = None
+                        transform_preview.apply()
+                        transform_preview = None
+                        note_transform = NoteTransform()  # Otherwise the preview shows it happening again
                         self.changed_since_save = True
                         self.time_since_last_change = time.time()
                     imgui.end()
@@ -1160,6 +1616,7 @@ class Editor:
                                                                fields=[VAR_DEFAULTS[var_type - 1] for var_type in
                                                                        tuple(self.level.marker_types.values())[
                                                                            marker_add_index + 1]]))
+                                self.touch_markers()
                             imgui.separator()
                             for e, (i, marker) in enumerate(self.displayed_markers):
                                 changed, value = imgui.combo(f"##edit-marker-{i}", marker["m_type"] - 1,
@@ -1169,9 +1626,11 @@ class Editor:
                                                                  fields=[VAR_DEFAULTS[var_type] for var_type in
                                                                          tuple(self.level.marker_types.values())[
                                                                              value + 1]])
+                                    self.touch_markers()
                                 imgui.same_line()
                                 if imgui.button(f"-##remove-marker-{i}", 26, 26):
                                     del self.level.markers[i]
+                                    self.touch_markers()
                                 imgui.indent()
                                 try:
                                     var_types = tuple(self.level.marker_types.values())[marker["m_type"]]
@@ -1185,6 +1644,7 @@ class Editor:
                                     if any_changed:
                                         self.level.markers[i] = marker
                                         self.displayed_markers[e] = marker
+                                        self.touch_markers()
                                 except (TypeError, AssertionError):
                                     imgui.text_colored("! This marker type has changed, making this marker invalid.", 1, 0.25, 0.25)
                                     if imgui.button(f"Reset##reset-marker-{i}"):
@@ -1194,6 +1654,7 @@ class Editor:
                                                           marker["m_type"]]])
                                         self.level.markers[i] = marker
                                         self.displayed_markers[e] = marker
+                                        self.touch_markers()
                                 imgui.unindent()
                             if imgui.button("Close"):
                                 edit_markers_window_open = False
@@ -1255,11 +1716,9 @@ class Editor:
                             if imgui.button("Place"):
                                 self.notes_changed = True
                                 self.times_to_display = None
-                                for timing, position in spline_display_notes.items():
-                                    if timing in self.level.notes:
-                                        self.level.notes[int(timing)].append(position)
-                                    else:
-                                        self.level.notes[int(timing)] = [position]
+                                positions = np.array(tuple(spline_display_notes.values()), dtype=np.float32)
+                                self.level.notes.extend(np.array(tuple(spline_display_notes.keys())).astype(np.int32),
+                                                        positions[:, 0], positions[:, 1])
                                 self.changed_since_save = True
                                 self.time_since_last_change = time.time()
                         imgui.pop_item_width()
@@ -1279,10 +1738,7 @@ class Editor:
                         if imgui.is_item_active() and len(keys_changed) > 0:
                             if not self.playing:
                                 self.playing = True
-                                if self.level.audio is not None:
-                                    self.playback = play_at_position(
-                                        self.speed_change(self.level.audio + self.volume, self.audio_speed),
-                                        ((self.time) / 1000) / self.audio_speed)
+                                self.start_playback()
                                 self.starting_time = time.perf_counter_ns()
                                 self.starting_position = self.time
                             set_timing = self.time
@@ -1292,6 +1748,7 @@ class Editor:
                         if imgui.button("Done"):
                             tap_timings_window_open = False
                         imgui.end()
+                self.frame_profile.lap("menus")
                 if self.level is not None:
                     size = self.io.display_size
                     imgui.set_next_window_size(size[0], size[1] - (0 if self.preview_mode else 26))
@@ -1310,7 +1767,7 @@ class Editor:
                                 self.time_scroll((2 * keys[sdl2.SDL_SCANCODE_RIGHT]) - 1, keys, ms_per_beat)
                             draw_list = imgui.get_window_draw_list()
                             if not dragging_timeline:
-                                timeline_width = max(self.level.get_end() + 1000, self.time + self.approach_rate, 1)
+                                timeline_width = self.timeline_width()
                             # Draw the main UI background
                             square_side = min(w, h)
                             if self.BACKGROUND is None:
@@ -1327,9 +1784,6 @@ class Editor:
                             adjusted_x = (((x + w) / 2) - (square_side / 2))
                             adjusted_y = (((y + h) / 2) - (square_side / 2))
                             box = (adjusted_x, adjusted_y, adjusted_x + square_side, adjusted_y + square_side)
-                            timeline_rects.append(
-                                DelayedRect((x, (y + h) - (0 if self.preview_mode else self.timeline_height), x + w, (y + h)), 0x80404040))
-                            self.rects_drawn += 3
                             note_pos = [(((mouse_pos[0] - (adjusted_x)) / (square_side)) * self.vis_map_size) - (
                                 self.vis_map_size / 2) + 1,
                                 (((mouse_pos[1] - (adjusted_y)) / (square_side)) * self.vis_map_size) - (
@@ -1338,51 +1792,25 @@ class Editor:
                                 ((note_pos[0] - 1) * self.sensitivity) + 1, ((note_pos[1] - 1) * self.sensitivity) + 1)
                             note_pos[0] -= self.camera_pos[0]
                             note_pos[1] -= self.camera_pos[1]
-                            if ((not self.preview_mode) and self.level.audio is not None and audio_data is not None
-                                    and self.draw_audio and self.timeline_height > 20):
-                                center = (y + h) - (self.timeline_height / 2)
-                                length = int(self.level.audio.frame_rate * timeline_width / 1000)
-                                waveform_width = int(
-                                    size[0])
-                                # Draw waveform
-                                # FIXME: it'd be nice if this wasn't a python loop
-                                for n in range(0, waveform_width, self.waveform_res):
-                                    try:
-                                        # Slice a segment of audio
-                                        sample = audio_data[math.floor((n / waveform_width) * length * 2): math.floor(
-                                            ((n + self.waveform_res) / waveform_width) * length * 2)]
-                                        timeline_rects.append(DelayedRect(
-                                            (x + int((w / waveform_width) * n),
-                                             center + int(
-                                                 (np.max(sample) / (extent / 0.8)) * (
-                                                     self.timeline_height // 2)),
-                                             x + int((w / waveform_width) * n) + self.waveform_res,
-                                             center + int(
-                                                 (np.min(sample) / (extent / 0.8)) * (
-                                                     self.timeline_height // 2))),
-                                            0x20ffffff))
-                                        self.rects_drawn += 1
-                                    except (IndexError, ValueError):
-                                        break
-                            if not self.preview_mode and self.draw_notes and self.times_to_display is not None:
-                                # Draw notes
-                                for i, note in enumerate(self.times_to_display):
-                                    color = (self.colors[i % len(self.colors)] & 0xFFFFFF) | 0x40000000
-                                    progress = note / timeline_width
-                                    progress = progress if not math.isnan(progress) else 1
-                                    timeline_rects.append(
-                                        DelayedRect((x + int(w * progress), (y + h) - self.timeline_height,
-                                                     x + int(w * progress) + 1,
-                                                     (y + h) - (self.timeline_height * 0.8)),
-                                                    color))
-                                    self.rects_drawn += 1
+                            if not self.preview_mode:
+                                # The static part of the timeline only gets rebuilt when something it shows changes
+                                waveform_width = int(size[0])
+                                timeline_key = self.timeline_cache_key(timeline_width, w, waveform, waveform_width)
+                                if timeline_key != self.timeline_key:
+                                    self.timeline_key = timeline_key
+                                    self.timeline_batches = self.build_timeline(timeline_width, w, waveform,
+                                                                                waveform_width)
+                                    if self.timeline_layer is not None:
+                                        self.timeline_layer.render([(batch.boxes, batch.color)
+                                                                    for batch in self.timeline_batches],
+                                                                   w, self.timeline_height)
+                            self.frame_profile.lap("waveform")
                             # Draw currently visible area on timeline
                             start = (self.time) / timeline_width
                             end = (self.time + self.approach_rate) / timeline_width
                             timeline_rects.append(
                                 DelayedRect((x + int(w * start), (y + h) - self.timeline_height, x + int(w * end) + 1,
                                              (y + h)), 0x80ffffff, thickness=3, filled=False))
-                            self.rects_drawn += 1
 
                             def center_of_view(text):
                                 text_width = imgui.calc_text_size(text).x
@@ -1408,17 +1836,6 @@ class Editor:
                                         center_of_view(b_text),
                                         y + h - (self.timeline_height + 40), 0x80FFFFFF, b_text)
 
-                                    floor_beat = math.floor(raw_current_beat)
-                                    # Play the metronome
-                                    if self.metronome and self.playing:
-                                        beat_skipped = floor_beat - math.floor(old_beat)
-                                        if beat_skipped:
-                                            if old_beat // self.time_signature[0] != current_beat // self.time_signature[
-                                                    0]:  # If a measure has passed
-                                                _play_with_simpleaudio(METRONOME_M)
-                                            else:
-                                                _play_with_simpleaudio(METRONOME_B)
-                                    old_beat = current_beat
                                     # Draw markers
                                     if isinstance(self.level, SSPMLevel):
                                         old_time = -1
@@ -1444,53 +1861,35 @@ class Editor:
                                                     0xFFFFFF | (int(0xFF * max(0, line_prog)) << 24),
                                                     thickness=4 * line_prog
                                                 )
-                                            progress = marker["time"] / timeline_width
-                                            timeline_rects.append(
-                                                DelayedRect((x + int(w * progress), (y + h) - self.timeline_height * 0.2,
-                                                             x + int(w * progress) + 1,
-                                                             (y + h) - self.timeline_height * 0.4),
-                                                            0x00ff00ff))
                                             if self.time == marker["time"]:
                                                 self.displayed_markers.append((i, marker))
-                                            self.rects_drawn += 1
+                                        self.frame_profile.lap("markers")
 
                                     if self.bpm_markers:
-                                        # Draw beat markers on timeline
-                                        end_beat = (timeline_width / ms_per_beat)
-                                        for beat in range(int(end_beat * self.beat_divisor + 1), 0, -1):
-                                            beat /= self.beat_divisor
-                                            on_measure = not (beat % self.time_signature[0])
-                                            on_beat = not (beat % 1)
-                                            self.swing = 1 - self.swing  # Invert this because it draws in the wrong place otherwise
-                                            swung_beat = self.adjust_swing(beat)
-                                            self.swing = 1 - self.swing
-                                            beat_time = (swung_beat * ms_per_beat) + self.offset
-                                            if (end_beat < 250 or on_beat) and (
-                                                    end_beat < 500 or on_measure) and end_beat < 2000:
-                                                progress = beat_time / timeline_width
-                                                progress = progress if not math.isnan(progress) else 1
-                                                timeline_rects.append(DelayedRect((x + int(w * progress), (y + h) - (
-                                                    self.timeline_height * (
-                                                        0.3 if on_measure else 0.2 if on_beat else 0.1)),
-                                                    x + int(w * progress) + 1, (y + h)),
-                                                    0xff0000ff if on_measure else 0x800000ff))
-                                                self.rects_drawn += 1
-                                            if (self.time <= beat_time < self.time + self.approach_rate):
-                                                line_prog = 1 - ((beat_time - self.time) / self.approach_rate)
-                                                # Draw beat marker in note space
-                                                draw_list.add_rect(
-                                                    *self.note_pos_to_abs_pos(
-                                                        (self.vis_map_size / 2 + 1, self.vis_map_size / 2 + 1),
-                                                        box, line_prog),
-                                                    *self.note_pos_to_abs_pos(
-                                                        (self.vis_map_size / -2 + 1, self.vis_map_size / -2 + 1),
-                                                        box, line_prog),
-                                                    0xFF | (int(0xFF * max(0, line_prog) / (
-                                                        1 if on_measure else 2 if on_beat else 6))) << 24,
-                                                    thickness=2 * max(0, line_prog) * (2 if on_measure else 1)
-                                                )
-                                                self.rects_drawn += 1
-                                for i, timing in enumerate(self.timings[np.logical_and(self.time <= self.timings, self.timings < (self.time + self.approach_rate))]):
+                                        # Draw beat markers in note space, the timeline ones are in build_timeline
+                                        beat_times, beat_kinds = self.beat_grid(
+                                            self.time, self.time + self.approach_rate).between(
+                                            self.time, self.time + self.approach_rate)
+                                        # Furthest first, so the closer ones end up on top
+                                        for beat_time, kind in zip(beat_times[::-1].tolist(), beat_kinds[::-1].tolist()):
+                                            on_measure = kind == MEASURE
+                                            on_beat = kind >= BEAT
+                                            line_prog = 1 - ((beat_time - self.time) / self.approach_rate)
+                                            # Draw beat marker in note space
+                                            draw_list.add_rect(
+                                                *self.note_pos_to_abs_pos(
+                                                    (self.vis_map_size / 2 + 1, self.vis_map_size / 2 + 1),
+                                                    box, line_prog),
+                                                *self.note_pos_to_abs_pos(
+                                                    (self.vis_map_size / -2 + 1, self.vis_map_size / -2 + 1),
+                                                    box, line_prog),
+                                                0xFF | (int(0xFF * max(0, line_prog) / (
+                                                    1 if on_measure else 2 if on_beat else 6))) << 24,
+                                                thickness=2 * max(0, line_prog) * (2 if on_measure else 1)
+                                            )
+                                visible_timings = self.timings[np.searchsorted(self.timings, self.time, "left"):
+                                                               np.searchsorted(self.timings, self.time + self.approach_rate, "left")]
+                                for i, timing in enumerate(visible_timings):
                                     progress = timing / timeline_width
                                     if progress < 1:
                                         progress = progress if not math.isnan(progress) else 1
@@ -1506,22 +1905,33 @@ class Editor:
                                             0xFF00 | int(0xFF * max(0, line_prog)) << 24,
                                             thickness=2 * max(0, line_prog)
                                         )
-                                        self.rects_drawn += 1
+                                self.frame_profile.lap("beat grid")
                             if self.times_to_display is not None:
                                 # FIXME: Copy the times display for hitsound offsets :(
-                                hitsound_times = self.times_to_display[np.logical_and(
-                                    self.times_to_display >= int(self.time) + (
-                                        self.hitsound_offset / self.audio_speed) - 1,
-                                    (self.times_to_display) < (
-                                        int(self.time) + self.approach_rate + (
-                                            self.hitsound_offset * self.audio_speed)))].flatten()
-                                note_times = self.times_to_display[
-                                    np.logical_and(self.times_to_display - self.time >= 0,
-                                                   (self.times_to_display) < (
-                                                       self.time + self.approach_rate))].flatten()
-                                for note_time in note_times[::-1]:
-                                    i = np.where(self.times_to_display == note_time)[0][0]
-                                    for note in self.level.notes[note_time]:
+                                hitsound_times = self.level.times_between(
+                                    int(self.time) + (self.hitsound_offset / self.audio_speed) - 1,
+                                    int(self.time) + self.approach_rate + (self.hitsound_offset * self.audio_speed))
+                                lo, hi, time_indices = self.level.window(self.time, self.time + self.approach_rate)
+                                if self.gpu_notes and self.note_renderer is not None:
+                                    # Back to front, same as below
+                                    instances = np.empty(hi - lo, dtype=NOTE_INSTANCE)
+                                    instances["time"] = (self.level.notes.times[lo:hi] - self.time)[::-1]
+                                    instances["x"] = self.level.notes.x[lo:hi][::-1]
+                                    instances["y"] = self.level.notes.y[lo:hi][::-1]
+                                    colors = np.array(self.colors, dtype=np.uint32)
+                                    instances["color"] = colors[time_indices % len(colors)][::-1]
+                                    self.note_renderer.queue(draw_list, instances, (x, y, w, h),
+                                                             approach_rate=self.approach_rate,
+                                                             approach_distance=self.approach_distance,
+                                                             spacing=(box[2] - box[0]) / self.vis_map_size,
+                                                             rounding=self.rounding, size=1.0,
+                                                             camera=self.camera_pos,
+                                                             center=((box[0] + box[2]) / 2, (box[1] + box[3]) / 2))
+                                else:
+                                    visible_times = self.level.notes.times[lo:hi].tolist()
+                                    visible_notes = self.level.notes.positions(lo, hi).tolist()
+                                    for note_time, note, i in zip(visible_times[::-1], visible_notes[::-1],
+                                                                  time_indices[::-1].tolist()):
                                         rgba = self.colors[i % len(self.colors)]
                                         rgb, a = rgba & 0xFFFFFF, (rgba & 0xFF000000) >> 24
                                         progress = 1 - ((note_time - self.time) / self.approach_rate)
@@ -1529,21 +1939,22 @@ class Editor:
                                                        box, progress,
                                                        color=rgb, alpha=a)
 
-                                # Play note hit sound
-                                if self.playing and self.hitsounds:
+                                # Hitsounds are scheduled ahead of time in update_mixer, but hits and misses when
+                                # playtesting depend on the cursor, so those still get played as the frame sees them
+                                if self.playing and self.hitsounds and self.playtesting:
                                     if ((last_hitsound_times.size and
-                                         np.min(last_hitsound_times) < self.time + (
+                                         last_hitsound_times[0] < self.time + (
                                              self.hitsound_offset / self.audio_speed) - 1)):
-                                        notes = self.level.notes[np.min(last_hitsound_times)]
+                                        notes = self.level.notes.positions(*self.level.notes.at(last_hitsound_times[0]))
                                         for note in notes[:8]:
                                             pos = note[0] - 1
                                             panning = (pos / (self.vis_map_size / 2)) * self.hitsound_panning
-                                            if not self.playtesting or (abs(note[0] - cursor_pos[0]) < (0.57) and abs(
-                                                    note[1] - cursor_pos[1]) < (0.57)):
-                                                _play_with_simpleaudio(HITSOUND.pan(min(max(panning, -1), 1)))
+                                            if abs(note[0] - cursor_pos[0]) < (0.57) and abs(note[1] - cursor_pos[1]) < (0.57):
+                                                self.mixer.trigger(self.HIT_SOUND, panning)
                                             else:
-                                                _play_with_simpleaudio(MISSSOUND.pan(min(max(panning, -1), 1)))
+                                                self.mixer.trigger(self.MISS_SOUND, panning)
                                 last_hitsound_times = hitsound_times
+                                self.frame_profile.lap("notes")
                             # XXX: copy/pasted code :/
                             if len(spline_display_notes) and spline_window_open:
                                 if len(spline_nodes) > 1:
@@ -1567,21 +1978,29 @@ class Editor:
                                                        box, progress,
                                                        color=0xFFFF00, alpha=int(0x80 * progress), size=0.5)
 
+                            if transform_preview is not None:
+                                # Where Transform Notes would put them
+                                lo, hi = transform_preview.between(self.time, self.time + self.approach_rate)
+                                for i in range(hi - 1, lo - 1, -1):  # Back to front
+                                    progress = 1 - ((transform_preview.times[i] - self.time) / self.approach_rate)
+                                    self.draw_note(draw_list, (transform_preview.x[i], transform_preview.y[i]),
+                                                   box, progress,
+                                                   color=0xFF00FF, alpha=int(0x80 * progress), size=0.5)
+
                             if level_was_active and mouse_pos[
                                     1] < y + h - 5 - (0 if self.preview_mode else self.timeline_height):
                                 sdl2.SDL_ShowCursor(
                                     not (self.playtesting and imgui.is_window_focused() and imgui.is_window_hovered()))
                                 # Note placing and deleting
-                                time_arr = np.array(tuple(self.level.notes.keys()))
-                                time_arr = time_arr[
-                                    np.logical_and(time_arr - self.time >= -1,
-                                                   time_arr - self.time < self.approach_rate)]
-                                closest_time = np.min(time_arr) if time_arr.size > 0 else self.time
+                                time_arr = self.level.times_between(self.time - 1, self.time + self.approach_rate)
+                                closest_time = time_arr[0] if time_arr.size > 0 else self.time
                                 closest_index = None
                                 closest_dist = None
                                 # Note deletion
                                 if mouse[1] and not old_mouse[1]:
-                                    for i, note in enumerate(self.level.notes.get(closest_time, ())):
+                                    closest_rows = self.level.notes.at(closest_time)
+                                    progress = 1 - ((closest_time - self.time) / self.approach_rate)
+                                    for i, note in enumerate(self.level.notes.positions(*closest_rows)):
                                         p_scale = 1 / self.perspective_scale(progress)
                                         note = (((note[0] - 1) * p_scale) + 1, ((note[1] - 1) * p_scale) + 1)
                                         if abs(note[0] - note_pos[0]) < (0.5 / p_scale) and abs(
@@ -1594,9 +2013,7 @@ class Editor:
                                     if closest_index is not None:
                                         self.notes_changed = True
                                         self.times_to_display = None
-                                        del self.level.notes[int(closest_time)][closest_index]
-                                        if len(self.level.notes[int(closest_time)]) == 0:
-                                            del self.level.notes[int(closest_time)]
+                                        self.level.notes.remove_rows(closest_rows[0] + closest_index)
                                         self.changed_since_save = True
                                         self.time_since_last_change = time.time()
                                 # Draw the note under the cursor
@@ -1610,10 +2027,7 @@ class Editor:
                                     if mouse[0] and not old_mouse[0]:
                                         self.notes_changed = True
                                         self.times_to_display = None
-                                        if int(math.ceil(self.time)) in self.level.notes:
-                                            self.level.notes[int(math.ceil(self.time))].append(draw_note_pos)
-                                        else:
-                                            self.level.notes[int(math.ceil(self.time))] = [draw_note_pos]
+                                        self.level.notes.add(int(math.ceil(self.time)), *draw_note_pos)
                                         self.changed_since_save = True
                                         self.time_since_last_change = time.time()
                                     if keys[sdl2.SDLK_s] and spline_window_open:
@@ -1639,6 +2053,7 @@ class Editor:
                                 sdl2.SDL_FreeCursor(sdl2_cursor)
                                 sdl2_cursor = None
                                 cursor = "arrow"
+                            self.frame_profile.lap("editing")
                             # Draw cursor
                             if self.cursor and (len(self.level.notes) or self.playtesting):
                                 notes = self.level.get_notes()
@@ -1647,23 +2062,12 @@ class Editor:
                                     end = np.max(notes)
                                 if self.playtesting or (end - start):
                                     progress = (self.time - start) / (end - start)
-                                    if (cursor_spline is None or self.notes_changed) and not self.playtesting:
-                                        nodes = []
-                                        for timing, notes in dict(sorted(self.level.notes.items())).items():
-                                            node_x, node_y = 0, 0
-                                            for x, y in notes:
-                                                node_x += x / len(notes)
-                                                node_y += y / len(notes)
-                                            nodes.append((timing, node_x, node_y))
-                                        nodes = np.array(nodes, dtype=np.float64)
-                                        cursor_spline = CubicSpline(nodes[:, 0], nodes[:, 1:])
-
                                     if self.playtesting:
                                         cursor_positions = [cursor_pos] + cursor_positions[
                                             :6]  # NOTE: using a .insert breaks because of None
                                     else:
-                                        cursor_positions = [cursor_spline(self.time - t) for t in
-                                                            range(0, 75, 1)]
+                                        # Only looks at the notes around the trail, so there's nothing to rebuild on edits
+                                        cursor_positions = cursor_trail(self.level.notes, self.time).tolist()
                                     self.camera_pos = ((cursor_positions[0][0] - 1) * self.parallax,
                                                        (cursor_positions[0][1] - 1) * self.parallax)
 
@@ -1680,19 +2084,37 @@ class Editor:
                                 draw_list.add_polyline([position(p) for p in cursor_positions],
                                                        get_time_color() & 0x40FFFFFF if easter_egg_active else 0x40FFFFFF,
                                                        thickness=(square_side / self.vis_map_size) / 20)
+                            self.frame_profile.lap("cursor spline")
                             # Draw current statistics
                             if not self.preview_mode:
                                 fps_text = f"{int(self.io.framerate)}{f'/{self.fps_cap}' if not self.vsync else ''} FPS"
                                 fps_size = imgui.calc_text_size(fps_text)
                                 draw_list.add_text(w - fps_size.x - 4, y + 2, 0x80FFFFFF, fps_text)
                                 if not self.preview_mode:
+                                    timeline_top = (y + h) - self.timeline_height
+                                    if self.timeline_layer is not None:
+                                        self.timeline_layer.image(draw_list, x, timeline_top)
+                                    else:
+                                        for batch in self.timeline_batches:
+                                            batch.draw(draw_list, (x, timeline_top))
                                     for rect in timeline_rects:
                                         rect.draw(draw_list)
-                                        self.rects_drawn += 1
-                                rdtf_size = imgui.calc_text_size(f"{self.rects_drawn} rects drawn")
-                                draw_list.add_text(w - rdtf_size.x - 4, y + fps_size.y + 2, 0x80FFFFFF,
-                                                   f"{self.rects_drawn} rects drawn")
-                            self.rects_drawn = 0
+                                status_y = y + fps_size.y + 2
+                                if self.save_job is not None:
+                                    save_text = f"{self.save_job.status or self.save_job.description}... {self.save_job.progress:.0%}"
+                                    save_size = imgui.calc_text_size(save_text)
+                                    draw_list.add_text(w - save_size.x - 4, status_y, 0x80FFFFFF, save_text)
+                                    status_y += save_size.y
+                                if self.new_song is not None or self.level.pending("audio"):
+                                    decode_progress = (self.new_song.progress if self.new_song is not None
+                                                       else self.level.decode_progress("audio"))
+                                    decode_text = f"Decoding audio... {decode_progress:.0%}"
+                                    decode_size = imgui.calc_text_size(decode_text)
+                                    draw_list.add_text(w - decode_size.x - 4, status_y, 0x80FFFFFF, decode_text)
+                                    status_y += decode_size.y
+                                    draw_list.add_rect_filled(w - decode_size.x - 4, status_y,
+                                                              w - decode_size.x - 4 + decode_size.x * decode_progress,
+                                                              status_y + 2, 0x80FFFFFF)
                             imgui.end_child()
                         imgui.end()
                     imgui.pop_style_var(imgui.STYLE_WINDOW_PADDING)
@@ -1733,6 +2155,10 @@ class Editor:
                             imgui.close_current_popup()
                             self.error = None
                         imgui.end_popup()
+            self.frame_profile.lap("timeline")
+            self.sync_edits()
+            if self.show_frame_timings:
+                self.show_frame_timings = self.frame_timings_window()
             if easter_egg_activated:
                 imgui.push_style_color(imgui.COLOR_BORDER, 0, 0, 0, 0)
                 imgui.push_style_color(imgui.COLOR_POPUP_BACKGROUND, 0, 0, 0, 0.5)
@@ -1748,21 +2174,53 @@ class Editor:
                 imgui.pop_style_var(1)
             old_mouse = mouse
             old_keys = keys
+            self.frame_profile.lap("hud")
+            if self.note_renderer is not None:
+                self.note_renderer.render()  # Has to happen before imgui draws the texture it renders to
+            self.frame_profile.lap("gpu notes")
             GL.glClearColor(0., 0., 0., 1)
             GL.glClear(GL.GL_COLOR_BUFFER_BIT)
             imgui.render()
             impl.render(imgui.get_draw_data())
             sdl2.SDL_GL_SwapWindow(window)
+            self.frame_profile.lap("imgui render")
+            if self.profile is not None:
+                self.profile.mark("first frame")
+                if self.profile.enabled:
+                    print(self.profile.report())
+                    running = False
+                self.profile = None
             if self.playing:
+                if played_time is not None and self.time != played_time:
+                    # Moved while playing, so the audio jumps there too
+                    self.start_playback(seek=True)
+                    self.starting_time = time.perf_counter_ns()
+                    self.starting_position = self.time
                 self.time = ((time.perf_counter_ns() - self.starting_time) / (
                     1000000 / self.audio_speed)) + self.starting_position
             self.time = min(max(self.time, 0),
                             2 ** 31 - 1)  # NOTE: This needs to be 2**31-1 no matter if it's on a 32-bit or 64-bit computer, so no sys.maxsize here
+            played_time = self.time if self.playing else None
             was_playing = self.playing
             self.unique_label_counter = 0
-            if not self.vsync:
-                dt = (time.perf_counter_ns() - dt) / 1000000000
-                time.sleep(max((1 / self.fps_cap) - dt, 0))
+            # Only keep redrawing at full rate while something on screen is actually moving
+            busy = (self.playing or dragging_timeline or was_resizing_timeline or easter_egg_active
+                    or self.save_job is not None or self.new_song is not None or self.cover_pending
+                    or (self.level is not None and self.level.pending("audio")))
+            window_flags = sdl2.SDL_GetWindowFlags(window)
+            self.frame_pacer.pace((time.perf_counter_ns() - dt) / 1000000000, None if self.vsync else self.fps_cap,
+                                  busy, focused=bool(window_flags & sdl2.SDL_WINDOW_INPUT_FOCUS),
+                                  minimized=bool(window_flags & (sdl2.SDL_WINDOW_MINIMIZED | sdl2.SDL_WINDOW_HIDDEN)))
+            self.frame_profile.lap("idle")
+            self.frame_profile.end_frame()
+        self.finish_saving()
+        if self.journal is not None:
+            if self.changed_since_save:
+                self.journal.close()
+            else:  # Everything's saved, so there's nothing in it worth recovering
+                self.journal.discard()
+        self.audio_output.close()
+        self.presence.close()
 
     def adjust_pos(self, cen, pos, progress):
         visual_size = 1 / (1 + ((1 - progress) * self.approach_distance))
@@ -1792,14 +2250,51 @@ class Editor:
                                (int(alpha * max(progress, 0)) << 24) | color, thickness=max((note_size // 8), 0),
                                rounding=self.rounding * note_size / 2)
 
-            self.rects_drawn += 1
-
     def saveas(self):
         i = FORMATS.index(self.level.__class__)
         changed, value = self.save_file_dialog({FORMAT_NAMES[i]: FORMAT_EXTS[i]})
         if changed:
-            try:
-                self.level.save(value, self.bpm, self.offset, self.time_signature, self.swing)
-                self.changed_since_save = False
-            except Exception as e:
-                self.error = e
+            self.save(value)
+
+    def save(self, filename):
+        """Save a snapshot of the level on a background thread, so editing can carry on while it writes."""
+        if self.save_job is not None:
+            # Only one save at a time, the newest one wins once the current one is done
+            self.queued_save = filename
+            return
+        args = (filename, self.bpm, self.offset, tuple(self.time_signature), self.swing)
+        self.save_mark = None
+        if self.journal is not None and Path(filename).resolve() == self.journal.filename:
+            # Everything journaled up to here is in this snapshot, so it can go once the save is done
+            self.sync_edits()
+            if self.journal is not None:
+                self.save_mark = self.journal, self.journal.mark()
+        self.save_job = Job(f"Saving {Path(filename).name}", self.level.snapshot().save, *args)
+        self.changed_since_save = False
+
+    def poll_save(self):
+        if self.save_job is None or not self.save_job.done:
+            return
+        if self.save_mark is not None:
+            journal, mark = self.save_mark
+            if self.save_job.error is not None:
+                journal.release()
+            elif journal is self.journal:  # Not if another level got opened since
+                try:
+                    journal.rebase(mark)
+                except OSError as e:
+                    self.error = e
+        if self.save_job.error is not None:
+            self.error = self.save_job.error
+            self.changed_since_save = True
+        self.save_job = None
+        self.save_mark = None
+        if self.queued_save is not None:
+            filename, self.queued_save = self.queued_save, None
+            self.save(filename)
+
+    def finish_saving(self):
+        """Block until any in-flight save is on disk. Used when quitting."""
+        while self.save_job is not None:
+            self.save_job.wait()
+            self.poll_save()
@@ -0,0 +1,263 @@
+import ctypes
+import os
+import threading
+import wave
+
+import numpy as np
+
+from src.assets import read_wav, resample
+
+PAN_STEPS = 41  # Pan bank resolution, every 0.05 from -1 to 1
+MAX_VOICES = 64  # Oldest sounds get cut off past this
+
+
+def pan_gains(pan):
+    """Left and right gain for a pan amount, the same curve as AudioSegment.pan."""
+    boost = 2 ** (abs(pan) / 2)
+    reduce = 2 - 2 ** abs(pan)
+    return (boost, reduce) if pan < 0 else (reduce, boost)
+
+
+def segment_to_frames(segment, frame_rate, channels=2):
+    """An AudioSegment as an (n, channels) int16 array at the given frame rate."""
+    segment = segment.set_sample_width(2).set_frame_rate(frame_rate).set_channels(channels)
+    return np.frombuffer(segment.raw_data, dtype=np.int16).reshape(-1, channels)
+
+
+class Mixer:
+    """
+    Mixes the song, hitsounds and the metronome into one stream, a block at a time.
+    Something else pulls blocks out of mix(), usually SDLOutput's callback on the audio thread.
+    Sounds are scheduled in song milliseconds and placed on the exact sample they land on,
+    so they don't depend on the frame rate of the editor at all.
+    """
+
+    def __init__(self, frame_rate=44100, channels=2):
+        self.frame_rate = frame_rate
+        self.channels = channels
+        self._lock = threading.Lock()
+        self._sources = []
+        self._bank = []  # Per sound, PAN_STEPS float32 arrays of (n, channels), or None until it's first used
+        self._schedules = {}
+        self._voices = []
+        self._triggered = []
+        self._song = None
+        self._song_frame = 0
+        self._playing = False
+        self._clock = 0  # Frames mixed since the mixer was made
+        self._start_clock = 0
+        self._start_ms = 0.0
+        self._speed = 1.0
+
+    def add_sound(self, source):
+        """
+        Register a one-shot sound, returning its index for schedule() and trigger().
+        source is an AudioSegment or the path to a PCM .wav. Nothing is read or pre-panned until it first gets played.
+        """
+        with self._lock:
+            self._sources.append(source)
+            self._bank.append(None)
+            return len(self._bank) - 1
+
+    def _frames(self, source):
+        if isinstance(source, (str, os.PathLike)):
+            frames, frame_rate = read_wav(source)
+            if frames.shape[1] != self.channels:  # Mono to stereo and back
+                frames = np.repeat(frames.mean(axis=1, keepdims=True).astype(np.int16), self.channels, axis=1)
+            return resample(frames, frame_rate, self.frame_rate)
+        return segment_to_frames(source, self.frame_rate, self.channels)
+
+    def _load(self, sounds):
+        """Build the pan banks of these sounds if they haven't been yet. Done here so the audio thread never has to."""
+        for sound in np.unique(sounds).tolist():
+            if self._bank[sound] is not None:
+                continue
+            frames = self._frames(self._sources[sound]).astype(np.float32)
+            bank = []
+            for pan in np.linspace(-1, 1, PAN_STEPS):
+                if self.channels == 2:
+                    bank.append(frames * np.array(pan_gains(pan), dtype=np.float32))
+                else:
+                    bank.append(frames)
+            with self._lock:
+                self._bank[sound] = bank
+
+    @staticmethod
+    def pan_index(pan):
+        return np.rint((np.clip(pan, -1, 1) + 1) / 2 * (PAN_STEPS - 1)).astype(np.int64)
+
+    def schedule(self, name, times=None, sounds=None, pans=None):
+        """
+        Replace the named schedule with sounds at the given song times (ms), or remove it if times is None.
+        sounds and pans can be scalars or arrays.
+        """
+        if times is None:
+            with self._lock:
+                self._schedules.pop(name, None)
+            return
+        times = np.asarray(times, dtype=np.float64).reshape(-1)
+        order = np.argsort(times, kind="stable")
+        sounds = np.broadcast_to(np.asarray(sounds if sounds is not None else 0, dtype=np.int64), times.shape)
+        pans = np.broadcast_to(self.pan_index(pans if pans is not None else 0), times.shape)
+        self._load(sounds)
+        with self._lock:
+            self._schedules[name] = (times[order], sounds[order], pans[order])
+
+    def trigger(self, sound, pan=0):
+        """Play a sound on the next block, whether or not the song is playing."""
+        self._load(sound)
+        with self._lock:
+            self._triggered.append((sound, int(self.pan_index(pan))))
+
+    def play(self, song, position, song_ms, speed=1.0):
+        """
+        Start the song `position` seconds in. song is any buffer of interleaved int16 frames, or None.
+        It gets viewed where it is, never copied, so this takes the same time wherever it starts.
+        A negative position is that much silence first. song_ms and speed map the mixer's clock
+        back to song time for the schedules.
+        """
+        if song is not None:
+            song = np.frombuffer(song, dtype=np.int16).reshape(-1, self.channels)
+        with self._lock:
+            self._song = song
+            self._speed = speed
+            self._playing = True
+            self._move(position, song_ms)
+
+    def seek(self, position, song_ms):
+        """Jump the playing song to `position` seconds in, without touching the buffer."""
+        with self._lock:
+            self._move(position, song_ms)
+
+    def _move(self, position, song_ms):
+        self._song_frame = int(round(position * self.frame_rate))
+        self._start_clock = self._clock
+        self._start_ms = song_ms
+
+    def stop(self):
+        with self._lock:
+            self._playing = False
+            self._song = None
+
+    @property
+    def playing(self):
+        return self._playing
+
+    def song_time(self):
+        """Where the song is in ms, going by the samples that have been mixed."""
+        with self._lock:
+            return self._song_ms(self._clock)
+
+    def _song_ms(self, clock):
+        return self._start_ms + (clock - self._start_clock) * 1000 / self.frame_rate * self._speed
+
+    def mix(self, frames):
+        """The next `frames` frames of output as an (n, channels) int16 array."""
+        out = np.zeros((frames, self.channels), dtype=np.float32)
+        with self._lock:
+            if self._playing:
+                if self._song is not None:
+                    start = self._song_frame
+                    lo, hi = max(start, 0), min(start + frames, self._song.shape[0])
+                    if lo < hi:
+                        out[lo - start:hi - start] += self._song[lo:hi]
+                    self._song_frame += frames
+                start_ms, end_ms = self._song_ms(self._clock), self._song_ms(self._clock + frames)
+                if end_ms != start_ms:
+                    for times, sounds, pans in self._schedules.values():
+                        if end_ms > start_ms:
+                            lo, hi = np.searchsorted(times, (start_ms, end_ms), "left")
+                            offsets = (times[lo:hi] - start_ms) / (end_ms - start_ms) * frames
+                        else:  # Playing backwards, so the block covers (end_ms, start_ms] and runs down through it
+                            lo, hi = np.searchsorted(times, (end_ms, start_ms), "right")
+                            offsets = (start_ms - times[lo:hi]) / (start_ms - end_ms) * frames
+                        offsets = offsets.astype(np.int64)
+                        for offset, sound, pan in zip(offsets.tolist(), sounds[lo:hi].tolist(), pans[lo:hi].tolist()):
+                            self._voices.append([self._bank[sound][pan], -offset])
+            for sound, pan in self._triggered:
+                self._voices.append([self._bank[sound][pan], 0])
+            self._triggered = []
+            self._voices = self._voices[-MAX_VOICES:]
+            for voice in self._voices:
+                samples, position = voice
+                lo = max(position, 0)
+                hi = min(position + frames, samples.shape[0])
+                if lo < hi:
+                    out[lo - position:hi - position] += samples[lo:hi]
+                voice[1] = position + frames
+            self._voices = [voice for voice in self._voices if voice[1] < voice[0].shape[0]]
+            self._clock += frames
+        return np.clip(out, -32768, 32767).astype(np.int16)
+
+
+class NullOutput:
+    """No device at all, blocks only get mixed when pull() is called. For tests and headless runs."""
+
+    def __init__(self, mixer, block=512):
+        self.mixer = mixer
+        self.block = block
+        self.error = None
+
+    def pull(self, frames=None):
+        return self.mixer.mix(self.block if frames is None else frames)
+
+    def close(self):
+        pass
+
+
+class WaveOutput(NullOutput):
+    """Like NullOutput, but everything pulled also gets written to a .wav file."""
+
+    def __init__(self, mixer, filename, block=512):
+        super().__init__(mixer, block)
+        self.file = wave.open(filename, "wb")
+        self.file.setnchannels(mixer.channels)
+        self.file.setsampwidth(2)
+        self.file.setframerate(mixer.frame_rate)
+
+    def pull(self, frames=None):
+        block = super().pull(frames)
+        self.file.writeframes(block.astype("<i2").tobytes())
+        return block
+
+    def render(self, seconds):
+        """Pull `seconds` worth of audio through the mixer into the file."""
+        for _ in range(int(np.ceil(seconds * self.mixer.frame_rate / self.block))):
+            self.pull()
+
+    def close(self):
+        self.file.close()
+
+
+class SDLOutput:
+    """The real sound card, through an SDL audio device that calls back into the mixer."""
+
+    def __init__(self, mixer, block=512):
+        import sdl2  # Only needed for actual playback
+        self.sdl2 = sdl2
+        self.mixer = mixer
+        self.error = None
+        self.frame_bytes = 2 * mixer.channels
+        if sdl2.SDL_InitSubSystem(sdl2.SDL_INIT_AUDIO) < 0:
+            raise RuntimeError(f"Couldn't start SDL audio: {sdl2.SDL_GetError().decode('utf-8')}")
+        # Keep a reference, or the callback gets garbage collected while SDL still calls it
+        self._callback = sdl2.SDL_AudioCallback(self._fill)
+        desired = sdl2.SDL_AudioSpec(mixer.frame_rate, sdl2.AUDIO_S16SYS, mixer.channels, block, self._callback)
+        obtained = sdl2.SDL_AudioSpec(0, 0, 0, 0)
+        self.device = sdl2.SDL_OpenAudioDevice(None, 0, ctypes.byref(desired), ctypes.byref(obtained), 0)
+        if not self.device:
+            raise RuntimeError(f"Couldn't open an audio device: {sdl2.SDL_GetError().decode('utf-8')}")
+        sdl2.SDL_PauseAudioDevice(self.device, 0)
+
+    def _fill(self, _, stream, length):
+        try:
+            block = np.ascontiguousarray(self.mixer.mix(length // self.frame_bytes))
+            ctypes.memmove(stream, block.ctypes.data, length)
+        except Exception as e:  # Can't raise on the audio thread, the editor shows this instead
+            self.error = e
+            ctypes.memset(stream, 0, length)
+
+    def close(self):
+        if self.device:
+            self.sdl2.SDL_CloseAudioDevice(self.device)
+            self.device = 0
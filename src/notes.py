@@ -0,0 +1,263 @@
+import numpy as np
+
+
+class NoteStore:
+    """
+    Column-oriented note storage.
+    Times are kept sorted, so lookups are binary searches instead of dict walks.
+    Notes that share a time keep the order they were added in.
+    """
+
+    def __init__(self, times=(), x=(), y=()):
+        times = np.asarray(times, dtype=np.int32).reshape(-1)
+        x = np.asarray(x, dtype=np.float32).reshape(-1)
+        y = np.asarray(y, dtype=np.float32).reshape(-1)
+        assert times.shape == x.shape == y.shape, "Note columns have different lengths!"
+        order = np.argsort(times, kind="stable")
+        self._size = times.shape[0]
+        capacity = max(self._size, 16)
+        self._times = np.empty(capacity, dtype=np.int32)
+        self._x = np.empty(capacity, dtype=np.float32)
+        self._y = np.empty(capacity, dtype=np.float32)
+        self._ids = np.empty(capacity, dtype=np.int64)
+        self._times[:self._size] = times[order]
+        self._x[:self._size] = x[order]
+        self._y[:self._size] = y[order]
+        self._ids[:self._size] = np.arange(self._size, dtype=np.int64)
+        self._next_id = self._size
+        self._unique = None
+        self.version = 0  # Bumped on every edit, for caches keyed on the notes
+        # Set to a list to have every edit appended to it, as ("add"/"remove", times, x, y, ids) or ("shift", delta).
+        # The editor drains it every frame for the journal and undo
+        self.edits = None
+
+    @classmethod
+    def from_dict(cls, notes):
+        """Build a store from the old {time: [(x, y), ...]} layout."""
+        times, x, y = [], [], []
+        for timing, positions in notes.items():
+            for position in positions:
+                times.append(timing)
+                x.append(position[0])
+                y.append(position[1])
+        return cls(times, x, y)
+
+    def __len__(self):
+        return self._size
+
+    def __bool__(self):
+        return self._size > 0
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self._size} notes)"
+
+    # NOTE: These are views into the backing buffers. Don't hold onto them across edits.
+    @property
+    def times(self):
+        return self._times[:self._size]
+
+    @property
+    def x(self):
+        return self._x[:self._size]
+
+    @property
+    def y(self):
+        return self._y[:self._size]
+
+    @property
+    def ids(self):
+        return self._ids[:self._size]
+
+    def _columns(self):
+        return self._times, self._x, self._y, self._ids
+
+    def _changed(self):
+        self._unique = None
+        self.version += 1
+
+    def _record(self, *edit):
+        if self.edits is not None:
+            self.edits.append(edit)
+
+    def _reserve(self, extra):
+        needed = self._size + extra
+        if needed <= self._times.shape[0]:
+            return
+        capacity = max(needed, self._times.shape[0] * 2)
+        for name in ("_times", "_x", "_y", "_ids"):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    def copy(self):
+        new = self.__class__.__new__(self.__class__)
+        new._size = self._size
+        new._times, new._x, new._y, new._ids = (col.copy() for col in self._columns())
+        new._next_id = self._next_id
+        new._unique = self._unique
+        new.version = self.version
+        new.edits = None
+        return new
+
+    def start(self):
+        return int(self._times[0]) if self._size else None
+
+    def end(self):
+        return int(self._times[self._size - 1]) if self._size else None
+
+    def unique_times(self):
+        """Sorted array of every distinct note time. Cached until the next edit."""
+        if self._unique is None:
+            times = self.times
+            if times.shape[0]:
+                self._unique = times[np.concatenate(((True,), times[1:] != times[:-1]))]
+            else:
+                self._unique = np.zeros(0, dtype=np.int32)
+        return self._unique
+
+    def span(self, start, end):
+        """Row range (lo, hi) of notes with start <= time < end."""
+        times = self.times
+        return int(np.searchsorted(times, start, "left")), int(np.searchsorted(times, end, "left"))
+
+    def at(self, timing):
+        """Row range (lo, hi) of notes exactly at a time."""
+        times = self.times
+        return int(np.searchsorted(times, timing, "left")), int(np.searchsorted(times, timing, "right"))
+
+    def positions(self, lo=0, hi=None):
+        hi = self._size if hi is None else hi
+        return np.column_stack((self._x[lo:hi], self._y[lo:hi]))
+
+    def mean_positions(self, lo=0, hi=None):
+        """Each distinct time with the average position of the notes on it, for rows lo to hi."""
+        hi = self._size if hi is None else hi
+        times = self._times[lo:hi]
+        if not times.shape[0]:
+            return times.copy(), np.zeros(0, dtype=np.float64), np.zeros(0, dtype=np.float64)
+        starts = np.flatnonzero(np.concatenate(((True,), times[1:] != times[:-1])))
+        counts = np.diff(np.append(starts, times.shape[0]))
+        mean_x = np.add.reduceat(self._x[lo:hi].astype(np.float64), starts) / counts
+        mean_y = np.add.reduceat(self._y[lo:hi].astype(np.float64), starts) / counts
+        return times[starts], mean_x, mean_y
+
+    def add(self, timing, x, y):
+        """Insert a single note, returning its row id."""
+        i = int(np.searchsorted(self.times, timing, "right"))
+        self._reserve(1)
+        n = self._size
+        for col in self._columns():
+            col[i + 1:n + 1] = col[i:n]
+        self._times[i] = timing
+        self._x[i] = x
+        self._y[i] = y
+        self._ids[i] = self._next_id
+        self._next_id += 1
+        self._size += 1
+        self._changed()
+        self._record("add", self._times[i:i + 1].copy(), self._x[i:i + 1].copy(), self._y[i:i + 1].copy(),
+                     self._ids[i:i + 1].copy())
+        return int(self._ids[i])
+
+    def extend(self, times, x, y, ids=None):
+        """
+        Merge many notes in at once, returning their row ids.
+        ids is for putting removed notes back as they were (undo), new notes get new ones.
+        """
+        times = np.asarray(times, dtype=np.int32).reshape(-1)
+        x = np.broadcast_to(np.asarray(x, dtype=np.float32), times.shape)
+        y = np.broadcast_to(np.asarray(y, dtype=np.float32), times.shape)
+        order = np.argsort(times, kind="stable")
+        times, x, y = times[order], x[order], y[order]
+        if ids is None:
+            ids = np.arange(self._next_id, self._next_id + times.shape[0], dtype=np.int64)
+            self._next_id += times.shape[0]
+        else:
+            ids = np.asarray(ids, dtype=np.int64).reshape(-1)[order]
+            if ids.shape[0]:
+                self._next_id = max(self._next_id, int(ids.max()) + 1)
+        where = np.searchsorted(self.times, times, "right")
+        merged = [np.insert(col[:self._size], where, new) for col, new in zip(self._columns(), (times, x, y, ids))]
+        self._size = merged[0].shape[0]
+        self._times, self._x, self._y, self._ids = merged
+        self._reserve(16)
+        self._changed()
+        self._record("add", times, x, y, ids)
+        inverse = np.empty_like(order)
+        inverse[order] = np.arange(order.shape[0])
+        return ids[inverse]
+
+    def remove_rows(self, rows):
+        """Remove notes by row index, returning the removed (times, x, y, ids)."""
+        keep = np.ones(self._size, dtype=bool)
+        keep[np.asarray(rows, dtype=np.int64).reshape(-1)] = False
+        rows = np.flatnonzero(~keep)  # Sorted and deduplicated, without np.unique hashing every row
+        removed = tuple(col[rows] for col in (self.times, self.x, self.y, self.ids))
+        kept = int(np.count_nonzero(keep))
+        for col in self._columns():
+            col[:kept] = col[:self._size][keep]
+        self._size = kept
+        self._changed()
+        self._record("remove", *removed)
+        return removed
+
+    def remove_range(self, start, end):
+        """Remove notes with start <= time <= end, returning the removed (times, x, y, ids)."""
+        times = self.times
+        lo, hi = int(np.searchsorted(times, start, "left")), int(np.searchsorted(times, end, "right"))
+        removed = tuple(col[lo:hi].copy() for col in (self.times, self.x, self.y, self.ids))
+        n = self._size
+        for col in self._columns():
+            col[lo:n - (hi - lo)] = col[hi:n]
+        self._size -= hi - lo
+        self._changed()
+        self._record("remove", *removed)
+        return removed
+
+    def shift(self, delta):
+        """Move every note by delta ms. Order doesn't change, so this doesn't need a resort."""
+        self._times[:self._size] += np.int32(delta)
+        self._changed()
+        self._record("shift", int(delta))
+
+    def find(self, times, x, y):
+        """
+        Rows of the notes exactly matching each (time, x, y), -1 where there's none.
+        Duplicates match different rows, so the result can go straight to remove_rows.
+        """
+        times = np.asarray(times, dtype=np.int32).reshape(-1)
+        rows = np.full(times.shape, -1, dtype=np.int64)
+        if not times.shape[0] or not self._size:
+            return rows
+        lo = int(np.searchsorted(self.times, times.min(), "left"))
+        hi = int(np.searchsorted(self.times, times.max(), "right"))
+        # NOTE: Positions are compared by their bits, so -0.0 and nan don't get in the way
+        candidates = {}
+        for row, key in enumerate(zip(self.times[lo:hi].tolist(), self.x[lo:hi].view(np.uint32).tolist(),
+                                      self.y[lo:hi].view(np.uint32).tolist()), lo):
+            candidates.setdefault(key, []).append(row)
+        x = np.asarray(x, dtype=np.float32).reshape(-1).view(np.uint32)
+        y = np.asarray(y, dtype=np.float32).reshape(-1).view(np.uint32)
+        for i, key in enumerate(zip(times.tolist(), x.tolist(), y.tolist())):
+            matches = candidates.get(key)
+            if matches:
+                rows[i] = matches.pop(0)
+        return rows
+
+    def rows_of(self, ids, times=None):
+        """
+        Current row indices of the given row ids, -1 where the id isn't present.
+        If the notes' times are known, only rows around them get searched.
+        """
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        lo, hi = 0, self._size
+        if times is not None and ids.shape[0]:
+            times = np.asarray(times)
+            lo, hi = self.span(times.min(), int(times.max()) + 1)
+        if not ids.shape[0] or lo == hi:
+            return np.full(ids.shape, -1, dtype=np.int64)
+        window = self.ids[lo:hi]
+        order = np.argsort(window)
+        rows = order[np.minimum(np.searchsorted(window, ids, sorter=order), hi - lo - 1)]
+        return np.where(window[rows] == ids, rows + lo, -1)
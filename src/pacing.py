@@ -0,0 +1,47 @@
+import time
+
+ACTIVE_GRACE = 0.25  # Keep drawing at full rate this long after the last input, so imgui can finish hovers and such
+IDLE_TIMEOUT = 0.5  # Nothing's moving, so wake up this often at most
+BACKGROUND_FPS = 10  # Playing, but in the background
+MINIMIZED_TIMEOUT = 1.0
+
+
+class FramePacer:
+    """
+    Decides how long to wait after each frame.
+    While something is moving (playback, decoding, saving, dragging) or there was input recently, frames get capped
+    at fps_cap like always. Once nothing has happened for a bit, it blocks until the next event instead of redrawing
+    the same frame over and over. Unfocused windows get throttled and minimized ones barely draw at all.
+    Any event ends the wait straight away, so it's back to full rate on the next frame.
+    `wait_event(seconds)` should block until there's an event or the timeout runs out, without taking the event.
+    """
+
+    def __init__(self, wait_event, sleep=time.sleep, clock=time.perf_counter):
+        self.wait_event = wait_event
+        self.sleep = sleep
+        self.clock = clock
+        self.enabled = True
+        self.last_active = clock()
+
+    def poke(self):
+        """Something happened (usually an event), so draw at full rate for a while."""
+        self.last_active = self.clock()
+
+    def idle(self):
+        return self.clock() - self.last_active > ACTIVE_GRACE
+
+    def pace(self, frame_time, fps_cap=None, busy=False, focused=True, minimized=False):
+        """
+        Wait out the rest of the frame. frame_time is how long this one took in seconds,
+        fps_cap is None with vsync on (the swap already waited).
+        """
+        if busy:
+            self.poke()
+        if self.enabled and minimized:
+            self.wait_event(MINIMIZED_TIMEOUT)
+        elif self.enabled and self.idle():
+            self.wait_event(IDLE_TIMEOUT)
+        elif self.enabled and not focused:
+            self.wait_event(max(1 / BACKGROUND_FPS - frame_time, 0))
+        elif fps_cap is not None:
+            self.sleep(max(1 / fps_cap - frame_time, 0))
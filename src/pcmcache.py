@@ -0,0 +1,107 @@
+import threading
+from collections import OrderedDict
+
+from src.mixer import segment_to_frames
+
+
+def time_scale(sound, speed, frame_rate):
+    """The sound sped up (and pitched) by `speed`, reversed if it's negative, at the given frame rate."""
+    if speed < 0:
+        sound = sound.reverse()
+    assert sound.duration_seconds / abs(speed) < 3600, "The audio that was going to be played is too large.\nIf you want to circumvent this check, go to time_scale in src/pcmcache.py and remove the asserts."
+    assert abs(
+        speed) * sound.frame_rate < 2147483647, "The audio that was going to be played is too fast, and the speed in samples can't be converted to a C integer."
+    sound_with_altered_frame_rate = sound._spawn(sound.raw_data, overrides={
+        "frame_rate": int(sound.frame_rate * abs(speed))
+    })
+    return sound_with_altered_frame_rate.set_frame_rate(frame_rate)
+
+
+class PCMCache:
+    """
+    Song audio ready for the mixer, with the volume and playback speed already applied.
+    Entries are kept most recently used first, and the oldest ones get dropped past `budget` bytes.
+    prefetch() prepares one in the background, so pressing play right after changing the speed doesn't stall.
+    """
+
+    def __init__(self, frame_rate, channels, budget=512 * 1024 * 1024):
+        self.frame_rate = frame_rate
+        self.channels = channels
+        self.budget = budget
+        self._entries = OrderedDict()  # (speed, volume) -> frames
+        self._audio = None
+        self._lock = threading.Lock()
+        self._preparing = {}  # key -> Event, so a get() waits for a prefetch instead of doing it twice
+        self._wanted = None
+        self._wake = threading.Event()
+        self._worker = threading.Thread(target=self._work, daemon=True)
+        self._worker.start()
+
+    @property
+    def size(self):
+        return sum(frames.nbytes for frames in self._entries.values())
+
+    def _prepare(self, audio, speed, volume):
+        return segment_to_frames(time_scale(audio + volume, speed, self.frame_rate), self.frame_rate, self.channels)
+
+    def _claim(self, audio, key):
+        """Returns (frames, None) if it's cached, (None, event) to wait on, or (None, None) if the caller should prepare it."""
+        with self._lock:
+            if audio is not self._audio:  # New song, nothing in here is any good anymore
+                self._audio = audio
+                self._entries.clear()
+            if key in self._entries:
+                self._entries.move_to_end(key, last=False)
+                return self._entries[key], None
+            if key in self._preparing:
+                return None, self._preparing[key]
+            self._preparing[key] = threading.Event()
+            return None, None
+
+    def _store(self, audio, key, frames):
+        with self._lock:
+            event = self._preparing.pop(key)
+            if frames is not None and audio is self._audio:
+                self._entries[key] = frames
+                self._entries.move_to_end(key, last=False)
+                while len(self._entries) > 1 and self.size > self.budget:
+                    self._entries.popitem()
+            event.set()
+
+    def get(self, audio, speed, volume):
+        """Prepared frames for the song at this speed and volume, from the cache if possible."""
+        key = (speed, volume)
+        while True:
+            frames, event = self._claim(audio, key)
+            if frames is not None:
+                return frames
+            if event is None:
+                break
+            event.wait()  # Someone else was already on it, check again once they're done
+            with self._lock:
+                if key in self._entries and audio is self._audio:
+                    return self._entries[key]
+            # They failed, so try it here and let the error come out
+        frames = None
+        try:
+            frames = self._prepare(audio, speed, volume)
+            return frames
+        finally:
+            self._store(audio, key, frames)
+
+    def prefetch(self, audio, speed, volume):
+        """Prepare this in the background. Only the latest request is kept, so dragging a slider doesn't queue up work."""
+        self._wanted = (audio, speed, volume)
+        self._wake.set()
+
+    def _work(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            wanted, self._wanted = self._wanted, None
+            if wanted is None:
+                continue
+            try:
+                self.get(*wanted)
+            except Exception:  # It'll fail again in get() when it's actually played, and get shown there
+                pass
@@ -0,0 +1,69 @@
+import http.client
+import queue
+import threading
+import time
+
+UPDATE_INTERVAL = 15  # Discord drops presence updates that come faster than this
+_CLOSE = object()
+
+
+class PresenceWorker:
+    """
+    Discord rich presence, on its own thread so the editor never waits on the network.
+    update() only queues the state. The worker sends the newest one and drops the rest,
+    at most once per UPDATE_INTERVAL. If there's no internet or Discord isn't open, updates go nowhere.
+    """
+
+    def __init__(self, client_id):
+        self.client_id = client_id
+        self.connected = False
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def update(self, **state):
+        self._queue.put(state)
+
+    def close(self):
+        self._queue.put(_CLOSE)
+
+    def _connect(self):
+        # Only connect if connected to the internet
+        conn = http.client.HTTPSConnection("1.1.1.1", timeout=5)
+        try:
+            conn.request("HEAD", "/")
+            from pypresence import Presence  # Made here, since it sets up an event loop for this thread
+            rpc = Presence(self.client_id)
+            rpc.connect()
+            return rpc
+        except Exception:  # Offline, or Discord isn't running
+            return None
+        finally:
+            conn.close()
+
+    def _run(self):
+        rpc = self._connect()
+        self.connected = rpc is not None
+        last = None
+        while True:
+            state = self._queue.get()
+            while True:  # Only the newest state matters
+                try:
+                    state = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if state is _CLOSE:
+                break
+            if rpc is None or state == last:
+                continue
+            try:
+                rpc.update(**state)
+                last = state
+            except Exception:  # Discord got closed, keep quiet about it like when it was never there
+                continue
+            time.sleep(UPDATE_INTERVAL)
+        if rpc is not None:
+            try:
+                rpc.close()
+            except Exception:
+                pass
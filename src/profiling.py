@@ -0,0 +1,100 @@
+import csv
+import time
+
+import numpy as np
+
+
+class StartupProfile:
+    """
+    How long each phase of startup took, up to the first frame. Printed with --startup-profile.
+    Every mark() closes the phase that started at the previous one.
+    """
+
+    def __init__(self, start=None, enabled=False):
+        self.enabled = enabled
+        self.phases = []
+        self._start = self._last = start if start is not None else time.perf_counter()
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.phases.append((name, now - self._last))
+        self._last = now
+
+    @property
+    def total(self):
+        return self._last - self._start
+
+    def report(self):
+        lines = [f"{name:<24}{seconds * 1000:>10.1f} ms" for name, seconds in self.phases]
+        lines.append(f"{'time to first frame':<24}{self.total * 1000:>10.1f} ms")
+        return "\n".join(lines)
+
+
+class FrameProfile:
+    """
+    Where each frame's time goes, for the last `capacity` frames.
+    Like StartupProfile, every lap() closes the section that started at the previous one,
+    so the sections always add up to the whole frame. A section that runs more than once in a frame adds up.
+    """
+
+    def __init__(self, capacity=600):
+        self.capacity = capacity
+        self.sections = []
+        self._columns = {}
+        self.samples = np.zeros((capacity, 0), dtype=np.float64)  # Seconds, one row per frame
+        self.totals = np.zeros(capacity, dtype=np.float32)
+        self.frames = 0
+        self._row = np.zeros(0, dtype=np.float64)
+        self._start = self._last = time.perf_counter()
+
+    def start_frame(self):
+        self._row[:] = 0
+        self._start = self._last = time.perf_counter()
+
+    def lap(self, name):
+        now = time.perf_counter()
+        column = self._columns.get(name)
+        if column is None:
+            column = self._columns[name] = len(self.sections)
+            self.sections.append(name)
+            self.samples = np.pad(self.samples, ((0, 0), (0, 1)))
+            self._row = np.pad(self._row, (0, 1))
+        self._row[column] += now - self._last
+        self._last = now
+
+    def end_frame(self):
+        i = self.frames % self.capacity
+        self.samples[i] = self._row
+        self.totals[i] = self._last - self._start
+        self.frames += 1
+
+    def _recorded(self, array):
+        """The recorded part of a ring buffer, oldest first."""
+        if self.frames < self.capacity:
+            return array[:self.frames]
+        return np.roll(array, -(self.frames % self.capacity), axis=0)
+
+    def frame_times(self):
+        """Frame times in ms, oldest first, as float32 for imgui's plots."""
+        return self._recorded(self.totals) * 1000
+
+    def stats(self):
+        """(name, mean, p95, max) in ms for every section, then the whole frame."""
+        samples = self._recorded(self.samples)
+        if not samples.shape[0]:
+            return []
+        samples = np.column_stack((samples, self._recorded(self.totals))) * 1000
+        mean = samples.mean(axis=0)
+        p95 = np.percentile(samples, 95, axis=0)
+        peak = samples.max(axis=0)
+        return list(zip([*self.sections, "frame"], mean.tolist(), p95.tolist(), peak.tolist()))
+
+    def export_csv(self, filename):
+        """Every recorded frame as a row of ms per section, oldest first."""
+        rows = np.column_stack((self._recorded(self.samples), self._recorded(self.totals))) * 1000
+        first = max(self.frames - self.capacity, 0)
+        with open(filename, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["frame", *self.sections, "total"])
+            for i, row in enumerate(rows.tolist()):
+                writer.writerow([first + i, *(f"{ms:.4f}" for ms in row)])
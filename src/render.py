@@ -0,0 +1,361 @@
+import ctypes
+
+import numpy as np
+import OpenGL.GL as GL
+
+# One of these per visible note. time is relative to the current time, so float32 doesn't lose precision on long maps
+NOTE_INSTANCE = np.dtype([("time", "<f4"), ("x", "<f4"), ("y", "<f4"), ("color", "<u4")])
+
+VERTEX_SHADER = """
+#version 330 core
+layout(location = 0) in vec2 corner;
+layout(location = 1) in float rel_time;
+layout(location = 2) in vec2 note_pos;
+layout(location = 3) in uint color;
+
+uniform float approach_rate;
+uniform float approach_distance;
+uniform float spacing;
+uniform float rounding;
+uniform float size;
+uniform vec2 camera;
+uniform vec2 center;
+uniform vec2 origin;
+uniform vec2 viewport;
+
+out vec2 local;
+flat out float half_size;
+flat out float radius;
+flat out float thickness;
+flat out vec4 tint;
+
+void main() {
+    // Same math as Editor.note_pos_to_abs_pos and Editor.draw_note
+    float progress = 1.0 - rel_time / approach_rate;
+    float scale = 1.0 / (1.0 + (1.0 - progress) * approach_distance);
+    vec2 position = center + (note_pos + camera - 1.0) * spacing;
+    position = position * scale + center * (1.0 - scale);
+    float note_size = (spacing / 1.25) * scale * size;
+    half_size = floor(note_size / 2.0);
+    thickness = max(floor(note_size / 8.0), 0.0);
+    radius = min(rounding * note_size / 2.0, half_size);
+    uvec4 channels = (uvec4(color) >> uvec4(0u, 8u, 16u, 24u)) & 0xFFu;  // imgui colors are ABGR
+    tint = vec4(channels) / 255.0;
+    tint.a *= max(progress, 0.0);
+    local = corner * (half_size + thickness + 1.0);
+    vec2 pixel = position + local - origin;
+    gl_Position = vec4(pixel.x / viewport.x * 2.0 - 1.0, 1.0 - pixel.y / viewport.y * 2.0, 0.0, 1.0);
+    if (progress > 1.0) {
+        gl_Position = vec4(2.0, 2.0, 2.0, 1.0);  // Behind the camera, put it off screen
+    }
+}
+"""
+
+FRAGMENT_SHADER = """
+#version 330 core
+in vec2 local;
+flat in float half_size;
+flat in float radius;
+flat in float thickness;
+flat in vec4 tint;
+
+out vec4 out_color;
+
+void main() {
+    // Signed distance to the rounded square's edge, then keep a band as wide as the outline
+    vec2 q = abs(local) - vec2(half_size - radius);
+    float dist = length(max(q, 0.0)) + min(max(q.x, q.y), 0.0) - radius;
+    float coverage = clamp(thickness / 2.0 + 0.5 - abs(dist), 0.0, 1.0);
+    if (coverage <= 0.0) {
+        discard;
+    }
+    out_color = vec4(tint.rgb, 1.0) * (tint.a * coverage);  // Premultiplied, see RenderTarget
+}
+"""
+
+# Filled rects, one instance each, for layers that get drawn once and cached
+RECT_INSTANCE = np.dtype([("box", "<f4", 4), ("color", "<u4")])
+
+RECT_VERTEX_SHADER = """
+#version 330 core
+layout(location = 0) in vec2 corner;
+layout(location = 1) in vec4 box;
+layout(location = 2) in uint color;
+
+uniform vec2 viewport;
+
+flat out vec4 tint;
+
+void main() {
+    uvec4 channels = (uvec4(color) >> uvec4(0u, 8u, 16u, 24u)) & 0xFFu;
+    tint = vec4(channels) / 255.0;
+    vec2 pixel = mix(min(box.xy, box.zw), max(box.xy, box.zw), (corner + 1.0) / 2.0);
+    gl_Position = vec4(pixel.x / viewport.x * 2.0 - 1.0, 1.0 - pixel.y / viewport.y * 2.0, 0.0, 1.0);
+}
+"""
+
+RECT_FRAGMENT_SHADER = """
+#version 330 core
+flat in vec4 tint;
+
+out vec4 out_color;
+
+void main() {
+    out_color = vec4(tint.rgb, 1.0) * tint.a;
+}
+"""
+
+# Turns the premultiplied texture back into straight alpha, which is what imgui blends with
+RESOLVE_VERTEX_SHADER = """
+#version 330 core
+out vec2 uv;
+
+void main() {
+    // One triangle that covers the whole viewport, no vertex buffer needed
+    vec2 position = vec2((gl_VertexID << 1) & 2, gl_VertexID & 2);
+    uv = position;
+    gl_Position = vec4(position * 2.0 - 1.0, 0.0, 1.0);
+}
+"""
+
+RESOLVE_FRAGMENT_SHADER = """
+#version 330 core
+in vec2 uv;
+
+uniform sampler2D premultiplied;
+
+out vec4 out_color;
+
+void main() {
+    vec4 color = texture(premultiplied, uv);
+    out_color = color.a > 0.0 ? vec4(color.rgb / color.a, color.a) : vec4(0.0);
+}
+"""
+
+
+def compile_program(vertex_source, fragment_source):
+    shaders = []
+    for source, kind in ((vertex_source, GL.GL_VERTEX_SHADER), (fragment_source, GL.GL_FRAGMENT_SHADER)):
+        shader = GL.glCreateShader(kind)
+        GL.glShaderSource(shader, source)
+        GL.glCompileShader(shader)
+        if not GL.glGetShaderiv(shader, GL.GL_COMPILE_STATUS):
+            raise RuntimeError(f"Shader didn't compile: {GL.glGetShaderInfoLog(shader).decode('utf-8')}")
+        shaders.append(shader)
+    program = GL.glCreateProgram()
+    for shader in shaders:
+        GL.glAttachShader(program, shader)
+    GL.glLinkProgram(program)
+    if not GL.glGetProgramiv(program, GL.GL_LINK_STATUS):
+        raise RuntimeError(f"Shader didn't link: {GL.glGetProgramInfoLog(program).decode('utf-8')}")
+    for shader in shaders:
+        GL.glDeleteShader(shader)
+    return program
+
+
+def create_texture(width, height):
+    texture = GL.glGenTextures(1)
+    GL.glBindTexture(GL.GL_TEXTURE_2D, texture)
+    GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAG_FILTER, GL.GL_NEAREST)
+    GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER, GL.GL_NEAREST)
+    GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, GL.GL_RGBA8, width, height, 0, GL.GL_RGBA, GL.GL_UNSIGNED_BYTE, None)
+    framebuffer = GL.glGenFramebuffers(1)
+    GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, framebuffer)
+    GL.glFramebufferTexture2D(GL.GL_FRAMEBUFFER, GL.GL_COLOR_ATTACHMENT0, GL.GL_TEXTURE_2D, texture, 0)
+    GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, 0)
+    return texture, framebuffer
+
+
+class RenderTarget:
+    """
+    An offscreen texture that gets drawn into, then shown in imgui with add_image.
+    Drawing happens premultiplied so overlapping translucent things blend right,
+    then end() converts it to straight alpha, since that's what imgui expects.
+    """
+    resolve_program = None
+
+    def __init__(self):
+        if RenderTarget.resolve_program is None:
+            RenderTarget.resolve_program = compile_program(RESOLVE_VERTEX_SHADER, RESOLVE_FRAGMENT_SHADER)
+        self.vao = GL.glGenVertexArrays(1)  # Core profile won't draw without one bound, even if it's empty
+        self.buffers = []
+        self.texture = None
+        self.size = (0, 0)
+
+    def resize(self, width, height):
+        width, height = max(int(width), 1), max(int(height), 1)
+        if (width, height) == self.size:
+            return False
+        self.size = (width, height)
+        for texture, framebuffer in self.buffers:
+            GL.glDeleteTextures(1, [texture])
+            GL.glDeleteFramebuffers(1, [framebuffer])
+        self.buffers = [create_texture(width, height), create_texture(width, height)]
+        self.texture = self.buffers[1][0]
+        return True
+
+    def begin(self):
+        GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, self.buffers[0][1])
+        GL.glViewport(0, 0, *self.size)
+        GL.glDisable(GL.GL_SCISSOR_TEST)
+        GL.glClearColor(0, 0, 0, 0)
+        GL.glClear(GL.GL_COLOR_BUFFER_BIT)
+        GL.glEnable(GL.GL_BLEND)
+        GL.glBlendFunc(GL.GL_ONE, GL.GL_ONE_MINUS_SRC_ALPHA)
+
+    def end(self):
+        GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, self.buffers[1][1])
+        GL.glDisable(GL.GL_BLEND)
+        GL.glUseProgram(RenderTarget.resolve_program)
+        GL.glActiveTexture(GL.GL_TEXTURE0)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, self.buffers[0][0])
+        GL.glBindVertexArray(self.vao)
+        GL.glDrawArrays(GL.GL_TRIANGLES, 0, 3)
+        GL.glBindVertexArray(0)
+        GL.glUseProgram(0)
+        GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, 0)
+
+    def image(self, draw_list, x, y):
+        """Show the texture with its top left corner at (x, y). The texture is stored bottom-up."""
+        draw_list.add_image(self.texture, (x, y), (x + self.size[0], y + self.size[1]), (0, 1), (1, 0))
+
+
+class NoteRenderer:
+    """
+    Draws the playfield's notes as one instanced draw call.
+    Perspective, approach and camera parallax happen in the vertex shader,
+    so the CPU only uploads (time, x, y, color) for the notes that are visible.
+    """
+
+    def __init__(self):
+        self.program = compile_program(VERTEX_SHADER, FRAGMENT_SHADER)
+        self.uniforms = {name: GL.glGetUniformLocation(self.program, name) for name in
+                         ("approach_rate", "approach_distance", "spacing", "rounding", "size",
+                          "camera", "center", "origin", "viewport")}
+        self.target = RenderTarget()
+        self.vao = GL.glGenVertexArrays(1)
+        GL.glBindVertexArray(self.vao)
+        self.quad = GL.glGenBuffers(1)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.quad)
+        corners = np.array((-1, -1, 1, -1, -1, 1, 1, 1), dtype=np.float32)
+        GL.glBufferData(GL.GL_ARRAY_BUFFER, corners.nbytes, corners, GL.GL_STATIC_DRAW)
+        GL.glEnableVertexAttribArray(0)
+        GL.glVertexAttribPointer(0, 2, GL.GL_FLOAT, GL.GL_FALSE, 0, None)
+        self.instances = GL.glGenBuffers(1)
+        self.capacity = 0
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.instances)
+        stride = NOTE_INSTANCE.itemsize
+        GL.glEnableVertexAttribArray(1)
+        GL.glVertexAttribPointer(1, 1, GL.GL_FLOAT, GL.GL_FALSE, stride, ctypes.c_void_p(0))
+        GL.glEnableVertexAttribArray(2)
+        GL.glVertexAttribPointer(2, 2, GL.GL_FLOAT, GL.GL_FALSE, stride, ctypes.c_void_p(4))
+        GL.glEnableVertexAttribArray(3)
+        GL.glVertexAttribIPointer(3, 1, GL.GL_UNSIGNED_INT, stride, ctypes.c_void_p(12))
+        for attribute in (1, 2, 3):
+            GL.glVertexAttribDivisor(attribute, 1)
+        GL.glBindVertexArray(0)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+        self.pending = None
+
+    def queue(self, draw_list, instances, region, **uniforms):
+        """
+        Put the notes in the draw list at this point, covering region (x, y, w, h).
+        The actual drawing happens in render(), which has to be called before imgui renders the frame.
+        """
+        x, y, w, h = region
+        self.target.resize(w, h)
+        self.pending = (instances, (float(x), float(y)), uniforms)
+        self.target.image(draw_list, x, y)
+
+    def render(self):
+        if self.pending is None:
+            return
+        instances, origin, uniforms = self.pending
+        self.pending = None
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.instances)
+        if instances.nbytes > self.capacity:
+            self.capacity = max(instances.nbytes, self.capacity * 2, 4096)
+            GL.glBufferData(GL.GL_ARRAY_BUFFER, self.capacity, None, GL.GL_STREAM_DRAW)
+        if instances.nbytes:
+            GL.glBufferSubData(GL.GL_ARRAY_BUFFER, 0, instances.nbytes, instances)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+        self.target.begin()
+        GL.glUseProgram(self.program)
+        for name in ("approach_rate", "approach_distance", "spacing", "rounding", "size"):
+            GL.glUniform1f(self.uniforms[name], float(uniforms[name]))
+        for name in ("camera", "center"):
+            GL.glUniform2f(self.uniforms[name], *map(float, uniforms[name]))
+        GL.glUniform2f(self.uniforms["origin"], *origin)
+        GL.glUniform2f(self.uniforms["viewport"], *map(float, self.target.size))
+        GL.glBindVertexArray(self.vao)
+        if instances.shape[0]:
+            GL.glDrawArraysInstanced(GL.GL_TRIANGLE_STRIP, 0, 4, instances.shape[0])
+        GL.glBindVertexArray(0)
+        GL.glUseProgram(0)
+        self.target.end()
+
+
+class RectRenderer:
+    """Draws batches of filled rects into a RenderTarget with one instanced draw call."""
+
+    def __init__(self):
+        self.program = compile_program(RECT_VERTEX_SHADER, RECT_FRAGMENT_SHADER)
+        self.viewport = GL.glGetUniformLocation(self.program, "viewport")
+        self.vao = GL.glGenVertexArrays(1)
+        GL.glBindVertexArray(self.vao)
+        self.quad = GL.glGenBuffers(1)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.quad)
+        corners = np.array((-1, -1, 1, -1, -1, 1, 1, 1), dtype=np.float32)
+        GL.glBufferData(GL.GL_ARRAY_BUFFER, corners.nbytes, corners, GL.GL_STATIC_DRAW)
+        GL.glEnableVertexAttribArray(0)
+        GL.glVertexAttribPointer(0, 2, GL.GL_FLOAT, GL.GL_FALSE, 0, None)
+        self.instances = GL.glGenBuffers(1)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.instances)
+        stride = RECT_INSTANCE.itemsize
+        GL.glEnableVertexAttribArray(1)
+        GL.glVertexAttribPointer(1, 4, GL.GL_FLOAT, GL.GL_FALSE, stride, ctypes.c_void_p(0))
+        GL.glEnableVertexAttribArray(2)
+        GL.glVertexAttribIPointer(2, 1, GL.GL_UNSIGNED_INT, stride, ctypes.c_void_p(16))
+        for attribute in (1, 2):
+            GL.glVertexAttribDivisor(attribute, 1)
+        GL.glBindVertexArray(0)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+
+    def render(self, target, batches):
+        """Draw (boxes, color) batches in order, boxes being (n, 4) arrays of x0, y0, x1, y1."""
+        instances = np.empty(sum(len(boxes) for boxes, _ in batches), dtype=RECT_INSTANCE)
+        start = 0
+        for boxes, color in batches:
+            instances["box"][start:start + len(boxes)] = boxes
+            instances["color"][start:start + len(boxes)] = color
+            start += len(boxes)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.instances)
+        GL.glBufferData(GL.GL_ARRAY_BUFFER, max(instances.nbytes, 1), instances if instances.nbytes else None,
+                        GL.GL_STATIC_DRAW)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+        target.begin()
+        GL.glUseProgram(self.program)
+        GL.glUniform2f(self.viewport, *map(float, target.size))
+        GL.glBindVertexArray(self.vao)
+        if instances.shape[0]:
+            GL.glDrawArraysInstanced(GL.GL_TRIANGLE_STRIP, 0, 4, instances.shape[0])
+        GL.glBindVertexArray(0)
+        GL.glUseProgram(0)
+        target.end()
+
+
+class CachedLayer:
+    """
+    Rects that only change once in a while, drawn once into a texture and reused until their key changes.
+    """
+
+    def __init__(self):
+        self.renderer = RectRenderer()
+        self.target = RenderTarget()
+
+    def render(self, batches, width, height):
+        self.target.resize(width, height)
+        self.renderer.render(self.target, batches)
+
+    def image(self, draw_list, x, y):
+        self.target.image(draw_list, x, y)
@@ -2,8 +2,6 @@ import json
 import re
 from pathlib import Path
 
-import chparse
-
 
 def import_timings(filepath, game) -> list[int]:
     timings = set()
@@ -66,6 +64,7 @@ def import_timings(filepath, game) -> list[int]:
             timings.add(int(lines[i].split(",")[2]))
             i += 1
     elif game == 2:  # Clone Hero
+        import chparse  # Only needed here, so it's not imported on startup
         assert Path(filepath).suffix == ".chart", "Unsupported file format! Required: .chart"
         with open(filepath, "r") as f:
             raw_chart = f.read().replace("\r", "")
@@ -0,0 +1,136 @@
+import numpy as np
+
+from src.beatgrid import BeatGrid
+
+CENTER = 1.0  # Middle of the 3x3 grid, where mirroring and rotating happen around
+KEEP_BOTH, REPLACE, LEAVE = range(3)
+COLLISION_NAMES = ("Keep both", "Replace existing", "Leave in place")
+INT32 = np.iinfo(np.int32)
+
+
+def quantize(times, grid):
+    """Snap each time to the nearest tick in the sorted `grid`."""
+    times = np.asarray(times, dtype=np.float64)
+    if not grid.shape[0]:
+        return times
+    right = np.minimum(np.searchsorted(grid, times), grid.shape[0] - 1)
+    left = np.maximum(right - 1, 0)
+    return np.where(np.abs(times - grid[left]) <= np.abs(grid[right] - times), grid[left], grid[right])
+
+
+def grid_ticks(bpm, offset, swing, time_signature, beat_divisor, start, end):
+    """Every beat grid tick from start to end, plus the offset itself (there are no ticks before it)."""
+    if bpm <= 0:
+        return np.zeros(0, dtype=np.float64)
+    ticks = BeatGrid(bpm, offset, swing, time_signature, beat_divisor, start, end).times
+    return np.concatenate(((float(offset),), ticks))
+
+
+def duplicates(times, x, y):
+    """Rows that exactly repeat an earlier row (same time, same position bits)."""
+    repeated = np.zeros(times.shape[0], dtype=bool)
+    # Only rows sharing a time with another row can be duplicates, so only those get the full sort
+    by_time = np.argsort(times, kind="stable")
+    same_time = times[by_time][1:] == times[by_time][:-1]
+    shared = np.zeros(times.shape[0], dtype=bool)
+    shared[1:] |= same_time
+    shared[:-1] |= same_time
+    rows = by_time[shared]
+    if not rows.shape[0]:
+        return repeated
+    xb, yb = x[rows].view(np.uint32), y[rows].view(np.uint32)
+    order = np.lexsort((rows, yb, xb, times[rows]))
+    same = ((times[rows][order][1:] == times[rows][order][:-1]) & (xb[order][1:] == xb[order][:-1])
+            & (yb[order][1:] == yb[order][:-1]))
+    repeated[rows[order][1:][same]] = True
+    return repeated
+
+
+class NoteTransform:
+    """
+    Settings for moving a bunch of notes at once. Times get scaled around the pivot, then shifted, then snapped
+    to the grid if there is one. Positions get mirrored, then rotated clockwise around the middle of the grid.
+    """
+
+    def __init__(self):
+        self.shift = 0
+        self.scale = 1.0
+        self.mirror_x = False
+        self.mirror_y = False
+        self.rotation = 0.0  # Degrees
+        self.quantize = False
+
+    def key(self):
+        return self.shift, self.scale, self.mirror_x, self.mirror_y, self.rotation, self.quantize
+
+    def apply(self, times, x, y, pivot=0, grid=None):
+        """New (times, x, y) columns for the notes. grid is the ticks to quantize to."""
+        new_times = (np.asarray(times, dtype=np.float64) - pivot) * self.scale + pivot + self.shift
+        if self.quantize and grid is not None:
+            new_times = quantize(new_times, grid)
+        new_times = np.clip(np.rint(new_times), INT32.min, INT32.max).astype(np.int32)
+        x = np.asarray(x, dtype=np.float64) - CENTER
+        y = np.asarray(y, dtype=np.float64) - CENTER
+        if self.mirror_x:
+            x = -x
+        if self.mirror_y:
+            y = -y
+        if self.rotation % 360:
+            # NOTE: y points down, so this turns clockwise on screen
+            if self.rotation % 90 == 0:  # Exact, so notes on the grid stay on it
+                cos, sin = ((1, 0), (0, 1), (-1, 0), (0, -1))[int(self.rotation % 360) // 90]
+            else:
+                angle = np.radians(self.rotation)
+                cos, sin = np.cos(angle), np.sin(angle)
+            x, y = x * cos - y * sin, x * sin + y * cos
+        return new_times, (x + CENTER).astype(np.float32), (y + CENTER).astype(np.float32)
+
+
+class BulkEdit:
+    """
+    What running a transform over the notes from start to end (inclusive) would do, worked out up front
+    so it can be previewed before anything changes. Notes that land on the time of a note outside the range are
+    collisions, and get handled by `collisions`: both kept (the moved one gets dropped if it's an exact
+    duplicate), the existing ones replaced, or the moved one left where it was.
+    """
+
+    def __init__(self, notes, start, end, transform, collisions=KEEP_BOTH, grid=None):
+        self.notes = notes
+        self.version = notes.version
+        lo, hi = notes.span(start, end + 1)
+        self.count = hi - lo
+        times, x, y = transform.apply(notes.times[lo:hi], notes.x[lo:hi], notes.y[lo:hi], start, grid)
+        other_times = np.concatenate((notes.times[:lo], notes.times[hi:]))  # Still sorted, the range was cut out
+        hit = np.zeros(times.shape[0], dtype=bool)
+        if other_times.shape[0]:
+            where = np.minimum(np.searchsorted(other_times, times), other_times.shape[0] - 1)
+            hit = other_times[where] == times
+        self.collisions = int(np.count_nonzero(hit))
+        if collisions == LEAVE:
+            times[hit], x[hit], y[hit] = notes.times[lo:hi][hit], notes.x[lo:hi][hit], notes.y[lo:hi][hit]
+        # Existing notes on a time something moved onto
+        existing = np.flatnonzero(np.isin(other_times, times[hit]))
+        existing = np.where(existing < lo, existing, existing + (hi - lo))
+        self.remove = np.arange(lo, hi, dtype=np.int64)
+        if collisions == REPLACE:
+            self.remove = np.concatenate((self.remove, existing))
+            existing = existing[:0]
+        # Exact duplicates of the notes that stay (or of each other) would just be stacked on top, so drop them
+        repeated = duplicates(np.concatenate((notes.times[existing], times)),
+                              np.concatenate((notes.x[existing], x)),
+                              np.concatenate((notes.y[existing], y)))[existing.shape[0]:]
+        self.dropped = int(np.count_nonzero(repeated))
+        order = np.argsort(times[~repeated], kind="stable")
+        self.times, self.x, self.y = times[~repeated][order], x[~repeated][order], y[~repeated][order]
+
+    def stale(self, notes):
+        return notes is not self.notes or notes.version != self.version
+
+    def between(self, start, end):
+        """Rows of the preview with start <= time < end."""
+        return np.searchsorted(self.times, (start, end), "left")
+
+    def apply(self):
+        assert not self.stale(self.notes), "The notes changed since this was worked out!"
+        self.notes.remove_rows(self.remove)
+        self.notes.extend(self.times, self.x, self.y)
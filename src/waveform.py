@@ -0,0 +1,79 @@
+import threading
+
+import numpy as np
+
+BUCKET_FRAMES = 64  # Frames per bucket on the finest level
+
+
+class WaveformPeaks:
+    """
+    Min/max peak pyramid of an AudioSegment, for drawing the waveform at any zoom.
+    Level n holds the peaks of BUCKET_FRAMES * 2**n frames per bucket, per channel.
+    Building happens on a background thread, check `ready` before querying.
+    """
+
+    def __init__(self, audio, background=True):
+        self.audio = audio
+        self.frame_rate = audio.frame_rate
+        self.channels = audio.channels
+        self.levels = []
+        self.extent = 0
+        self.ready = False
+        self._thread = None
+        if background:
+            self._thread = threading.Thread(target=self._build, daemon=True)
+            self._thread.start()
+        else:
+            self._build()
+
+    def _build(self):
+        if self.audio.sample_width == 2:
+            # Straight from the buffer, no copy
+            samples = np.frombuffer(self.audio.raw_data, dtype="<i2")
+        else:
+            samples = np.asarray(self.audio.get_array_of_samples())
+        samples = samples[:samples.shape[0] - samples.shape[0] % self.channels].reshape(-1, self.channels)
+        buckets = -(-samples.shape[0] // BUCKET_FRAMES)
+        levels = []
+        if buckets:
+            # Pad the last bucket with its own last frame so it doesn't fake a peak at 0
+            padded = np.empty((buckets * BUCKET_FRAMES, self.channels), dtype=samples.dtype)
+            padded[:samples.shape[0]] = samples
+            padded[samples.shape[0]:] = samples[-1]
+            padded = padded.reshape(buckets, BUCKET_FRAMES, self.channels)
+            mins, maxs = padded.min(axis=1), padded.max(axis=1)
+            levels.append((mins, maxs))
+            while mins.shape[0] > 1:
+                if mins.shape[0] % 2:
+                    mins, maxs = np.append(mins, mins[-1:], axis=0), np.append(maxs, maxs[-1:], axis=0)
+                mins = np.minimum(mins[0::2], mins[1::2])
+                maxs = np.maximum(maxs[0::2], maxs[1::2])
+                levels.append((mins, maxs))
+            self.extent = max(abs(int(levels[-1][0].min())), abs(int(levels[-1][1].max())))
+        self.levels = levels
+        self.ready = True
+
+    def wait(self):
+        if self._thread is not None:
+            self._thread.join()
+
+    def peaks(self, start, end, columns):
+        """
+        Min and max of every channel for `columns` equal slices of the frames [start, end).
+        Returns (mins, maxs, valid), where valid is False for columns past the end of the audio.
+        """
+        if not self.ready or not self.levels or columns <= 0 or end <= start:
+            empty = np.zeros(max(columns, 0), dtype=np.int64)
+            return empty, empty, empty.astype(bool)
+        per_column = (end - start) / columns
+        level = int(np.clip(np.floor(np.log2(max(per_column / BUCKET_FRAMES, 1))), 0, len(self.levels) - 1))
+        size = BUCKET_FRAMES * (2 ** level)
+        mins, maxs = self.levels[level]
+        edges = np.floor((start + np.arange(columns + 1) * per_column) / size).astype(np.int64)
+        valid = (edges[:-1] >= 0) & (edges[:-1] < mins.shape[0])
+        # Cut at the last edge so the final column doesn't reduce to the end of the audio
+        stop = int(np.clip(edges[-1], 1, mins.shape[0]))
+        starts = np.clip(edges[:-1], 0, stop - 1)
+        col_mins = np.minimum.reduceat(mins[:stop], starts, axis=0).min(axis=1)
+        col_maxs = np.maximum.reduceat(maxs[:stop], starts, axis=0).max(axis=1)
+        return col_mins.astype(np.int64), col_maxs.astype(np.int64), valid
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from src.beatgrid import BEAT, MEASURE, SUBDIVISION, BeatGrid, timeline_grid
+
+TIMING = (173, -250, 0.62, (7, 8), 3)
+
+
+def test_kinds():
+    grid = BeatGrid(120, 0, 0.5, (4, 4), 2, 0, 2000)
+    assert grid.times.tolist() == [250, 500, 750, 1000, 1250, 1500, 1750, 2000]
+    assert grid.kinds.tolist() == [SUBDIVISION, BEAT] * 3 + [SUBDIVISION, MEASURE]
+
+
+@pytest.mark.parametrize("start, end", [(0, 1000), (5000, 9000.5), (-3000, 400), (150000, 160000)])
+def test_ranges_match_the_whole_grid(start, end):
+    whole = BeatGrid(*TIMING, -10000, 200000)
+    part = BeatGrid(*TIMING, start, end)
+    for a, b in zip(whole.between(start, end), part.between(start, end)):
+        assert np.array_equal(a, b)
+    assert part.times[0] >= start and part.times[-1] <= end
+
+
+def test_far_ranges_keep_every_subdivision():
+    grid = BeatGrid(240, 0, 0.5, (4, 4), 64, 3_600_000 * 10, 3_600_000 * 10 + 1000)
+    assert len(grid) == 4 * 64 + 1  # Both ends included
+
+
+def test_timeline_thinning():
+    assert SUBDIVISION in timeline_grid(*TIMING, 10000).kinds
+    long = timeline_grid(*TIMING, 600000)
+    full = BeatGrid(*TIMING, 0, 600000)
+    assert set(long.kinds.tolist()) == {MEASURE}
+    assert np.array_equal(long.times, full.times[full.kinds == MEASURE])
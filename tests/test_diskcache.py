@@ -0,0 +1,51 @@
+import os
+
+import numpy as np
+from pydub import AudioSegment
+
+from src.diskcache import PCMDiskCache
+
+
+def segment(frames=1000, frame_rate=22050):
+    samples = (np.arange(frames * 2) % 2000 - 1000).astype("<i2")
+    return AudioSegment(data=samples.tobytes(), sample_width=2, frame_rate=frame_rate, channels=2)
+
+
+def test_round_trip(tmp_path):
+    cache = PCMDiskCache(tmp_path)
+    assert cache.load("abc") is None
+    original = segment()
+    cache.store("abc", original)
+    loaded = cache.load("abc")
+    assert (loaded.frame_rate, loaded.channels, loaded.sample_width) == (22050, 2, 2)
+    assert loaded.raw_data == original.raw_data
+
+
+def test_loaded_segments_work_like_any_other(tmp_path):
+    cache = PCMDiskCache(tmp_path)
+    original = segment()
+    cache.store("abc", original)
+    loaded = cache.load("abc")
+    assert loaded.get_array_of_samples() == original.get_array_of_samples()
+    assert (loaded + loaded).raw_data == (original + original).raw_data
+    assert loaded.overlay(original).raw_data == original.overlay(original).raw_data
+    assert loaded.fade_in(10).raw_data == original.fade_in(10).raw_data
+
+
+def test_corrupt_files_are_a_miss(tmp_path):
+    cache = PCMDiskCache(tmp_path)
+    cache.store("abc", segment())
+    path = next(tmp_path.glob("abc-*.npy"))
+    path.write_bytes(path.read_bytes()[:200])
+    assert cache.load("abc") is None
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = PCMDiskCache(tmp_path, budget=10000)
+    cache.store("old", segment())
+    cache.store("new", segment())  # 4000 bytes of samples each, a third doesn't fit
+    for age, name in enumerate(("new", "old"), 1):
+        os.utime(next(tmp_path.glob(f"{name}-*.npy")), (1000 - age, 1000 - age))
+    cache.load("old")
+    cache.store("newest", segment())
+    assert sorted(path.name.split("-")[0] for path in tmp_path.glob("*.npy")) == ["newest", "old"]
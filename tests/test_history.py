@@ -0,0 +1,133 @@
+import numpy as np
+
+from src.history import COALESCE_SECONDS, History
+from src.notes import NoteStore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def setup(*args):
+    clock = Clock()
+    history = History(clock=clock)
+    notes = NoteStore(*args)
+    notes.edits = []
+    return notes, history, clock
+
+
+def record(notes, history):
+    edits, notes.edits = notes.edits, []
+    history.record(notes, edits)
+
+
+def undo(notes, history, redo=False):
+    done = history.redo() if redo else history.undo()
+    notes.edits = []  # What the editor does, undoing isn't a step itself
+    return done
+
+
+def state(notes):
+    return notes.times.tolist(), notes.x.tolist(), notes.y.tolist(), sorted(notes.ids.tolist())
+
+
+def test_undo_redo_add_remove():
+    notes, history, clock = setup([100, 200, 300], [0, 1, 2], [0, 1, 2])
+    start = state(notes)
+    notes.add(150, 1, 1)
+    record(notes, history)
+    added = state(notes)
+    clock.now += 1
+    notes.remove_range(200, 300)
+    record(notes, history)
+    end = state(notes)
+    assert undo(notes, history)
+    assert state(notes) == added  # Ids and all
+    assert undo(notes, history)
+    assert state(notes) == start
+    assert not undo(notes, history)
+    assert undo(notes, history, redo=True) and undo(notes, history, redo=True)
+    assert state(notes) == end
+    assert not history.can_redo
+
+
+def test_undo_shift():
+    notes, history, clock = setup([100, 200], [0, 1], [0, 1])
+    notes.shift(-50)
+    record(notes, history)
+    assert notes.times.tolist() == [50, 150]
+    undo(notes, history)
+    assert notes.times.tolist() == [100, 200]
+    undo(notes, history, redo=True)
+    assert notes.times.tolist() == [50, 150]
+
+
+def test_notes_added_after_a_shift_undo_in_order():
+    notes, history, clock = setup([100], [0], [0])
+    notes.shift(1000)
+    record(notes, history)
+    clock.now += 1
+    notes.add(500, 1, 1)
+    record(notes, history)
+    undo(notes, history)
+    undo(notes, history)
+    assert state(notes)[:3] == ([100], [0], [0])
+
+
+def test_coalescing():
+    notes, history, clock = setup()
+    for i in range(3):  # Quick clicks become one step
+        notes.add(i * 100, 0, 0)
+        record(notes, history)
+        clock.now += COALESCE_SECONDS / 2
+    clock.now += COALESCE_SECONDS * 2
+    notes.add(1000, 0, 0)  # Too late to join
+    record(notes, history)
+    notes.remove_rows([0])  # Different kind of edit
+    record(notes, history)
+    assert len(history.undo_steps) == 3
+    undo(notes, history)
+    undo(notes, history)
+    assert notes.times.tolist() == [0, 100, 200]
+    undo(notes, history)
+    assert len(notes) == 0
+
+
+def test_undo_seals_the_step():
+    notes, history, clock = setup()
+    notes.add(0, 0, 0)
+    record(notes, history)
+    undo(notes, history)
+    notes.add(100, 0, 0)  # Right away, but after an undo it's a new step
+    record(notes, history)
+    assert len(history.undo_steps) == 1 and not history.can_redo
+
+
+def test_memory_limit_drops_oldest():
+    notes, history, clock = setup()
+    history.limit = 1000
+    for i in range(5):
+        clock.now += 1
+        notes.extend(np.arange(10) + i * 100, 0, 0)  # 10 notes, 200 bytes a step
+        record(notes, history)
+    assert history.size == 1000 and len(history.undo_steps) == 5
+    clock.now += 1
+    notes.add(5000, 0, 0)
+    record(notes, history)
+    assert history.size <= 1000 and len(history.undo_steps) == 5
+    history.limit = 250
+    history.trim()
+    assert len(history.undo_steps) == 2
+
+
+def test_new_notes_start_over():
+    notes, history, clock = setup([100], [0], [0])
+    notes.add(200, 0, 0)
+    record(notes, history)
+    other = NoteStore()
+    history.record(other, [])
+    assert not history.can_undo
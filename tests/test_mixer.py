@@ -0,0 +1,78 @@
+import wave
+
+import numpy as np
+import pytest
+
+from src.mixer import Mixer, WaveOutput
+
+RATE = 44100
+
+
+def write_click(path, length=64, level=10000):
+    """A .wav that's `level` on its first frame and silent after, so it's easy to find in a mix."""
+    frames = np.zeros((length, 2), dtype="<i2")
+    frames[0] = level
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(2)
+        f.setsampwidth(2)
+        f.setframerate(RATE)
+        f.writeframes(frames.tobytes())
+
+
+def render(tmp_path, mixer, seconds):
+    out = WaveOutput(mixer, str(tmp_path / "out.wav"))
+    out.render(seconds)
+    out.close()
+    with wave.open(str(tmp_path / "out.wav"), "rb") as f:
+        assert (f.getnchannels(), f.getsampwidth(), f.getframerate()) == (2, 2, RATE)
+        return np.frombuffer(f.readframes(f.getnframes()), dtype="<i2").reshape(-1, 2)
+
+
+def clicks(frames):
+    return np.flatnonzero(frames[:, 0]).tolist()
+
+
+@pytest.fixture
+def mixer(tmp_path):
+    write_click(tmp_path / "click.wav")
+    mixer = Mixer(RATE)
+    mixer.add_sound(tmp_path / "click.wav")
+    return mixer
+
+
+def test_hitsounds_land_on_their_sample(tmp_path, mixer):
+    mixer.schedule("hitsounds", [100, 250, 333])
+    mixer.play(None, 0, 0)
+    found = clicks(render(tmp_path, mixer, 0.4))
+    assert len(found) == 3
+    for frame, ms in zip(found, (100, 250, 333)):
+        assert abs(frame - ms * RATE / 1000) <= 1
+
+
+def test_hitsounds_play_backwards(tmp_path, mixer):
+    mixer.schedule("hitsounds", [100, 250])
+    mixer.play(None, 0, 400, speed=-1.0)
+    found = clicks(render(tmp_path, mixer, 0.4))
+    assert len(found) == 2  # Each one exactly once
+    for frame, ms in zip(found, (250, 100)):
+        assert abs(frame - (400 - ms) * RATE / 1000) <= 1
+
+
+def test_nothing_before_the_start(tmp_path, mixer):
+    mixer.schedule("hitsounds", [50, 150])
+    mixer.play(None, 0, 100)
+    found = clicks(render(tmp_path, mixer, 0.2))
+    assert len(found) == 1 and abs(found[0] - 50 * RATE / 1000) <= 1
+
+
+@pytest.mark.parametrize("pan", [-1.0, -0.5, 0.0, 0.25, 1.0])
+def test_pan_matches_pydub(tmp_path, pan):
+    pydub = pytest.importorskip("pydub")
+    samples = (np.sin(np.arange(256) / 8) * 8000).astype("<i2")
+    segment = pydub.AudioSegment(np.repeat(samples, 2).tobytes(), sample_width=2, frame_rate=RATE, channels=2)
+    mixer = Mixer(RATE)
+    mixer.schedule("hitsounds", [0], mixer.add_sound(segment), pan)
+    mixer.play(None, 0, 0)
+    mixed = render(tmp_path, mixer, 0.01)[:256].astype(np.int32)
+    expected = np.frombuffer(segment.pan(pan).raw_data, dtype="<i2").reshape(-1, 2).astype(np.int32)
+    assert np.abs(mixed - expected).max() <= 1
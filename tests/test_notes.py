@@ -0,0 +1,95 @@
+import numpy as np
+
+from src.notes import NoteStore
+
+
+def columns(notes):
+    return notes.times.tolist(), notes.x.tolist(), notes.y.tolist()
+
+
+def test_sorted_and_stable():
+    notes = NoteStore([300, 100, 200, 100], [0, 1, 2, 0], [0, 0, 0, 2])
+    assert columns(notes) == ([100, 100, 200, 300], [1, 0, 2, 0], [0, 2, 0, 0])
+    notes.add(100, 2, 2)  # Goes after the notes already at that time
+    assert notes.positions(*notes.at(100)).tolist() == [[1, 0], [0, 2], [2, 2]]
+
+
+def test_duplicates_at_the_same_time():
+    notes = NoteStore()
+    first = notes.add(500, 1, 1)
+    second = notes.add(500, 1, 1)
+    assert first != second
+    assert notes.at(500) == (0, 2)
+    assert notes.unique_times().tolist() == [500]
+    notes.remove_rows(notes.rows_of([first]))
+    assert notes.ids.tolist() == [second] and columns(notes) == ([500], [1], [1])
+
+
+def test_find_duplicates_get_different_rows():
+    notes = NoteStore([10, 10, 10, 20], [1, 1, 2, 1], [1, 1, 2, 1])
+    rows = notes.find([10, 10, 10], [1, 1, 1], [1, 1, 1])
+    assert rows.tolist() == [0, 1, -1]
+
+
+def test_find_compares_bits():
+    notes = NoteStore([10, 10, 10], [-0.0, 0.0, np.nan], [0, 0, 0])
+    assert notes.find([10], [0.0], [0]).tolist() == [1]
+    assert notes.find([10], [-0.0], [0]).tolist() == [0]
+    assert notes.find([10], [np.nan], [0]).tolist() == [2]
+    assert notes.find([11], [0.0], [0]).tolist() == [-1]
+    assert NoteStore().find([10], [0], [0]).tolist() == [-1]
+
+
+def test_rows_of_window():
+    notes = NoteStore([100, 200, 300], [0, 1, 2], [0, 1, 2])
+    ids = notes.ids.tolist()
+    assert notes.rows_of(ids).tolist() == [0, 1, 2]
+    assert notes.rows_of([ids[2]], [300]).tolist() == [2]
+    assert notes.rows_of([ids[2]], [100]).tolist() == [-1]  # Only the notes at 100 get searched
+    assert notes.rows_of([ids[1]], [150]).tolist() == [-1]  # Nothing there at all
+    assert notes.rows_of([12345]).tolist() == [-1]
+    assert NoteStore().rows_of([0]).tolist() == [-1]
+
+
+def test_extend_with_ids_round_trip():
+    notes = NoteStore(np.arange(0, 1000, 10), np.zeros(100), np.ones(100))
+    before = columns(notes), notes.ids.tolist()
+    removed = notes.remove_range(200, 500)
+    assert len(notes) == 69
+    notes.extend(*removed)
+    assert (columns(notes), notes.ids.tolist()) == before
+    new = notes.add(5, 0, 0)
+    assert new not in before[1]  # Restored ids don't get handed out again
+
+
+def test_extend_returns_ids_in_argument_order():
+    notes = NoteStore([100], [0], [0])
+    ids = notes.extend([300, 50, 200], [1, 2, 3], [0, 0, 0])
+    assert notes.x[notes.rows_of(ids)].tolist() == [1, 2, 3]
+
+
+def test_remove_rows_dedupes():
+    notes = NoteStore([0, 1, 2, 3], [0, 0, 0, 0], [0, 0, 0, 0])
+    removed = notes.remove_rows([2, 1, 2])
+    assert removed[0].tolist() == [1, 2] and notes.times.tolist() == [0, 3]
+
+
+def test_edits_log():
+    notes = NoteStore([100, 200], [0, 1], [0, 1])
+    notes.add(150, 2, 2)  # Not recorded until something asks for it
+    notes.edits = []
+    added = notes.add(50, 1, 0)
+    notes.extend([400, 300], [0, 1], [2, 2])
+    notes.remove_range(100, 150)
+    notes.remove_rows([0])
+    notes.shift(-10)
+    kinds = [edit[0] for edit in notes.edits]
+    assert kinds == ["add", "add", "remove", "remove", "shift"]
+    assert notes.edits[0][1].tolist() == [50] and notes.edits[0][4].tolist() == [added]
+    assert notes.edits[1][1].tolist() == [300, 400]  # Sorted, with the x/y that went with each time
+    assert notes.edits[1][2].tolist() == [1, 0]
+    assert notes.edits[2][1].tolist() == [100, 150] and notes.edits[2][2].tolist() == [0, 2]
+    assert notes.edits[3][1].tolist() == [50]
+    assert notes.edits[4] == ("shift", -10)
+    assert notes.copy().edits is None
+    assert columns(notes) == ([190, 290, 390], [1, 1, 0], [1, 2, 2])
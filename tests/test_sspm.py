@@ -0,0 +1,70 @@
+import struct
+from io import BytesIO
+
+import numpy as np
+
+from src.level import NOTE_MARKER, SSPMLevel, read_sspmv2_markers, write_sspmv2_markers
+from src.notes import NoteStore
+
+METADATA = (120, 0, (4, 4), 0.5)
+# Every field type but arrays
+MARKER_TYPES = {"ssp_note": [0x7], "flag": [0x1], "everything": [0x1, 0x2, 0x3, 0x4, 0x5, 0x6, 0x8, 0x9, 0xa, 0xb]}
+EVERYTHING = [255, 65535, 2 ** 32 - 1, 2 ** 64 - 1, 0.5, 1 / 3, b"\x00\x01", "héllo", b"long", "long string"]
+
+
+def level(notes, markers):
+    return SSPMLevel("Round Trip", ["tests"], notes, None, None, 1, marker_types=MARKER_TYPES, markers=markers)
+
+
+def test_round_trip_with_custom_markers(tmp_path):
+    notes = NoteStore([0, 100, 100, 250, 400], [0, 1, 2, 0.5, 1.25], [0, 1, 2, 1.75, 0])
+    markers = [
+        {"time": 100, "m_type": 1, "fields": [1]},  # Same time as two notes
+        {"time": 50, "m_type": 2, "fields": EVERYTHING},
+        {"time": 100, "m_type": 1, "fields": [2]},  # Same time as a marker too
+        {"time": 900, "m_type": 1, "fields": [3]},  # After the last note
+    ]
+    level(notes, markers).save(tmp_path / "map.sspm", *METADATA)
+    loaded, metadata = SSPMLevel.load(tmp_path / "map.sspm")
+    assert loaded.notes.times.tolist() == notes.times.tolist()
+    assert loaded.notes.x.tolist() == notes.x.tolist() and loaded.notes.y.tolist() == notes.y.tolist()
+    assert loaded.marker_types == MARKER_TYPES
+    assert loaded.markers == sorted(markers, key=lambda marker: marker["time"])
+    assert metadata[0] == 120 and tuple(metadata[2]) == (4, 4)
+
+
+def test_markers_go_before_notes_at_the_same_time():
+    notes = NoteStore([100, 100, 200], [1, 1, 1], [1, 1, 1])
+    with BytesIO() as output:
+        write_sspmv2_markers(output, notes, [{"time": 100, "m_type": 1, "fields": [7]}], MARKER_TYPES)
+        data = output.getvalue()
+    assert data[:6] == (100).to_bytes(4, "little") + bytes((1, 7))
+    records = np.frombuffer(data, dtype=NOTE_MARKER, offset=6)
+    assert records["time"].tolist() == [100, 100, 200] and not records["m_type"].any()
+
+
+def test_read_mixed_block():
+    # Quantum notes, a note with an integer position and a custom marker, in the order a file could have them
+    quantum = np.zeros(3, dtype=NOTE_MARKER)
+    quantum["time"], quantum["quantum"], quantum["x"], quantum["y"] = (10, 20, 30), 1, (0, 1, 2), (2, 1, 0)
+    data = (quantum[:2].tobytes()
+            + struct.pack("<IBBBB", 20, 0, 0, 2, 1)  # Integer position note
+            + struct.pack("<IBB", 25, 1, 9)  # A flag marker between notes
+            + quantum[2:].tobytes())
+    times, xs, ys, markers = read_sspmv2_markers(data, 5, MARKER_TYPES)
+    assert times.tolist() == [10, 20, 20, 30]
+    assert xs.tolist() == [0, 1, 2, 2] and ys.tolist() == [2, 1, 1, 0]
+    assert markers == [{"time": 25, "m_type": 1, "fields": [9]}]
+
+
+def test_many_notes_between_markers(tmp_path):
+    # Long runs go through the bulk path, the markers in between through the slow one
+    rng = np.random.default_rng(0)
+    times = np.sort(rng.integers(0, 100_000, 5000))
+    notes = NoteStore(times, rng.random(5000) * 2, rng.random(5000) * 2)
+    markers = [{"time": int(time), "m_type": 1, "fields": [i % 256]} for i, time in enumerate(times[::7].tolist())]
+    level(notes, markers).save(tmp_path / "map.sspm", *METADATA)
+    loaded, _ = SSPMLevel.load(tmp_path / "map.sspm")
+    assert np.array_equal(loaded.notes.times, notes.times)
+    assert np.array_equal(loaded.notes.x, notes.x) and np.array_equal(loaded.notes.y, notes.y)
+    assert loaded.markers == markers
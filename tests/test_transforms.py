@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+
+from src.notes import NoteStore
+from src.transforms import KEEP_BOTH, LEAVE, REPLACE, BulkEdit, NoteTransform, duplicates, grid_ticks, quantize
+
+
+def transform(**settings):
+    result = NoteTransform()
+    for name, value in settings.items():
+        setattr(result, name, value)
+    return result
+
+
+def columns(notes):
+    return notes.times.tolist(), notes.x.tolist(), notes.y.tolist()
+
+
+@pytest.fixture
+def notes():
+    # The note at 300 lands on the chord at 1000 when shifted by 700
+    return NoteStore([0, 100, 300, 1000, 1000], [0, 1, 0, 2, 1], [0, 0, 1, 2, 1])
+
+
+def test_keep_both(notes):
+    edit = BulkEdit(notes, 300, 300, transform(shift=700), KEEP_BOTH)
+    assert (edit.count, edit.collisions, edit.dropped) == (1, 1, 0)
+    edit.apply()
+    assert columns(notes) == ([0, 100, 1000, 1000, 1000], [0, 1, 2, 1, 0], [0, 0, 2, 1, 1])
+
+
+def test_keep_both_drops_exact_duplicates(notes):
+    edit = BulkEdit(notes, 300, 300, transform(shift=700, mirror_x=True, mirror_y=True), KEEP_BOTH)
+    assert (edit.collisions, edit.dropped) == (1, 0)  # (2, 1) isn't on the chord
+    notes.add(300, 1, 1)
+    edit = BulkEdit(notes, 300, 300, transform(shift=700), KEEP_BOTH)  # (1, 1) is
+    assert (edit.count, edit.collisions, edit.dropped) == (2, 2, 1)
+    edit.apply()
+    assert columns(notes) == ([0, 100, 1000, 1000, 1000], [0, 1, 2, 1, 0], [0, 0, 2, 1, 1])
+
+
+def test_replace(notes):
+    edit = BulkEdit(notes, 300, 300, transform(shift=700), REPLACE)
+    edit.apply()
+    assert columns(notes) == ([0, 100, 1000], [0, 1, 0], [0, 0, 1])
+
+
+def test_leave_in_place(notes):
+    edit = BulkEdit(notes, 0, 300, transform(shift=700), LEAVE)
+    assert edit.collisions == 1
+    edit.apply()
+    assert columns(notes) == ([300, 700, 800, 1000, 1000], [0, 0, 1, 2, 1], [1, 0, 0, 2, 1])
+
+
+def test_collapsing_onto_each_other():
+    notes = NoteStore([0, 10, 20, 30], [1, 1, 1, 2], [1, 1, 1, 2])
+    edit = BulkEdit(notes, 0, 30, transform(scale=0.01))
+    assert (edit.collisions, edit.dropped) == (0, 2)
+    edit.apply()
+    assert columns(notes) == ([0, 0], [1, 2], [1, 2])
+
+
+def test_apply_is_one_remove_and_one_add(notes):
+    notes.edits = []
+    BulkEdit(notes, 0, 300, transform(shift=5)).apply()
+    assert [edit[0] for edit in notes.edits] == ["remove", "add"]
+
+
+def test_stale(notes):
+    edit = BulkEdit(notes, 0, 300, transform(shift=5))
+    notes.add(50, 0, 0)
+    assert edit.stale(notes)
+    with pytest.raises(AssertionError):
+        edit.apply()
+
+
+@pytest.mark.parametrize("rotation, expected", [(90, (1, 2)), (180, (0, 1)), (270, (1, 0)), (-90, (1, 0)),
+                                                (360, (2, 1))])
+def test_right_angles_are_exact(rotation, expected):
+    _, x, y = transform(rotation=rotation).apply([0], [2], [1])
+    assert (x[0], y[0]) == expected
+
+
+def test_scale_around_the_start():
+    times, _, _ = transform(scale=2, shift=10).apply([100, 150, 300], [1] * 3, [1] * 3, pivot=100)
+    assert times.tolist() == [110, 210, 510]
+
+
+def test_quantize():
+    grid = grid_ticks(120, 0, 0.5, (4, 4), 4, 0, 2000)  # A tick every 125ms
+    assert grid[:3].tolist() == [0, 125, 250]
+    assert quantize([60, 70, 1900], grid).tolist() == [0, 125, 1875]
+    times, _, _ = transform(quantize=True).apply([60, 70, 190], [1] * 3, [1] * 3, grid=grid)
+    assert times.tolist() == [0, 125, 250]
+
+
+def test_duplicates_keeps_the_first():
+    times = np.array([5, 5, 5, 6], dtype=np.int32)
+    xy = np.array([1, 1, 2, 1], dtype=np.float32)
+    assert duplicates(times, xy, xy).tolist() == [False, True, False, False]
+
+
+def test_quantize_far_from_the_start():
+    # Only the range around the notes gets built, and it's the same ticks the whole grid would have
+    grid = grid_ticks(200, 50, 0.5, (4, 4), 16, 3_000_000, 3_001_000)
+    whole = grid_ticks(200, 50, 0.5, (4, 4), 16, 0, 3_001_000)
+    times = [3_000_100, 3_000_517]
+    assert grid[0] == 50 and grid.shape[0] < 100
+    assert quantize(times, grid).tolist() == quantize(times, whole).tolist()